@@ -0,0 +1,259 @@
+import argparse
+import math
+import random
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+from sqlalchemy import insert
+from auth import get_password_hash
+from database.daily_stats import backfill_daily_stats
+from database.database_app import sync_engine
+from database.status_tracking import repair_status_fields
+from models import (
+    Address, Loading, LoadingPlace, LoadingStatusLog, LogEntry, RoutePlan, RoutePoint, RoutePointStatusEnum,
+    RoutePointStatusLog, StatusEnum, Store, User, Vehicle
+)
+
+# Синтетические данные для замеров: водители с машинами, маршрут на каждый день,
+# погрузка на складе, точки со статусами и GPS-трек машины.
+# Время и координаты правдоподобные: магазины вокруг центра города, время в пути — по расстоянию
+# и скорости, время на точке — около 15 минут; сегодняшний маршрут выполнен только до текущего момента.
+# Пишет в базу из database/db_settings.py — запускать только на тестовой базе.
+# python -m benchmarks.generate --drivers 50 --days 90 --points 20 --transitions 4 --log-interval 2
+
+CHUNK_SIZE = 5000
+
+CITY_CENTER = (53.348, 83.776)
+CITY_RADIUS_KM = 12
+# Смещение местного времени от UTC: рабочий день водителя начинается утром по местному времени
+LOCAL_OFFSET = timedelta(hours=7)
+
+SKIP_SHARE = 0.05
+SPEED_KMH = (20, 35)
+SERVICE_MINUTES = (15, 7)  # среднее и разброс
+
+
+def _distance_km(a: tuple, b: tuple) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h))
+
+
+def _random_place(rnd: random.Random, radius_km: float = CITY_RADIUS_KM) -> tuple:
+    distance = radius_km * math.sqrt(rnd.random())
+    angle = rnd.random() * 2 * math.pi
+    lat = CITY_CENTER[0] + distance / 111.0 * math.cos(angle)
+    lon = CITY_CENTER[1] + distance / (111.0 * math.cos(math.radians(CITY_CENTER[0]))) * math.sin(angle)
+    return lat, lon
+
+
+def _insert(conn, model, rows: list[dict]):
+    for i in range(0, len(rows), CHUNK_SIZE):
+        conn.execute(insert(model), rows[i:i + CHUNK_SIZE])
+
+
+class _Batch:
+    """Строки одного водителя; вставляются в порядке зависимостей и очищаются."""
+
+    MODELS = (RoutePlan, Loading, LoadingStatusLog, RoutePoint, RoutePointStatusLog, LogEntry)
+
+    def __init__(self):
+        self.rows = {model: [] for model in self.MODELS}
+
+    def add(self, model, **values):
+        self.rows[model].append(values)
+        return values
+
+    def flush(self, conn) -> dict:
+        counts = {}
+        for model in self.MODELS:
+            _insert(conn, model, self.rows[model])
+            counts[model.__tablename__] = len(self.rows[model])
+            self.rows[model] = []
+        return counts
+
+
+class _Track:
+    """GPS-трек машины: точки каждые interval минут вдоль отрезков между остановками."""
+
+    def __init__(self, batch: _Batch, vehicle_id, interval: int, rnd: random.Random, now: datetime):
+        self.batch, self.vehicle_id, self.rnd, self.now = batch, vehicle_id, rnd, now
+        self.step = timedelta(minutes=interval) if interval else None
+        self.next_at = None
+
+    def segment(self, start: datetime, end: datetime, origin: tuple, target: tuple, status: StatusEnum):
+        if not self.step or end <= start:
+            return
+        if self.next_at is None or self.next_at < start:
+            self.next_at = start
+        while self.next_at < end and self.next_at <= self.now:
+            share = (self.next_at - start) / (end - start)
+            self.batch.add(
+                LogEntry,
+                id=uuid.uuid4(),
+                vehicle_id=self.vehicle_id,
+                status=status,
+                latitude=origin[0] + (target[0] - origin[0]) * share + self.rnd.gauss(0, 0.00005),
+                longitude=origin[1] + (target[1] - origin[1]) * share + self.rnd.gauss(0, 0.00005),
+                timestamp=self.next_at,
+            )
+            self.next_at += self.step
+
+
+def _status_chain(transitions: int, skipped: bool) -> list:
+    """Цепочка статусов точки; лишние переходы — повторные en_route/arrived (машину переставляли)."""
+    if skipped:
+        return [RoutePointStatusEnum.en_route, RoutePointStatusEnum.skipped]
+    extra = max(0, transitions - 3)
+    toggles = [RoutePointStatusEnum.en_route, RoutePointStatusEnum.arrived] * (extra // 2 + 1)
+    return [RoutePointStatusEnum.en_route, RoutePointStatusEnum.arrived, *toggles[:extra], RoutePointStatusEnum.completed]
+
+
+def _route(batch: _Batch, track: _Track, rnd: random.Random, route_day: date, vehicle_id, depot: dict,
+           stores: list, points: int, transitions: int, now: datetime, tag: str):
+    plan_id = uuid.uuid4()
+    batch.add(RoutePlan, id=plan_id, vehicle_id=vehicle_id, date=datetime.combine(route_day, time(), timezone.utc))
+
+    def log(model, owner_key, owner_id, status, moment, place):
+        if moment <= now:
+            batch.add(model, **({"id": uuid.uuid4()} if model is RoutePointStatusLog else {}),
+                      **{owner_key: owner_id}, status=status, timestamp=moment, latitude=place[0], longitude=place[1])
+        return moment <= now
+
+    # Погрузка на складе
+    moment = datetime.combine(route_day, time(8), timezone.utc) - LOCAL_OFFSET + timedelta(minutes=rnd.randint(0, 90))
+    loading_start = moment + timedelta(minutes=rnd.randint(5, 15))
+    loading_end = loading_start + timedelta(minutes=rnd.randint(20, 40))
+    loading_id = uuid.uuid4()
+    batch.add(
+        Loading,
+        id=loading_id,
+        route_plan_id=plan_id,
+        loading_place_id=depot["id"],
+        doc_number=f"{tag}-L",
+        volume=round(rnd.uniform(5, 20), 1),
+        weight=round(rnd.uniform(300, 1500)),
+        start_time=loading_start if loading_start <= now else None,
+        end_time=loading_end if loading_end <= now else None,
+    )
+    depot_place = (depot["latitude"], depot["longitude"])
+    for status, at in ((RoutePointStatusEnum.arrived, moment), (RoutePointStatusEnum.loading, loading_start),
+                       (RoutePointStatusEnum.loading_completed, loading_end)):
+        log(LoadingStatusLog, "loading_id", loading_id, status, at, depot_place)
+    track.segment(moment, loading_end, depot_place, depot_place, StatusEnum.loading)
+
+    position, moment = depot_place, loading_end
+    for k, store in enumerate(rnd.sample(stores, min(points, len(stores)))):
+        place = (store["latitude"], store["longitude"])
+        travel = timedelta(minutes=_distance_km(position, place) / rnd.uniform(*SPEED_KMH) * 60 + rnd.uniform(2, 6))
+        service = timedelta(minutes=round(min(60, max(3, rnd.gauss(*SERVICE_MINUTES)))))
+        skipped = rnd.random() < SKIP_SHARE
+
+        point = batch.add(
+            RoutePoint,
+            id=uuid.uuid4(),
+            route_plan_id=plan_id,
+            order=k + 1,
+            doc=f"{tag}-{k + 1}",
+            payment=float(rnd.randint(5, 50) * 100),
+            counterparty=store["name_1c"],
+            address_id=store["address_id"],
+            store_id=store["id"],
+            latitude=place[0],
+            longitude=place[1],
+            status=RoutePointStatusEnum.planned,
+            arrival_time=None,
+            departure_time=None,
+            duration_minutes=None,
+        )
+
+        arrival, departure = moment + travel, moment + travel + service
+        chain = _status_chain(transitions, skipped)
+        # en_route — при выезде, arrived/повторы — на точке, финальный статус — при убытии
+        stamps = [moment] + [arrival + service * i / max(1, len(chain) - 2) for i in range(len(chain) - 2)] + [departure]
+        if skipped:
+            stamps = [moment, arrival]
+        for status, at in zip(chain, stamps):
+            if log(RoutePointStatusLog, "point_id", point["id"], status, at, place):
+                point["status"] = status
+
+        if not skipped and arrival <= now:
+            point["arrival_time"] = arrival
+            if departure <= now:
+                point["departure_time"] = departure
+                point["duration_minutes"] = int(service.total_seconds() // 60)
+
+        track.segment(moment, arrival, position, place, StatusEnum.in_transit)
+        if not skipped:
+            track.segment(arrival, departure, place, place, StatusEnum.delivered)
+        position, moment = place, (arrival if skipped else departure)
+
+
+def generate(drivers: int, days: int, points: int, stores: int, transitions: int = 3, log_interval: int = 5,
+             loading_places: int = 3, seed: int = 1):
+    rnd = random.Random(seed)
+    run = uuid.uuid4().hex[:8]
+    today = date.today()
+    now = datetime.now(timezone.utc)
+    password = get_password_hash("bench")
+
+    addresses, store_rows, depots = [], [], []
+    for i in range(stores + loading_places):
+        lat, lon = _random_place(rnd, CITY_RADIUS_KM if i < stores else CITY_RADIUS_KM / 3)
+        address_id = uuid.uuid4()
+        addresses.append({"id": address_id, "address_1c": f"Тестовый адрес {run}-{i}", "latitude": lat, "longitude": lon})
+        if i < stores:
+            store_rows.append({"id": uuid.uuid4(), "uuid_1c": f"bench-{run}-{i}", "name_1c": f"Магазин {i}",
+                               "address_id": address_id, "latitude": lat, "longitude": lon})
+        else:
+            depots.append({"id": uuid.uuid4(), "uuid_1c": f"bench-{run}-depot-{i}", "name": f"Склад {i - stores + 1}",
+                           "address_id": address_id, "latitude": lat, "longitude": lon})
+
+    totals = {}
+    with sync_engine.begin() as conn:
+        _insert(conn, Address, addresses)
+        _insert(conn, Store, [{k: v for k, v in s.items() if k not in ("latitude", "longitude")} for s in store_rows])
+        _insert(conn, LoadingPlace, [{k: v for k, v in d.items() if k not in ("latitude", "longitude")} for d in depots])
+
+        for d in range(drivers):
+            user_id, vehicle_id = uuid.uuid4(), uuid.uuid4()
+            _insert(conn, User, [{
+                "id": user_id,
+                "username": f"bench_{run}_{d}",
+                "hashed_password": password,
+                "first_name": f"Водитель{d}",
+                "last_name": run,
+                "rate": 1.0,
+            }])
+            _insert(conn, Vehicle, [{"id": vehicle_id, "owner_id": user_id, "plate_number": f"B{d:03d}{run[:4]}", "model": "Газель"}])
+
+            batch = _Batch()
+            track = _Track(batch, vehicle_id, log_interval, rnd, now)
+            depot = rnd.choice(depots)
+            for day in reversed(range(days)):
+                _route(batch, track, rnd, today - timedelta(days=day), vehicle_id, depot, store_rows,
+                       points, transitions, now, f"{run}-{d}-{day}")
+            for table, count in batch.flush(conn).items():
+                totals[table] = totals.get(table, 0) + count
+
+    print(f"Набор {run} (логины bench_{run}_N, пароль bench): " + ", ".join(f"{t} {c}" for t, c in totals.items()))
+
+    # Текущие статусы, счётчики маршрутов и дневные агрегаты — тем же кодом, что и в приложении
+    repair_status_fields(full=True)
+    backfill_daily_stats(today - timedelta(days=days - 1), today)
+    return run
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генерация синтетических маршрутов для замеров")
+    parser.add_argument("--drivers", type=int, default=20)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--points", type=int, default=15, help="точек в маршруте")
+    parser.add_argument("--transitions", type=int, default=3, help="записей статусов на выполненную точку, не меньше 3")
+    parser.add_argument("--stores", type=int, default=200)
+    parser.add_argument("--loading-places", type=int, default=3)
+    parser.add_argument("--log-interval", type=int, default=5, help="шаг GPS-трека в минутах, 0 — без трека")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    sync_engine.echo = False
+    generate(args.drivers, args.days, args.points, args.stores, args.transitions, args.log_interval,
+             args.loading_places, args.seed)
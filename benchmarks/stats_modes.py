@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import date, timedelta
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.database_app import async_engine
+from routers.stats import StatsMode, collect_full_statistics
+
+# Сравнение режимов /statistics/full на одном наборе данных (см. benchmarks/generate.py).
+# python -m benchmarks.stats_modes --days 30 --repeat 30
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def measure(mode: StatsMode, start: date, end: date, repeat: int, warmup: int) -> tuple[list[float], dict]:
+    timings, result = [], None
+    for i in range(warmup + repeat):
+        started = time.perf_counter()
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            result = await collect_full_statistics(db, start, end, mode)
+        if i >= warmup:
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings, result
+
+
+async def main(days: int, repeat: int, warmup: int):
+    end = date.today()
+    start = end - timedelta(days=days - 1)
+    print(f"Период {start} — {end}, повторов {repeat}")
+
+    results = {}
+    for mode in StatsMode:
+        timings, results[mode] = await measure(mode, start, end, repeat, warmup)
+        print(
+            f"{mode.value:<12} median {statistics.median(timings):8.1f} ms"
+            f"   p95 {_percentile(timings, 0.95):8.1f} ms"
+            f"   min {min(timings):8.1f} ms"
+        )
+
+    # Режимы должны отдавать одинаковый ответ — сравниваем так, как его сериализует FastAPI
+    dumps = {mode: json.dumps(jsonable_encoder(result), sort_keys=True) for mode, result in results.items()}
+    if len(set(dumps.values())) != 1:
+        print("ВНИМАНИЕ: ответы режимов различаются")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замер режимов выполнения полной статистики")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    args = parser.parse_args()
+    async_engine.echo = False
+    asyncio.run(main(args.days, args.repeat, args.warmup))
@@ -0,0 +1,187 @@
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+import httpx
+from sqlalchemy import event, func, select
+from auth import create_access_token
+from database.database_app import async_engine, sync_engine
+from models import RoutePlan, RoutePoint, RoutePointStatusLog, Vehicle
+from stats_cache import stats_cache
+
+# Набор замеров эндпоинтов на сгенерированных данных (benchmarks/generate.py).
+# Запросы идут в приложение в том же процессе, поэтому кроме латентности считается
+# число SQL-запросов на вызов. Результат пишется в JSON; с --compare сравнивается
+# с прошлым прогоном, и при регрессии процесс завершается с кодом 1 — для проверки перед выкладкой.
+# python -m benchmarks.suite --output before.json
+# python -m benchmarks.suite --output after.json --compare before.json
+
+# Регрессия: медиана выросла больше чем на threshold и больше чем на MIN_REGRESSION_MS, или выросло число запросов
+DEFAULT_THRESHOLD = 0.25
+MIN_REGRESSION_MS = 5.0
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def _fixtures() -> dict:
+    """Маршрут с наибольшим числом точек за последнюю неделю и водитель с маршрутом на сегодня."""
+    today = date.today()
+    async with async_engine.connect() as conn:
+        busiest = (await conn.execute(
+            select(RoutePlan.id)
+            .join(RoutePoint, RoutePoint.route_plan_id == RoutePlan.id)
+            .where(RoutePlan.date >= today - timedelta(days=7))
+            .group_by(RoutePlan.id)
+            .order_by(func.count(RoutePoint.id).desc())
+            .limit(1)
+        )).scalar()
+        driver = (await conn.execute(
+            select(Vehicle.owner_id)
+            .join(RoutePlan, RoutePlan.vehicle_id == Vehicle.id)
+            .where(func.date(RoutePlan.date) == today, Vehicle.owner_id.isnot(None))
+            .limit(1)
+        )).scalar()
+        dataset = {
+            "route_plans": (await conn.execute(select(func.count()).select_from(RoutePlan))).scalar(),
+            "route_points": (await conn.execute(select(func.count()).select_from(RoutePoint))).scalar(),
+            "status_logs": (await conn.execute(select(func.count()).select_from(RoutePointStatusLog))).scalar(),
+        }
+    return {"route_id": busiest, "driver_id": driver, "dataset": dataset}
+
+
+def _scenarios(fixtures: dict) -> list[tuple]:
+    """(имя, путь, параметры, заголовки); сценарии без нужных данных пропускаются."""
+    today = date.today()
+
+    def period(days: int) -> dict:
+        return {"start_date": str(today - timedelta(days=days - 1)), "end_date": str(today)}
+
+    scenarios = [
+        ("stats.full_statistics 7d", "/statistics/full", period(7), {}),
+        ("stats.full_statistics 30d", "/statistics/full", period(30), {}),
+        ("stats.full_statistics 90d", "/statistics/full", period(90), {}),
+        ("stats.full_statistics 30d single", "/statistics/full", {**period(30), "mode": "single"}, {}),
+        ("stats.statistics_series 30d day/driver", "/statistics/series", period(30), {}),
+        ("stats.statistics_analytics 30d store", "/statistics/analytics", period(30), {}),
+    ]
+    if fixtures["route_id"]:
+        scenarios.append(("trail.get_route_timeline", f"/routes/{fixtures['route_id']}/timeline", {}, {}))
+    if fixtures["driver_id"]:
+        token = create_access_token({"sub": str(fixtures["driver_id"])})
+        scenarios.append(("trail.get_today_route", "/routes/today", {}, {"Authorization": f"Bearer {token}"}))
+    return scenarios
+
+
+async def run(repeat: int, warmup: int, use_cache: bool) -> dict:
+    # Импорт main готовит базу (таблицы, секции, агрегаты), как при запуске приложения
+    from main import app
+
+    fixtures = await _fixtures()
+    counter = QueryCounter(async_engine)
+    results = {}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, path, params, headers in _scenarios(fixtures):
+            timings, queries, status = [], [], None
+            for i in range(warmup + repeat):
+                if not use_cache:
+                    stats_cache.clear()
+                counter.count = 0
+                started = time.perf_counter()
+                response = await client.get(path, params=params, headers=headers)
+                elapsed = (time.perf_counter() - started) * 1000
+                status = response.status_code
+                if i >= warmup:
+                    timings.append(elapsed)
+                    queries.append(counter.count)
+            results[name] = {
+                "status": status,
+                "median_ms": round(statistics.median(timings), 2),
+                "p95_ms": round(_percentile(timings, 0.95), 2),
+                "min_ms": round(min(timings), 2),
+                "queries": round(statistics.mean(queries), 1),
+            }
+            print(f"{name:<42} {status}  median {results[name]['median_ms']:8.1f} ms"
+                  f"  p95 {results[name]['p95_ms']:8.1f} ms  запросов {results[name]['queries']:g}")
+
+    await async_engine.dispose()
+    return {"meta": _meta(fixtures["dataset"], repeat, use_cache), "results": results}
+
+
+def _meta(dataset: dict, repeat: int, use_cache: bool) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit or None,
+        "repeat": repeat,
+        "cache": use_cache,
+        "dataset": dataset,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Печатает сравнение с прошлым прогоном и возвращает имена регрессий."""
+    print(f"\nСравнение с {baseline['meta'].get('commit')} ({baseline['meta'].get('created_at')})")
+    if baseline["meta"].get("dataset") != current["meta"].get("dataset"):
+        print(f"ВНИМАНИЕ: наборы данных различаются: {baseline['meta'].get('dataset')} / {current['meta'].get('dataset')}")
+
+    regressions = []
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before:
+            print(f"{name:<42} новый сценарий")
+            continue
+        delta = (now["median_ms"] - before["median_ms"]) / before["median_ms"] if before["median_ms"] else 0
+        slower = delta > threshold and now["median_ms"] - before["median_ms"] > MIN_REGRESSION_MS
+        more_queries = now["queries"] > before["queries"]
+        mark = "РЕГРЕССИЯ" if slower or more_queries or now["status"] != before["status"] else ""
+        if mark:
+            regressions.append(name)
+        print(f"{name:<42} {before['median_ms']:8.1f} -> {now['median_ms']:8.1f} ms ({delta:+.0%})"
+              f"   запросов {before['queries']:g} -> {now['queries']:g}   {mark}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры эндпоинтов статистики и маршрутов")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--cache", action="store_true", help="не сбрасывать кэш статистики между вызовами")
+    parser.add_argument("--output", help="куда сохранить результат (JSON)")
+    parser.add_argument("--compare", help="прошлый результат для сравнения")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="допустимый рост медианы, доля")
+    args = parser.parse_args()
+
+    async_engine.echo = sync_engine.echo = False
+    report = asyncio.run(run(args.repeat, args.warmup, args.cache))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            regressions = compare(json.load(file), report, args.threshold)
+        if regressions:
+            print(f"\nРегрессии: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,125 @@
+import tempfile
+import zipfile
+import numpy as np
+import pandas as pd
+
+# Колоночная выгрузка GPS-истории в сжатый NPZ (zip из .npy-массивов, np.load читает его как есть).
+# Строки отсортированы по машине и времени, поэтому время и координаты хранятся разностями
+# с предыдущей строкой: соседние значения близки, и deflate сжимает их в разы лучше исходных.
+#   vehicles          — id машин строкой, vehicle — номер машины строки в vehicles (int32)
+#   timestamp_delta   — разности времени в микросекундах UTC (int64), первое значение — абсолютное
+#   latitude_delta,
+#   longitude_delta   — разности координат в 1e-7 градуса (int64, около сантиметра)
+#   located           — у строки есть координаты; без них разность нулевая
+#   statuses, status  — названия статусов и номер статуса строки (int8, -1 — нет статуса)
+# База отдаёт строки группами — массивами по машине за день, — так драйвер разбирает
+# тысячи массивов, а не сотни тысяч строк. Массивы копятся порциями во временных файлах,
+# так что память не растёт с объёмом выгрузки.
+# Обратно в pandas — logs_frame(np.load(file)).
+
+COORD_SCALE = 10_000_000
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+class ColumnSpool:
+    """Одномерный массив, дописываемый порциями во временный файл и сохраняемый в zip как .npy."""
+
+    def __init__(self, dtype):
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self._file = tempfile.TemporaryFile()
+
+    def append(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        self._file.write(values.tobytes())
+        self.length += len(values)
+
+    def write_npy(self, archive: zipfile.ZipFile, name: str):
+        header = {"descr": np.lib.format.dtype_to_descr(self.dtype), "fortran_order": False, "shape": (self.length,)}
+        self._file.seek(0)
+        with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+            np.lib.format.write_array_header_1_0(member, header)
+            while chunk := self._file.read(COPY_CHUNK_BYTES):
+                member.write(chunk)
+
+    def close(self):
+        self._file.close()
+
+
+class LogColumnsWriter:
+    """Собирает строки logs порциями (отсортированными по машине и времени) в NPZ."""
+
+    def __init__(self, statuses: list[str]):
+        self.statuses = list(statuses)
+        self._status_codes = {name: code for code, name in enumerate(self.statuses)}
+        self.vehicles: dict = {}
+        self.columns = {
+            "vehicle": ColumnSpool(np.int32),
+            "timestamp_delta": ColumnSpool(np.int64),
+            "latitude_delta": ColumnSpool(np.int64),
+            "longitude_delta": ColumnSpool(np.int64),
+            "located": ColumnSpool(np.bool_),
+            "status": ColumnSpool(np.int8),
+        }
+        # Последние значения предыдущей порции — разности продолжаются через границу порций
+        self._last = {"timestamp": 0, "latitude": 0, "longitude": 0}
+
+    def _delta(self, name: str, values: np.ndarray) -> np.ndarray:
+        delta = np.diff(values, prepend=self._last[name])
+        self._last[name] = int(values[-1])
+        return delta
+
+    def _coordinate(self, name: str, values: np.ndarray, located: np.ndarray) -> np.ndarray:
+        """Квантованные координаты; пропуск заполняется предыдущим значением, чтобы разность была нулевой."""
+        if not located.all():
+            index = np.where(located, np.arange(len(values)), -1)
+            np.maximum.accumulate(index, out=index)
+            values = np.where(index >= 0, values[np.maximum(index, 0)], self._last[name])
+        return self._delta(name, values)
+
+    def add(self, groups):
+        """
+        Порция групп (vehicle_id, timestamps, latitudes, longitudes, located, statuses) в порядке
+        машины и времени: время — микросекунды UTC, координаты — целые в 1e-7 градуса (0 без координат).
+        """
+        if not groups:
+            return
+        vehicle_ids, timestamps, latitudes, longitudes, located, statuses = zip(*groups)
+        lengths = [len(values) for values in timestamps]
+        vehicles = [self.vehicles.setdefault(vehicle_id, len(self.vehicles)) for vehicle_id in vehicle_ids]
+        located = np.concatenate([np.array(values, dtype=bool) for values in located])
+
+        self.columns["vehicle"].append(np.repeat(vehicles, lengths))
+        self.columns["timestamp_delta"].append(self._delta("timestamp", np.concatenate(timestamps, dtype=np.int64)))
+        self.columns["latitude_delta"].append(self._coordinate("latitude", np.concatenate(latitudes, dtype=np.int64), located))
+        self.columns["longitude_delta"].append(self._coordinate("longitude", np.concatenate(longitudes, dtype=np.int64), located))
+        self.columns["located"].append(located)
+        codes = self._status_codes
+        self.columns["status"].append([codes.get(status, -1) for values in statuses for status in values])
+
+    def write(self, file):
+        """Пишет NPZ в file и освобождает временные файлы."""
+        with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, values in (("vehicles", [str(v) for v in self.vehicles]), ("statuses", self.statuses)):
+                with archive.open(f"{name}.npy", "w") as member:
+                    np.lib.format.write_array(member, np.array(values, dtype=str))
+            for name, column in self.columns.items():
+                column.write_npy(archive, name)
+                column.close()
+
+
+def logs_frame(data) -> pd.DataFrame:
+    """Раскодирует выгрузку (результат np.load) в DataFrame: vehicle_id, timestamp, latitude, longitude, status."""
+    located = data["located"]
+    latitude = np.cumsum(data["latitude_delta"]) / COORD_SCALE
+    longitude = np.cumsum(data["longitude_delta"]) / COORD_SCALE
+    latitude[~located] = np.nan
+    longitude[~located] = np.nan
+    codes = data["status"]
+    return pd.DataFrame({
+        "vehicle_id": pd.Categorical.from_codes(data["vehicle"], data["vehicles"]),
+        "timestamp": pd.to_datetime(np.cumsum(data["timestamp_delta"]), unit="us", utc=True),
+        "latitude": latitude,
+        "longitude": longitude,
+        "status": pd.Categorical.from_codes(codes.astype(np.int64), data["statuses"]),
+    })
@@ -1,9 +1,21 @@
+import uuid
 from fastapi import HTTPException
+from sqlalchemy import func, insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from models import RoutePlan, RoutePoint, User, Vehicle, LogEntry
-from schemas.schemas import UserCreate, UserUpdate, VehicleCreate, LogCreate
+from schemas.schemas import UserCreate, UserUpdate, VehicleCreate, LogCreate, LogFix
 from auth import get_password_hash
+from database.daily_stats import refresh_daily_stats
+from database.mileage import mark_mileage_changed
+from database.writes import insert_returning, update_returning
+from database.write_buffer import log_buffer
+from fleet import LOG_FIELDS, fleet_positions, note_logs, note_position
+from geofence import geofence_index
+from ingest_filter import newest_fix, repeat_reason, thin_fixes
+from metrics import INGEST_FIXES_DROPPED
+from live import position_event, publish, publish_fixes
+from pagination import DEFAULT_LIMIT, paginate
 from sqlalchemy.orm import selectinload
 from uuid import UUID
 
@@ -17,8 +29,14 @@ async def create_user(db: AsyncSession, user: UserCreate):
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already taken")
 
+    # id генерируем заранее, чтобы пользователь и его машина ушли в одной транзакции
+    user_id = uuid.uuid4()
+
     # Создаём пользователя
-    db_user = User(
+    db_user = await insert_returning(
+        db,
+        User,
+        id=user_id,
         username=user.username,
         hashed_password=get_password_hash(user.password),
         first_name=user.first_name,
@@ -27,59 +45,51 @@ async def create_user(db: AsyncSession, user: UserCreate):
         rate=user.rate,
         is_active=True
     )
-    db.add(db_user)
-    await db.commit()
-    await db.refresh(db_user)
 
-    db_vehicle = Vehicle(
-        owner_id = db_user.id, 
+    await insert_returning(
+        db,
+        Vehicle,
+        owner_id = user_id, 
         model = "Не указана",
-        plate_number = str(db_user.id),   
+        plate_number = str(user_id),   
     )
-    db.add(db_vehicle)
     await db.commit()
-    await db.refresh(db_vehicle)
 
     # Можно вернуть пользователя с машиной, если нужно
     return db_user
 
 
 async def update_user(db: AsyncSession, user: UserUpdate):
-    db_user = await db.execute(select(User).where(User.id == user.id))
-    db_user = db_user.scalar_one_or_none()
-
-    if not db_user:
-        raise HTTPException(status_code=404, detail="Пользователь не найден")
-
+    values = {}
     if user.username:
-        db_user.username = user.username
+        values["username"] = user.username
     if user.first_name:
-        db_user.first_name = user.first_name
+        values["first_name"] = user.first_name
     if user.last_name:
-        db_user.last_name = user.last_name
+        values["last_name"] = user.last_name
     if user.middle_name:
-        db_user.middle_name = user.middle_name
+        values["middle_name"] = user.middle_name
     if user.rate is not None:
-        db_user.rate = user.rate
+        values["rate"] = user.rate
     if user.is_active is not None:
-        db_user.is_active = user.is_active
+        values["is_active"] = user.is_active
     if user.transport_company_id is not None:
-        db_user.transport_company_id = user.transport_company_id
+        values["transport_company_id"] = user.transport_company_id
     if user.tariff_id is not None:
-        db_user.tariff_id = user.tariff_id
+        values["tariff_id"] = user.tariff_id
+
+    db_user = await update_returning(db, User, user.id, changeDateTime=datetime.utcnow(), **values)
+
+    if not db_user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    db_user.changeDateTime = datetime.utcnow()
-    db.add(db_user)
     await db.commit()
-    await db.refresh(db_user)
     return db_user
 
 # VEHICLES
 async def create_vehicle(db: AsyncSession, user_id: UUID, vehicle: VehicleCreate):
-    db_vehicle = Vehicle(**vehicle.dict(), owner_id=user_id)
-    db.add(db_vehicle)
+    db_vehicle = await insert_returning(db, Vehicle, **vehicle.dict(), owner_id=user_id)
     await db.commit()
-    await db.refresh(db_vehicle)
     return db_vehicle
 
 
@@ -89,26 +99,124 @@ from datetime import datetime
 
 async def create_log(db: AsyncSession, vehicle_id: UUID, log: LogCreate):
     barnaul_time = datetime.now(ZoneInfo("Asia/Barnaul"))
-    
-    db_log = LogEntry(vehicle_id=vehicle_id, timestamp=barnaul_time, **log.dict())
-    
-    db.add(db_log)
+
+    # Повтор предыдущей отметки не записывается — клиент получает ту, с которой она слилась
+    previous = fleet_positions.last_log(vehicle_id)
+    reason = repeat_reason(previous, {**log.dict(), "timestamp": barnaul_time})
+    if reason:
+        INGEST_FIXES_DROPPED.inc(reason=reason)
+        return previous
+
+    db_log = await insert_returning(db, LogEntry, vehicle_id=vehicle_id, timestamp=barnaul_time, **log.dict())
+    note_logs(db, [{key: getattr(db_log, key) for key in LOG_FIELDS}])
+    note_position(db, vehicle_id, log.latitude, log.longitude, log.status, barnaul_time)
+    if log.latitude is not None and log.longitude is not None:
+        mark_mileage_changed(db, [(vehicle_id, barnaul_time)])
+        await publish(db, position_event(vehicle_id, log.latitude, log.longitude, log.status, barnaul_time))
+        await geofence_index.check_fixes(db, vehicle_id, [(barnaul_time, log.latitude, log.longitude)])
     await db.commit()
-    await db.refresh(db_log)
     return db_log
 
 
-async def get_vehicle_logs(db: AsyncSession, vehicle_id: UUID):
-    result = await db.execute(select(LogEntry).where(LogEntry.vehicle_id == vehicle_id))
-    return result.scalars().all()
+def _log_rows(vehicle_id: UUID, logs: list[LogFix]) -> list[dict]:
+    """Строки logs со всеми колонками: отложенная запись отвечает ими клиенту до INSERT."""
+    barnaul = ZoneInfo("Asia/Barnaul")
+    received_at = datetime.now(barnaul)
+    created_at = datetime.utcnow()
+    rows = []
+    for log in logs:
+        # Время без пояса приходит с устройства водителя — оно в местном времени
+        timestamp = getattr(log, "timestamp", None) or received_at
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=barnaul)
+        rows.append({
+            "id": uuid.uuid4(),
+            "vehicle_id": vehicle_id,
+            "status": log.status,
+            "latitude": log.latitude,
+            "longitude": log.longitude,
+            "timestamp": timestamp,
+            "createDateTime": created_at,
+            "changeDateTime": created_at,
+        })
+    return rows
 
 
-# Создать маршрут для автомобиля
-async def create_route_plan(db: AsyncSession, vehicle_id: UUID, date: datetime, notes: str = None):
-    plan = RoutePlan(vehicle_id=vehicle_id, date=date, notes=notes)
-    db.add(plan)
+def _latest_fix(rows: list[dict]) -> dict:
+    """Самая свежая отметка с координатами из пачки — для положения машины на карте."""
+    located = [row for row in rows if row["latitude"] is not None and row["longitude"] is not None] or rows
+    latest = max(located, key=lambda row: row["timestamp"])
+    return {key: latest[key] for key in ("vehicle_id", "latitude", "longitude", "status", "timestamp")}
+
+
+async def create_logs(db: AsyncSession, vehicle_id: UUID, logs: list[LogFix]) -> int:
+    """
+    Пачка логов машины одним executemany без RETURNING и один коммит. Возвращает число строк.
+    Один INSERT ... VALUES на тысячи строк дольше компилируется, чем выполняется, — executemany в разы быстрее.
+    Повторы предыдущих отметок отбрасываются (ingest_filter.py) и в число строк не входят.
+    """
+    rows = thin_fixes(_log_rows(vehicle_id, logs), pending=log_buffer.pending_tail(vehicle_id))
+    if not rows:
+        return 0
+    await db.execute(insert(LogEntry), rows)
+    note_logs(db, rows)
+    note_position(db, **_latest_fix(rows))
+    mark_mileage_changed(db, ((row["vehicle_id"], row["timestamp"]) for row in rows))
+    await publish_fixes(db, rows)
+    await geofence_index.check_rows(db, rows)
     await db.commit()
-    await db.refresh(plan)
+    return len(rows)
+
+
+async def queue_logs(vehicle_id: UUID, logs: list[LogCreate]) -> list[dict]:
+    """
+    Логи в буфер отложенной записи; возвращает строки, которые попадут в базу, — без отброшенных повторов.
+    BufferFull — очередь полна.
+    """
+    # Повторы сравниваются и с отметками машины, ещё ждущими записи в буфере
+    rows = thin_fixes(_log_rows(vehicle_id, logs), pending=log_buffer.pending_tail(vehicle_id))
+    # На карту и в живую ленту отметки попадут после записи пачки в базу
+    await log_buffer.add_many(rows)
+    return rows
+
+
+async def queue_log(vehicle_id: UUID, log: LogCreate) -> dict:
+    """Один лог в буфер; повтор предыдущей отметки не ставится в очередь — возвращается та, с которой он слился."""
+    rows = await queue_logs(vehicle_id, [log])
+    if rows:
+        return rows[0]
+    return newest_fix(log_buffer.pending_tail(vehicle_id), fleet_positions.last_log(vehicle_id))
+
+
+def vehicle_logs_query(vehicle_ids, since: datetime | None = None, until: datetime | None = None):
+    """Логи машин за интервал; vehicle_ids — список id или подзапрос."""
+    query = select(LogEntry).where(LogEntry.vehicle_id.in_(vehicle_ids))
+    # Ограничение по времени отсекает лишние месячные секции logs
+    if since:
+        query = query.where(LogEntry.timestamp >= since)
+    if until:
+        query = query.where(LogEntry.timestamp < until)
+    return query
+
+
+async def get_vehicle_logs(
+    db: AsyncSession,
+    vehicle_id: UUID,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = DEFAULT_LIMIT,
+) -> dict:
+    """Страница логов машины, новые сначала; ключ страницы (timestamp, id) идёт по индексу (vehicle_id, timestamp)."""
+    query = vehicle_logs_query([vehicle_id], since, until)
+    return await paginate(db, query, (LogEntry.timestamp, LogEntry.id), cursor, limit)
+
+
+# Создать маршрут для автомобиля
+async def create_route_plan(db: AsyncSession, vehicle_id: UUID, date: datetime, notes: str = None, commit: bool = True):
+    plan = await insert_returning(db, RoutePlan, vehicle_id=vehicle_id, date=date, notes=notes)
+    if commit:
+        await db.commit()
     return plan
 
 # Добавить точку маршрута
@@ -120,28 +228,28 @@ async def add_route_point(
     counterparty: str,
     address_obj,
     note: str = None,
-    order: int | None = None
+    order: int | None = None,
+    commit: bool = True
 ):
-    # Получаем все существующие точки маршрута для этого маршрута
-    result = await db.execute(
-        select(RoutePoint)
-        .where(RoutePoint.route_plan_id == route_plan_id)
-        .order_by(RoutePoint.order.asc())
-    )
-    existing_points = result.scalars().all()
-
     if order is None:
         # Если order не передан, ставим следующий после максимального
-        order = max((p.order for p in existing_points), default=0) + 1
+        result = await db.execute(
+            select(func.coalesce(func.max(RoutePoint.order), 0))
+            .where(RoutePoint.route_plan_id == route_plan_id)
+        )
+        order = result.scalar() + 1
     else:
-        # Если order передан, проверяем конфликты и сдвигаем остальные
-        for p in existing_points:
-            if p.order >= order:
-                p.order += 1
-                db.add(p)  # помечаем для обновления
+        # Если order передан, сдвигаем остальные одним запросом
+        await db.execute(
+            update(RoutePoint)
+            .where(RoutePoint.route_plan_id == route_plan_id, RoutePoint.order >= order)
+            .values(order=RoutePoint.order + 1)
+        )
 
     # Создаём новую точку маршрута
-    point = RoutePoint(
+    point = await insert_returning(
+        db,
+        RoutePoint,
         route_plan_id=route_plan_id,
         doc=doc,
         payment=payment,
@@ -156,9 +264,10 @@ async def add_route_point(
         longitude=address_obj.longitude,
     )
 
-    db.add(point)
-    await db.commit()
-    await db.refresh(point)
+    if commit:
+        # Импорты (commit=False) пересчитывают агрегаты сами — один раз на все затронутые маршруты
+        await refresh_daily_stats(db, [route_plan_id])
+        await db.commit()
     return point
 
 # Получить маршрут с точками для автомобиля
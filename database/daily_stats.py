@@ -0,0 +1,353 @@
+import argparse
+import asyncio
+from collections import defaultdict
+from datetime import date, timedelta
+from sqlalchemy import Date, delete, event, func, literal, select, text, union_all
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from .database_app import async_engine, sync_engine
+from .watermarks import read_watermark, write_watermark
+from stats_cache import mark_days_changed
+from models import (
+    DriverDailyStats, RoutePlan, RoutePoint, RoutePointStatusEnum, StoreDailyStats, Vehicle, VehicleDailyStats
+)
+
+# Дневные агрегаты по точкам маршрутов: водитель/день, машина/день, магазин/день.
+# Срез (день, ключ) пересчитывается целиком из сырых строк при смене статуса или импорте,
+# поэтому агрегаты не расходятся с данными из-за порядка событий.
+# Прошедшие дни статистика читает из агрегатов, сегодняшний и будущие — из сырых строк.
+# Срезы пересчитываются под advisory-блокировками: иначе две транзакции, посчитавшие один срез
+# каждая по своему снимку, перезаписали бы друг друга — осталась бы версия последней.
+# Точечный пересчёт берёт разделяемую блокировку (день, уровень) и исключительную на каждый ключ,
+# пересборка дней — исключительную (день, уровень). Все блокировки транзакции берутся одним
+# запросом в порядке имён, поэтому взаимоблокировок между пересчётами нет.
+# Первичная сборка идёт кусками и запоминает последний собранный день (BACKFILL_WATERMARK):
+# после падения или перезапуска она продолжается с него, а заодно дособирает дни простоя.
+# Пока сборка не дошла до сегодня, статистика читает сырые строки.
+# Смена статуса точки не пересчитывает срезы сама: маршрут ставится в очередь
+# (queue_daily_stats_refresh), и фоновая задача пересчитывает его срезы после коммита
+# в своей транзакции — статус пишется несколькими запросами, не дожидаясь агрегатов.
+
+# уровень -> (таблица агрегатов, колонка ключа, откуда ключ берётся в сырых данных)
+LEVELS = {
+    "driver": (DriverDailyStats, DriverDailyStats.driver_id, Vehicle.owner_id),
+    "vehicle": (VehicleDailyStats, VehicleDailyStats.vehicle_id, RoutePlan.vehicle_id),
+    "store": (StoreDailyStats, StoreDailyStats.store_id, RoutePoint.store_id),
+}
+
+VALUE_COLUMNS = [
+    "points_total",
+    "points_with_status",
+    "points_planned",
+    "points_en_route",
+    "points_arrived",
+    "points_completed",
+    "points_skipped",
+    "payment_sum",
+    "payment_with_status_sum",
+    "duration_sum",
+    "duration_count",
+    "max_duration_minutes",
+    "max_duration_point_id",
+]
+
+# Интервал фонового пересчёта вчерашнего и сегодняшнего дня (правки, не прошедшие через хуки)
+REFRESH_INTERVAL_SECONDS = 60 * 60
+
+# Как часто фоновая задача пересчитывает срезы маршрутов из очереди
+PENDING_REFRESH_INTERVAL_SECONDS = 5
+
+# Ключ в Session.info: маршруты и магазины транзакции, после коммита попадают в очередь пересчёта
+CHANGED_ROUTES_KEY = "daily_stats_changed_routes"
+_pending_routes: set = set()
+_pending_stores: set = set()
+
+# Отметка первичной сборки: последний день, за который агрегаты собраны
+BACKFILL_WATERMARK = "daily_stats_backfill"
+
+# Пока первичная сборка не закончена, статистика считается по сырым строкам за весь диапазон
+_aggregates_ready = False
+
+
+def _day_bounds(day_from: date, day_to: date):
+    # date сравнивается с timestamptz в часовом поясе сессии — так же, как func.date(RoutePlan.date)
+    return (
+        RoutePlan.date >= literal(day_from, Date),
+        RoutePlan.date < literal(day_to + timedelta(days=1), Date),
+    )
+
+
+def aggregate_select(level: str, day_from: date, day_to: date, keys=None, unassigned: bool = False):
+    """
+    Агрегаты уровня level по сырым строкам за дни [day_from, day_to]; колонки как у таблицы агрегатов.
+    С unassigned — строки без ключа уровня (маршруты без машины): в таблицы агрегатов они не попадают.
+    """
+    model, key_column, source = LEVELS[level]
+    day = func.date(RoutePlan.date)
+    status = RoutePoint.current_status
+
+    def count_status(value):
+        return func.count(RoutePoint.id).filter(status == value)
+
+    query = (
+        select(
+            day.label("day"),
+            source.label(key_column.key),
+            func.count(RoutePoint.id).label("points_total"),
+            func.count(RoutePoint.id).filter(status.isnot(None)).label("points_with_status"),
+            count_status(RoutePointStatusEnum.planned).label("points_planned"),
+            count_status(RoutePointStatusEnum.en_route).label("points_en_route"),
+            count_status(RoutePointStatusEnum.arrived).label("points_arrived"),
+            count_status(RoutePointStatusEnum.completed).label("points_completed"),
+            count_status(RoutePointStatusEnum.skipped).label("points_skipped"),
+            func.coalesce(func.sum(RoutePoint.payment), 0).label("payment_sum"),
+            func.coalesce(func.sum(RoutePoint.payment).filter(status.isnot(None)), 0).label("payment_with_status_sum"),
+            func.coalesce(func.sum(RoutePoint.duration_minutes), 0).label("duration_sum"),
+            func.count(RoutePoint.duration_minutes).label("duration_count"),
+            func.max(RoutePoint.duration_minutes).label("max_duration_minutes"),
+            array_agg(
+                aggregate_order_by(RoutePoint.id, RoutePoint.duration_minutes.desc().nullslast(), RoutePoint.id)
+            )[1].label("max_duration_point_id"),
+        )
+        .select_from(RoutePoint)
+        .join(RoutePlan, RoutePoint.route_plan_id == RoutePlan.id)
+    )
+    if level == "driver":
+        query = query.join(Vehicle, Vehicle.id == RoutePlan.vehicle_id)
+
+    query = query.where(*_day_bounds(day_from, day_to), source.is_(None) if unassigned else source.isnot(None))
+    if keys is not None:
+        query = query.where(source.in_(keys))
+    return query.group_by(day, source)
+
+
+def _lock_slices(locks: dict[str, bool]):
+    """locks — имя среза -> разделяемая ли блокировка. Блокировки до конца транзакции, в порядке имён."""
+    names = sorted(locks)
+    return text(
+        "SELECT CASE WHEN shared THEN pg_advisory_xact_lock_shared(hashtextextended(name, 0))"
+        " ELSE pg_advisory_xact_lock(hashtextextended(name, 0)) END"
+        " FROM unnest(CAST(:names AS text[]), CAST(:shared AS boolean[])) AS slice(name, shared)"
+    ).bindparams(names=[f"daily_stats:{name}" for name in names], shared=[locks[name] for name in names])
+
+
+def _range_locks(day_from: date, day_to: date) -> dict[str, bool]:
+    locks = {}
+    day = day_from
+    while day <= day_to:
+        locks.update({f"{day.isoformat()}:{level}": False for level in LEVELS})
+        day += timedelta(days=1)
+    return locks
+
+
+def _refresh_statements(level: str, day_from: date, day_to: date, keys=None) -> list:
+    """DELETE среза + INSERT ... SELECT ON CONFLICT: исчезнувшие ключи удаляются, остальные перезаписываются."""
+    model, key_column, _ = LEVELS[level]
+
+    cleanup = delete(model).where(model.day >= day_from, model.day <= day_to)
+    if keys is not None:
+        cleanup = cleanup.where(key_column.in_(keys))
+
+    columns = ["day", key_column.key, *VALUE_COLUMNS]
+    upsert = pg_insert(model).from_select(columns, aggregate_select(level, day_from, day_to, keys))
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[model.day, key_column],
+        set_={**{c: upsert.excluded[c] for c in VALUE_COLUMNS}, "changeDateTime": func.now()},
+    )
+    return [cleanup, upsert]
+
+
+async def mark_routes_changed(db: AsyncSession, route_plan_ids):
+    """Дни маршрутов для сброса кэша статистики — для правок, которые не входят в дневные агрегаты (погрузки)."""
+    result = await db.execute(select(func.date(RoutePlan.date)).where(RoutePlan.id.in_(set(route_plan_ids))).distinct())
+    mark_days_changed(db, result.scalars().all())
+
+
+def queue_daily_stats_refresh(db, route_plan_ids, store_ids=()):
+    """Срезы маршрутов (и магазинов, чьи точки ушли из них) пересчитаются фоновой задачей после коммита."""
+    routes, stores = db.info.setdefault(CHANGED_ROUTES_KEY, (set(), set()))
+    routes.update(route_plan_ids)
+    stores.update(store_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _queue_after_commit(session):
+    routes, stores = session.info.pop(CHANGED_ROUTES_KEY, ((), ()))
+    _pending_routes.update(routes)
+    _pending_stores.update(stores)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop(CHANGED_ROUTES_KEY, None)
+
+
+async def refresh_daily_stats(db: AsyncSession, route_plan_ids, store_ids=()):
+    """
+    Пересчитывает срезы, которых касаются маршруты: их дни по водителю, машине и магазинам точек.
+    store_ids — магазины, чьи точки ушли из маршрутов (удаление, перенос). Не коммитит;
+    после коммита кэш статистики за эти дни сбрасывается.
+    """
+    route_plan_ids = list(set(route_plan_ids))
+    if not route_plan_ids:
+        return
+
+    result = await db.execute(
+        select(func.date(RoutePlan.date), RoutePlan.vehicle_id, Vehicle.owner_id)
+        .outerjoin(Vehicle, Vehicle.id == RoutePlan.vehicle_id)
+        .where(RoutePlan.id.in_(route_plan_ids))
+        .distinct()
+    )
+    slices = defaultdict(lambda: {"driver": set(), "vehicle": set(), "store": set(store_ids)})
+    for day, vehicle_id, owner_id in result.all():
+        if vehicle_id:
+            slices[day]["vehicle"].add(vehicle_id)
+        if owner_id:
+            slices[day]["driver"].add(owner_id)
+
+    result = await db.execute(
+        select(func.date(RoutePlan.date), RoutePoint.store_id)
+        .join(RoutePlan, RoutePoint.route_plan_id == RoutePlan.id)
+        .where(RoutePoint.route_plan_id.in_(route_plan_ids), RoutePoint.store_id.isnot(None))
+        .distinct()
+    )
+    for day, store_id in result.all():
+        slices[day]["store"].add(store_id)
+
+    mark_days_changed(db, slices.keys())
+    locks = {}
+    for day, levels in slices.items():
+        for level, keys in levels.items():
+            if keys:
+                locks[f"{day.isoformat()}:{level}"] = True
+                locks.update({f"{day.isoformat()}:{level}:{key}": False for key in keys})
+    if not locks:
+        return
+    await db.execute(_lock_slices(locks))
+    for day, levels in slices.items():
+        for level, keys in levels.items():
+            if not keys:
+                continue
+            for statement in _refresh_statements(level, day, day, list(keys)):
+                await db.execute(statement)
+
+
+def daily_rows(level: str, start: date, end: date, today: date | None = None, cte_name: str | None = None):
+    """
+    Строки (day, ключ, счётчики) за [start, end]: до вчера — из таблицы агрегатов,
+    с сегодняшнего дня — из сырых строк. Возвращает подзапрос, а с cte_name —
+    CTE с MATERIALIZED: набор считается один раз на весь запрос, сколько бы раз на него ни ссылались.
+    """
+    model, key_column, _ = LEVELS[level]
+    today = today or date.today()
+
+    parts = []
+    stored_end = min(end, today - timedelta(days=1))
+    if start <= stored_end:
+        parts.append(
+            select(model.day, key_column, *(getattr(model, c) for c in VALUE_COLUMNS))
+            .where(model.day >= start, model.day <= stored_end)
+        )
+    live_start = max(start, today)
+    if not _aggregates_ready:
+        parts, live_start = [], start
+    if live_start <= end or not parts:
+        parts.append(aggregate_select(level, live_start, end))
+
+    rows = parts[0] if len(parts) == 1 else union_all(*parts)
+    if cte_name:
+        return rows.cte(cte_name).prefix_with("MATERIALIZED")
+    return rows.subquery()
+
+
+# ===================== Пересборка =====================
+def backfill_daily_stats(start: date, end: date, chunk_days: int = 31, watermark: str | None = None):
+    """
+    Пересобирает агрегаты за [start, end] кусками по chunk_days дней — каждый кусок в своей транзакции.
+    С watermark последний день куска запоминается в той же транзакции.
+    """
+    day_from = start
+    while day_from <= end:
+        day_to = min(end, day_from + timedelta(days=chunk_days - 1))
+        with sync_engine.begin() as conn:
+            conn.execute(_lock_slices(_range_locks(day_from, day_to)))
+            for level in LEVELS:
+                for statement in _refresh_statements(level, day_from, day_to):
+                    conn.execute(statement)
+            if watermark:
+                write_watermark(conn, watermark, day=day_to)
+        print(f"Агрегаты статистики пересобраны за {day_from} — {day_to}")
+        day_from = day_to + timedelta(days=1)
+
+
+def ensure_daily_stats():
+    """
+    Собирает агрегаты с дня после отметки BACKFILL_WATERMARK (без отметки — со всей истории маршрутов)
+    по сегодня. Вызывается фоновой задачей; пока сборка не закончена, статистика читает сырые строки.
+    """
+    global _aggregates_ready
+    today = date.today()
+    try:
+        with sync_engine.connect() as conn:
+            mark = read_watermark(conn, BACKFILL_WATERMARK)
+            if mark and mark.day:
+                start = mark.day + timedelta(days=1)
+            else:
+                start = conn.execute(select(func.min(func.date(RoutePlan.date)))).scalar() or today
+        if start <= today:
+            backfill_daily_stats(start, today, watermark=BACKFILL_WATERMARK)
+        _aggregates_ready = True
+    except Exception as e:
+        # Недостроенные агрегаты не читаются; следующий запуск продолжит с отметки
+        print(f"Ошибка первичной сборки агрегатов статистики: {e}")
+
+
+def refresh_recent_days():
+    today = date.today()
+    try:
+        backfill_daily_stats(today - timedelta(days=1), today, watermark=BACKFILL_WATERMARK)
+    except Exception as e:
+        print(f"Ошибка пересчёта агрегатов статистики: {e}")
+
+
+async def refresh_pending_routes():
+    """Пересчитывает срезы маршрутов из очереди одной транзакцией; при ошибке они вернутся в очередь."""
+    routes, stores = set(_pending_routes), set(_pending_stores)
+    if not routes:
+        return
+    _pending_routes.difference_update(routes)
+    _pending_stores.difference_update(stores)
+    try:
+        async with AsyncSession(async_engine) as db:
+            await refresh_daily_stats(db, routes, stores)
+            await db.commit()
+    except Exception as e:
+        _pending_routes.update(routes)
+        _pending_stores.update(stores)
+        print(f"Ошибка пересчёта агрегатов маршрутов: {e}")
+
+
+async def run_pending_stats_refresh():
+    while True:
+        await asyncio.sleep(PENDING_REFRESH_INTERVAL_SECONDS)
+        await refresh_pending_routes()
+
+
+async def run_daily_stats_refresh():
+    await asyncio.to_thread(ensure_daily_stats)
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
+        if not _aggregates_ready:
+            await asyncio.to_thread(ensure_daily_stats)
+        else:
+            await asyncio.to_thread(refresh_recent_days)
+
+
+if __name__ == "__main__":
+    # python -m database.daily_stats 2024-01-01 2024-03-31
+    parser = argparse.ArgumentParser(description="Пересборка дневных агрегатов статистики")
+    parser.add_argument("start", type=date.fromisoformat)
+    parser.add_argument("end", type=date.fromisoformat, nargs="?", default=date.today())
+    args = parser.parse_args()
+    backfill_daily_stats(args.start, args.end)
@@ -49,7 +49,7 @@ def create_tables():
 
 async def get_session():
    
-    async with AsyncSession(async_engine) as session:
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
         try:
             yield session
         finally:
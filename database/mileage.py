@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import time as clock
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable
+from zoneinfo import ZoneInfo
+import numpy as np
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from .database_app import sync_engine
+from geo import track_mileage
+from models import LogEntry, VehicleDailyMileage
+
+# Пробег и время движения машин по дням (vehicle_daily_mileage) — для зарплаты и контроля топлива.
+# Срез «машина за день» пересчитывается целиком: отметки дня загружаются массивами NumPy,
+# выбросы отсекаются по скорости, расстояние — векторный гаверсинус (geo.track_mileage).
+# Запись логов отмечает затронутые срезы; после коммита они копятся в памяти процесса и
+# пересчитываются фоновой задачей раз в REFRESH_INTERVAL_SECONDS, так что пачка из офлайна
+# за прошлые дни тоже попадает в пробег. Раз в час вчера и сегодня пересчитываются для всех
+# машин — на случай логов, записанных в обход приложения.
+
+# День пробега — местный: смена водителя не делится полуночью по UTC
+MILEAGE_TZ = ZoneInfo("Asia/Barnaul")
+REFRESH_INTERVAL_SECONDS = 60
+RECENT_REFRESH_SECONDS = 60 * 60
+
+# Ключ в Session.info: срезы, затронутые транзакцией, попадают в очередь пересчёта после коммита
+CHANGED_SLICES_KEY = "mileage_changed"
+_changed_slices: set[tuple] = set()
+
+VALUE_COLUMNS = [
+    "distance_km",
+    "moving_seconds",
+    "idle_seconds",
+    "fixes_count",
+    "rejected_count",
+    "max_speed_kmh",
+    "first_fix_at",
+    "last_fix_at",
+]
+
+
+def local_day(timestamp: datetime) -> date:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)  # время без пояса в приложении — utcnow()
+    return timestamp.astimezone(MILEAGE_TZ).date()
+
+
+def mark_mileage_changed(db, fixes: Iterable[tuple]):
+    """fixes — пары (vehicle_id, timestamp) записанных логов; срезы пересчитаются после коммита."""
+    db.info.setdefault(CHANGED_SLICES_KEY, set()).update(
+        (vehicle_id, local_day(timestamp)) for vehicle_id, timestamp in fixes
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _queue_after_commit(session):
+    _changed_slices.update(session.info.pop(CHANGED_SLICES_KEY, ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop(CHANGED_SLICES_KEY, None)
+
+
+def _day_bounds(day: date) -> tuple[datetime, datetime]:
+    start = datetime.combine(day, time(), MILEAGE_TZ)
+    return start, start + timedelta(days=1)
+
+
+def _day_values(day: date, rows: list) -> list[dict]:
+    """Строки таблицы пробега из отметок дня, упорядоченных по машине и времени."""
+    if not rows:
+        return []
+    vehicle_ids, seconds, lat, lon = zip(*rows)
+    vehicle_ids = np.array(vehicle_ids, dtype=object)
+    seconds = np.array(seconds, dtype=float)
+    lat, lon = np.array(lat, dtype=float), np.array(lon, dtype=float)
+
+    starts = np.flatnonzero(np.r_[True, vehicle_ids[1:] != vehicle_ids[:-1]])
+    values = []
+    for begin, end in zip(starts, np.r_[starts[1:], len(rows)]):
+        part = slice(begin, end)
+        values.append({
+            "day": day,
+            "vehicle_id": vehicle_ids[begin],
+            **track_mileage(seconds[part], lat[part], lon[part]),
+            "first_fix_at": datetime.fromtimestamp(seconds[begin], timezone.utc),
+            "last_fix_at": datetime.fromtimestamp(seconds[end - 1], timezone.utc),
+        })
+    return values
+
+
+def refresh_mileage(day: date, vehicle_ids=None) -> int:
+    """Пересчитывает пробег за день — всех машин или только vehicle_ids. Возвращает число машин с отметками."""
+    start, end = _day_bounds(day)
+    query = (
+        select(LogEntry.vehicle_id, func.extract("epoch", LogEntry.timestamp), LogEntry.latitude, LogEntry.longitude)
+        .where(
+            LogEntry.timestamp >= start,
+            LogEntry.timestamp < end,
+            LogEntry.latitude.isnot(None),
+            LogEntry.longitude.isnot(None),
+        )
+        .order_by(LogEntry.vehicle_id, LogEntry.timestamp)
+    )
+    cleanup = delete(VehicleDailyMileage).where(VehicleDailyMileage.day == day)
+    if vehicle_ids is not None:
+        vehicle_ids = list(vehicle_ids)
+        query = query.where(LogEntry.vehicle_id.in_(vehicle_ids))
+        cleanup = cleanup.where(VehicleDailyMileage.vehicle_id.in_(vehicle_ids))
+
+    with sync_engine.begin() as conn:
+        values = _day_values(day, conn.execute(query).all())
+        conn.execute(cleanup)
+        if values:
+            upsert = pg_insert(VehicleDailyMileage)
+            upsert = upsert.on_conflict_do_update(
+                index_elements=[VehicleDailyMileage.day, VehicleDailyMileage.vehicle_id],
+                set_={**{c: upsert.excluded[c] for c in VALUE_COLUMNS}, "changeDateTime": func.now()},
+            )
+            conn.execute(upsert, values)
+    return len(values)
+
+
+def refresh_slices(slices: Iterable[tuple]):
+    """Пересчитывает срезы (vehicle_id, day) — одним запросом на день."""
+    days = defaultdict(set)
+    for vehicle_id, day in slices:
+        days[day].add(vehicle_id)
+    for day, vehicle_ids in sorted(days.items()):
+        refresh_mileage(day, vehicle_ids)
+
+
+def backfill_mileage(start: date, end: date):
+    day = start
+    while day <= end:
+        count = refresh_mileage(day)
+        print(f"Пробег пересчитан за {day}: {count} машин")
+        day += timedelta(days=1)
+
+
+def ensure_mileage():
+    """
+    При первом запуске (таблица пробега пуста) считает пробег за всю историю логов.
+    Вызывается фоновой задачей — старт приложения его не ждёт.
+    """
+    try:
+        with sync_engine.connect() as conn:
+            if conn.execute(select(VehicleDailyMileage.day).limit(1)).first():
+                return
+            first_fix = conn.execute(select(func.min(LogEntry.timestamp))).scalar()
+        if first_fix:
+            backfill_mileage(local_day(first_fix), datetime.now(MILEAGE_TZ).date())
+    except Exception as e:
+        print(f"Ошибка первичного расчёта пробега: {e}")
+
+
+async def run_mileage_refresh():
+    await asyncio.to_thread(ensure_mileage)
+    recent_at = clock.monotonic()
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
+        slices = set(_changed_slices)
+        _changed_slices.difference_update(slices)
+        try:
+            if clock.monotonic() - recent_at >= RECENT_REFRESH_SECONDS:
+                today = datetime.now(MILEAGE_TZ).date()
+                await asyncio.to_thread(backfill_mileage, today - timedelta(days=1), today)
+                recent_at = clock.monotonic()
+            if slices:
+                await asyncio.to_thread(refresh_slices, slices)
+        except Exception as e:
+            _changed_slices.update(slices)  # не пропадут — повторим в следующий раз
+            print(f"Ошибка пересчёта пробега: {e}")
+
+
+if __name__ == "__main__":
+    # python -m database.mileage 2024-01-01 2024-03-31
+    parser = argparse.ArgumentParser(description="Пересчёт пробега машин по GPS-логам")
+    parser.add_argument("start", type=date.fromisoformat)
+    parser.add_argument("end", type=date.fromisoformat, nargs="?", default=date.today())
+    args = parser.parse_args()
+    backfill_mileage(args.start, args.end)
@@ -0,0 +1,221 @@
+import asyncio
+import re
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import text
+from .database_app import sync_engine
+from models import LoadingStatusLog, LogEntry, RoutePointStatusLog
+
+# Таблицы журналов секционируются по месяцам (RANGE по колонке timestamp).
+PARTITIONED_MODELS = [LogEntry, RoutePointStatusLog, LoadingStatusLog]
+
+# Сколько месяцев вперёд держать готовые секции
+MONTHS_AHEAD = 3
+
+# Срок хранения в месяцах; None — хранить всё
+RETENTION_MONTHS = {
+    "logs": 12,
+    "route_point_status_logs": None,
+    "loading_status_logs": None,
+}
+
+# "archive" — отсоединить секцию и перенести в схему archive, "drop" — удалить
+RETENTION_MODE = "archive"
+ARCHIVE_SCHEMA = "archive"
+
+# Интервал фонового обслуживания секций
+MAINTENANCE_INTERVAL_SECONDS = 6 * 60 * 60
+
+# Статусы по маршруту пишутся в день маршрута, но бывают поздние правки —
+# окно поиска логов вокруг дат маршрута, чтобы работал partition pruning.
+# Окно — лишь первая попытка: логи за ним дочитываются по счётчику status_changes_count
+# (routers/trail.py, load_status_logs), молча ничего не теряется
+STATUS_LOG_SLACK = timedelta(days=7)
+
+_BOUND_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def status_log_bounds(start: date, end: date) -> tuple[datetime, datetime]:
+    """Границы timestamp для логов статусов маршрутов с датами в [start, end]."""
+    lo = datetime.combine(start, datetime.min.time(), tzinfo=timezone.utc) - STATUS_LOG_SLACK
+    hi = datetime.combine(end, datetime.min.time(), tzinfo=timezone.utc) + timedelta(days=1) + STATUS_LOG_SLACK
+    return lo, hi
+
+
+def _month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d: date, months: int) -> date:
+    month = d.month - 1 + months
+    return date(d.year + month // 12, month % 12 + 1, 1)
+
+
+def _partition_name(table: str, month: date) -> str:
+    return f"{table}_{month.year:04d}_{month.month:02d}"
+
+
+def _parse_bound(value: str) -> date | None:
+    value = value.strip()
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'")).date()
+
+
+def _relkind(conn, table: str) -> str | None:
+    return conn.execute(
+        text(
+            "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relname = :t AND n.nspname = current_schema()"
+        ),
+        {"t": table},
+    ).scalar()
+
+
+def _partitions(conn, table: str) -> list[tuple[str, date | None, date | None, bool]]:
+    """Секции таблицы: (имя, нижняя граница, верхняя граница, это DEFAULT)."""
+    rows = conn.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "JOIN pg_namespace n ON n.oid = p.relnamespace "
+            "WHERE p.relname = :t AND n.nspname = current_schema()"
+        ),
+        {"t": table},
+    ).all()
+
+    result = []
+    for name, bound in rows:
+        if bound == "DEFAULT":
+            result.append((name, None, None, True))
+            continue
+        match = _BOUND_RE.search(bound)
+        if not match:
+            continue
+        result.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2)), False))
+    return result
+
+
+def convert_to_partitioned(conn, model):
+    """
+    Переводит обычную таблицу журнала в секционированную без копирования данных:
+    старая таблица переименовывается и подключается секцией (MINVALUE .. конец последнего месяца с данными).
+    """
+    table = model.__tablename__
+    legacy = f"{table}_legacy"
+
+    conn.execute(text(f'UPDATE "{table}" SET "timestamp" = "createDateTime" WHERE "timestamp" IS NULL'))
+    max_ts = conn.execute(text(f'SELECT max("timestamp") FROM "{table}"')).scalar()
+
+    conn.execute(text(f'ALTER TABLE "{table}" RENAME TO "{legacy}"'))
+    # Секция не может иметь свой первичный ключ — его заменит ключ (id, timestamp) родителя
+    primary_key = conn.execute(
+        text("SELECT conname FROM pg_constraint WHERE conrelid = CAST(:t AS regclass) AND contype = 'p'"),
+        {"t": legacy},
+    ).scalar()
+    if primary_key:
+        conn.execute(text(f'ALTER TABLE "{legacy}" DROP CONSTRAINT "{primary_key}"'))
+    # Имена индексов уникальны в схеме — освобождаем их для новой таблицы
+    indexes = conn.execute(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = :t AND schemaname = current_schema()"),
+        {"t": legacy},
+    ).scalars().all()
+    for index in indexes:
+        conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index}_legacy"'))
+
+    model.__table__.create(conn, checkfirst=True)
+
+    # Автоинкрементный id (loading_status_logs) продолжает нумерацию старой таблицы
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": table}).scalar()
+    if sequence:
+        conn.execute(
+            text(f"SELECT setval(:s, COALESCE((SELECT max(id) FROM \"{legacy}\"), 0) + 1, false)"),
+            {"s": sequence},
+        )
+
+    upper = _add_months(_month_start(max_ts.date() if max_ts else date.today()), 1)
+    conn.execute(text(f'ALTER TABLE "{legacy}" ALTER COLUMN "timestamp" SET NOT NULL'))
+    conn.execute(
+        text(f"ALTER TABLE \"{table}\" ATTACH PARTITION \"{legacy}\" FOR VALUES FROM (MINVALUE) TO ('{upper.isoformat()}')")
+    )
+    print(f"Таблица {table} переведена на секционирование, старые данные в секции {legacy}")
+
+
+def ensure_partitions(conn, model, months_ahead: int = MONTHS_AHEAD):
+    """Создаёт месячные секции с текущего месяца на months_ahead вперёд и секцию DEFAULT."""
+    table = model.__tablename__
+    partitions = _partitions(conn, table)
+
+    default = next((name for name, _, _, is_default in partitions if is_default), None)
+    if default is None:
+        default = f"{table}_default"
+        conn.execute(text(f'CREATE TABLE "{default}" PARTITION OF "{table}" DEFAULT'))
+
+    ranges = [(lo, hi) for _, lo, hi, is_default in partitions if not is_default]
+    current = _month_start(date.today())
+
+    for offset in range(months_ahead + 1):
+        lo = _add_months(current, offset)
+        hi = _add_months(lo, 1)
+        overlaps = any((r_lo is None or r_lo < hi) and (r_hi is None or lo < r_hi) for r_lo, r_hi in ranges)
+        if overlaps:
+            continue
+
+        name = _partition_name(table, lo)
+        # Строки за этот месяц могли попасть в DEFAULT — переносим их, иначе ATTACH не пройдёт
+        conn.execute(text(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+        params = {"lo": lo, "hi": hi}
+        conn.execute(
+            text(f'INSERT INTO "{name}" SELECT * FROM "{default}" WHERE "timestamp" >= :lo AND "timestamp" < :hi'),
+            params,
+        )
+        conn.execute(text(f'DELETE FROM "{default}" WHERE "timestamp" >= :lo AND "timestamp" < :hi'), params)
+        conn.execute(
+            text(f"ALTER TABLE \"{table}\" ATTACH PARTITION \"{name}\" FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')")
+        )
+        ranges.append((lo, hi))
+
+
+def apply_retention(conn, model, months: int | None):
+    """Отсоединяет секции, целиком лежащие раньше срока хранения."""
+    if months is None:
+        return
+
+    table = model.__tablename__
+    cutoff = _add_months(_month_start(date.today()), -months)
+
+    for name, _, hi, is_default in _partitions(conn, table):
+        if is_default or hi is None or hi > cutoff:
+            continue
+
+        conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+        if RETENTION_MODE == "drop":
+            conn.execute(text(f'DROP TABLE "{name}"'))
+            print(f"Секция {name} удалена по сроку хранения")
+        else:
+            conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{ARCHIVE_SCHEMA}"'))
+            conn.execute(text(f'ALTER TABLE "{name}" SET SCHEMA "{ARCHIVE_SCHEMA}"'))
+            print(f"Секция {name} перенесена в схему {ARCHIVE_SCHEMA}")
+
+
+def maintain_partitions():
+    for model in PARTITIONED_MODELS:
+        table = model.__tablename__
+        try:
+            with sync_engine.begin() as conn:
+                kind = _relkind(conn, table)
+                if kind is None:
+                    continue
+                if kind == "r":
+                    convert_to_partitioned(conn, model)
+                ensure_partitions(conn, model)
+                apply_retention(conn, model, RETENTION_MONTHS.get(table))
+        except Exception as e:
+            print(f"Ошибка обслуживания секций {table}: {e}")
+
+
+async def run_partition_maintenance():
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
+        await asyncio.to_thread(maintain_partitions)
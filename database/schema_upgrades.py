@@ -0,0 +1,63 @@
+from sqlalchemy import text
+from .database_app import sync_engine
+
+# Доводка схемы существующей базы до моделей: create_all создаёт только недостающие таблицы
+# и не меняет уже созданные. Каждая команда идемпотентна (IF NOT EXISTS / IF EXISTS),
+# поэтому выполняется при каждом старте до приёма запросов; на актуальной базе это несколько
+# проверок каталога. Индекс по большой таблице строится один раз и на это время блокирует запись
+# в неё. Новые колонки — с DEFAULT-константой: PostgreSQL 11+ добавляет их без
+# перезаписи таблицы. Значения колонок текущего статуса заполняет сверка статусов
+# (database/status_tracking.py): без отметки прошлой сверки она проходит все строки.
+# Журналы (logs, *_status_logs) доводит database/partitions.py.
+
+UPGRADE_SQL = [
+    # Текущий статус точек и погрузок, счётчики точек маршрута
+    "ALTER TABLE route_points ADD COLUMN IF NOT EXISTS current_status routepointstatusenum",
+    "ALTER TABLE route_points ADD COLUMN IF NOT EXISTS current_status_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE route_points ADD COLUMN IF NOT EXISTS status_changes_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE loadings ADD COLUMN IF NOT EXISTS current_status routepointstatusenum",
+    "ALTER TABLE loadings ADD COLUMN IF NOT EXISTS current_status_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE loadings ADD COLUMN IF NOT EXISTS status_changes_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE route_plans ADD COLUMN IF NOT EXISTS points_completed INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE route_plans ADD COLUMN IF NOT EXISTS points_in_progress INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE route_plans ADD COLUMN IF NOT EXISTS points_skipped INTEGER NOT NULL DEFAULT 0",
+    # Маршруты за период (дневные агрегаты, статистика)
+    "CREATE INDEX IF NOT EXISTS ix_route_plans_date ON route_plans (date)",
+    # Точки маршрута в порядке прибытия — время в пути между точками
+    "CREATE INDEX IF NOT EXISTS ix_route_points_route_plan_id_arrival_time ON route_points (route_plan_id, arrival_time)",
+    # Оплата точек со статусом в дневных агрегатах: агрегаты без неё пересобираются целиком —
+    # отметка сборки сбрасывается до добавления колонки
+    """
+    DELETE FROM maintenance_watermarks
+    WHERE name = 'daily_stats_backfill'
+      AND NOT EXISTS (
+          SELECT 1 FROM information_schema.columns
+          WHERE table_schema = current_schema() AND table_name = 'vehicle_daily_stats'
+            AND column_name = 'payment_with_status_sum'
+      )
+    """,
+    *(
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS payment_with_status_sum DOUBLE PRECISION NOT NULL DEFAULT 0"
+        for table in ("driver_daily_stats", "vehicle_daily_stats", "store_daily_stats")
+    ),
+    # Ключ постраничной выдачи списков (pagination.py); индексы по changeDateTime от прежнего ключа не нужны
+    *(
+        sql
+        for table in ("users", "route_plans", "addresses", "stores", "route_points", "loading_places")
+        for sql in (
+            f'CREATE INDEX IF NOT EXISTS ix_{table}_create_date_time_id ON {table} ("createDateTime", id)',
+            f"DROP INDEX IF EXISTS ix_{table}_change_date_time_id",
+        )
+    ),
+]
+
+
+def upgrade_schema():
+    """Добавляет в существующие таблицы колонки и индексы, появившиеся в моделях. Одна транзакция."""
+    try:
+        with sync_engine.begin() as conn:
+            for sql in UPGRADE_SQL:
+                conn.execute(text(sql))
+    except Exception as e:
+        print(f"Ошибка обновления схемы базы: {e}")
+        raise
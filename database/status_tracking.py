@@ -0,0 +1,290 @@
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import DateTime, Integer, case, cast, func, insert, literal, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from .daily_stats import mark_routes_changed, queue_daily_stats_refresh
+from .database_app import sync_engine
+from .watermarks import read_watermark, write_watermark
+from fleet import note_position
+from live import publish, status_event
+from models import Loading, LoadingStatusLog, RoutePlan, RoutePoint, RoutePointStatusEnum, RoutePointStatusLog
+
+# Текущий статус точек и погрузок хранится прямо в строке (current_status, current_status_at,
+# status_changes_count) и обновляется в той же транзакции, что и запись в журнал.
+# Журнал остаётся источником истины: repair_status_fields пересобирает поля из него.
+
+IN_PROGRESS_STATUSES = (RoutePointStatusEnum.en_route, RoutePointStatusEnum.arrived)
+
+# Интервал фоновой сверки полей с журналами
+REPAIR_INTERVAL_SECONDS = 24 * 60 * 60
+# Отметка сверки: время начала прошлой сверки
+REPAIR_WATERMARK = "status_repair"
+# Запас к отметке: createDateTime пишет приложение (utcnow), а транзакции, начатые до прошлой
+# сверки, могли закоммитить журнал уже после неё
+REPAIR_SLACK = timedelta(days=1)
+
+
+def _current_status_values(model, status: RoutePointStatusEnum, timestamp: datetime) -> dict:
+    """
+    Значения для UPDATE: статус меняется, только если событие не старше уже записанного —
+    запоздавшая запись из офлайна попадёт в журнал, но не перетрёт более свежий статус.
+    """
+    is_newer = or_(model.current_status_at.is_(None), model.current_status_at <= timestamp)
+    new_status = case((is_newer, literal(status, model.current_status.type)), else_=model.current_status)
+    return {
+        "current_status": new_status,
+        "status": new_status,
+        "current_status_at": func.greatest(func.coalesce(model.current_status_at, timestamp), timestamp),
+        "status_changes_count": model.status_changes_count + 1,
+    }
+
+
+async def recount_route_plan(db: AsyncSession, route_plan_id):
+    """Пересчитывает счётчики статусов маршрута по его точкам."""
+    counts = (
+        select(
+            func.count().filter(RoutePoint.current_status == RoutePointStatusEnum.completed).label("completed"),
+            func.count().filter(RoutePoint.current_status.in_(IN_PROGRESS_STATUSES)).label("in_progress"),
+            func.count().filter(RoutePoint.current_status == RoutePointStatusEnum.skipped).label("skipped"),
+        )
+        .where(RoutePoint.route_plan_id == route_plan_id)
+    ).subquery()
+
+    await db.execute(
+        update(RoutePlan)
+        .where(RoutePlan.id == route_plan_id)
+        .values(
+            points_completed=counts.c.completed,
+            points_in_progress=counts.c.in_progress,
+            points_skipped=counts.c.skipped,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _minutes_since_arrival(timestamp: datetime):
+    moment = literal(timestamp, DateTime(timezone=True))
+    return cast(func.round(func.extract("epoch", moment - func.coalesce(RoutePoint.arrival_time, moment)) / 60), Integer)
+
+
+async def apply_point_status(
+    db: AsyncSession,
+    point: RoutePoint,
+    status: RoutePointStatusEnum,
+    timestamp: datetime,
+    latitude: float | None = None,
+    longitude: float | None = None,
+    note: str | None = None,
+) -> RoutePoint:
+    """Пишет статус точки в журнал и обновляет её текущий статус и счётчики маршрута. Не коммитит."""
+    # Блокируем маршрут: параллельные смены статусов его точек пересчитывают счётчики по очереди
+    vehicle_id = await db.scalar(
+        select(RoutePlan.vehicle_id).where(RoutePlan.id == point.route_plan_id).with_for_update()
+    )
+    note_position(db, vehicle_id, latitude, longitude, status, timestamp, "point")
+
+    await db.execute(
+        insert(RoutePointStatusLog).values(
+            point_id=point.id,
+            status=status,
+            timestamp=timestamp,
+            latitude=latitude,
+            longitude=longitude,
+            note=note,
+        )
+    )
+
+    values = _current_status_values(RoutePoint, status, timestamp)
+    if status in (RoutePointStatusEnum.arrived, RoutePointStatusEnum.completed):
+        values["arrival_time"] = func.coalesce(RoutePoint.arrival_time, timestamp)
+    if status == RoutePointStatusEnum.completed:
+        values["departure_time"] = timestamp
+        values["duration_minutes"] = _minutes_since_arrival(timestamp)
+
+    result = await db.execute(
+        update(RoutePoint)
+        .where(RoutePoint.id == point.id)
+        .values(**values)
+        .returning(RoutePoint)
+        .execution_options(populate_existing=True)
+    )
+    point = result.scalar_one()
+    # Без координат отметки событие привязывается к самой точке — чтобы попасть в подписку по области
+    await publish(db, status_event(
+        "point_status", point.id, point.route_plan_id, vehicle_id, status,
+        point.latitude if latitude is None else latitude, point.longitude if longitude is None else longitude, timestamp,
+    ))
+
+    await recount_route_plan(db, point.route_plan_id)
+    queue_daily_stats_refresh(db, [point.route_plan_id])
+    return point
+
+
+async def apply_point_departure(db: AsyncSession, point_id, timestamp: datetime) -> RoutePoint | None:
+    """
+    Убытие с точки без смены статуса (машина покинула геозону): время убытия и на точке.
+    Только для точки, где есть прибытие и ещё нет убытия; иначе None. Не коммитит.
+    """
+    result = await db.execute(
+        update(RoutePoint)
+        .where(
+            RoutePoint.id == point_id,
+            RoutePoint.arrival_time.isnot(None),
+            RoutePoint.arrival_time <= timestamp,
+            RoutePoint.departure_time.is_(None),
+        )
+        .values(departure_time=timestamp, duration_minutes=_minutes_since_arrival(timestamp))
+        .returning(RoutePoint)
+        .execution_options(populate_existing=True)
+    )
+    point = result.scalar_one_or_none()
+    if point is not None:
+        queue_daily_stats_refresh(db, [point.route_plan_id])
+    return point
+
+
+async def apply_loading_status(
+    db: AsyncSession,
+    loading: Loading,
+    status: RoutePointStatusEnum,
+    timestamp: datetime,
+    latitude: float | None = None,
+    longitude: float | None = None,
+    note: str | None = None,
+    extra_values: dict | None = None,
+) -> Loading:
+    """Пишет статус погрузки в журнал и обновляет её текущий статус (и extra_values). Не коммитит."""
+    await mark_routes_changed(db, [loading.route_plan_id])
+    vehicle_id = await db.scalar(select(RoutePlan.vehicle_id).where(RoutePlan.id == loading.route_plan_id))
+    note_position(db, vehicle_id, latitude, longitude, status, timestamp, "loading")
+    await publish(db, status_event(
+        "loading_status", loading.id, loading.route_plan_id, vehicle_id, status, latitude, longitude, timestamp
+    ))
+    await db.execute(
+        insert(LoadingStatusLog).values(
+            loading_id=loading.id,
+            status=status,
+            timestamp=timestamp,
+            latitude=latitude,
+            longitude=longitude,
+            note=note,
+        )
+    )
+
+    result = await db.execute(
+        update(Loading)
+        .where(Loading.id == loading.id)
+        .values(**_current_status_values(Loading, status, timestamp), **(extra_values or {}))
+        .returning(Loading)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one()
+
+
+# ===================== Сверка с журналами =====================
+# Сверяются только строки, чьи журналы или сами строки менялись с прошлой сверки (:since);
+# без отметки (:since IS NULL) — все строки.
+_REPAIR_SQL = [
+    # Последний статус и число записей — один проход по журналу на таблицу
+    """
+    UPDATE route_points p
+    SET current_status = l.status, status = l.status,
+        current_status_at = l.last_at, status_changes_count = l.changes
+    FROM (
+        SELECT point_id,
+               (array_agg(status ORDER BY "timestamp" DESC))[1] AS status,
+               max("timestamp") AS last_at,
+               count(*) AS changes
+        FROM route_point_status_logs
+        WHERE CAST(:since AS timestamptz) IS NULL
+           OR point_id IN (SELECT point_id FROM route_point_status_logs WHERE "createDateTime" >= :since)
+        GROUP BY point_id
+    ) l
+    WHERE p.id = l.point_id
+      AND (p.current_status IS DISTINCT FROM l.status
+           OR p.current_status_at IS DISTINCT FROM l.last_at
+           OR p.status_changes_count <> l.changes)
+    """,
+    """
+    UPDATE route_points p
+    SET current_status = NULL, current_status_at = NULL, status_changes_count = 0
+    WHERE (p.current_status IS NOT NULL OR p.status_changes_count <> 0)
+      AND (CAST(:since AS timestamptz) IS NULL OR p."changeDateTime" >= :since)
+      AND NOT EXISTS (SELECT 1 FROM route_point_status_logs l WHERE l.point_id = p.id)
+    """,
+    """
+    UPDATE loadings g
+    SET current_status = l.status, status = l.status,
+        current_status_at = l.last_at, status_changes_count = l.changes
+    FROM (
+        SELECT loading_id,
+               (array_agg(status ORDER BY "timestamp" DESC))[1] AS status,
+               max("timestamp") AS last_at,
+               count(*) AS changes
+        FROM loading_status_logs
+        WHERE CAST(:since AS timestamptz) IS NULL
+           OR loading_id IN (SELECT loading_id FROM loading_status_logs WHERE "createDateTime" >= :since)
+        GROUP BY loading_id
+    ) l
+    WHERE g.id = l.loading_id
+      AND (g.current_status IS DISTINCT FROM l.status
+           OR g.current_status_at IS DISTINCT FROM l.last_at
+           OR g.status_changes_count <> l.changes)
+    """,
+    """
+    UPDATE loadings g
+    SET current_status = NULL, current_status_at = NULL, status_changes_count = 0
+    WHERE (g.current_status IS NOT NULL OR g.status_changes_count <> 0)
+      AND (CAST(:since AS timestamptz) IS NULL OR g."changeDateTime" >= :since)
+      AND NOT EXISTS (SELECT 1 FROM loading_status_logs l WHERE l.loading_id = g.id)
+    """,
+    """
+    UPDATE route_plans r
+    SET points_completed = c.completed, points_in_progress = c.in_progress, points_skipped = c.skipped
+    FROM (
+        SELECT r2.id,
+               count(p.id) FILTER (WHERE p.current_status = 'completed') AS completed,
+               count(p.id) FILTER (WHERE p.current_status IN ('en_route', 'arrived')) AS in_progress,
+               count(p.id) FILTER (WHERE p.current_status = 'skipped') AS skipped
+        FROM route_plans r2
+        LEFT JOIN route_points p ON p.route_plan_id = r2.id
+        WHERE CAST(:since AS timestamptz) IS NULL
+           OR r2."changeDateTime" >= :since
+           OR r2.id IN (SELECT route_plan_id FROM route_points WHERE "changeDateTime" >= :since)
+           OR r2.id IN (
+               SELECT p3.route_plan_id FROM route_points p3
+               JOIN route_point_status_logs l3 ON l3.point_id = p3.id
+               WHERE l3."createDateTime" >= :since
+           )
+        GROUP BY r2.id
+    ) c
+    WHERE r.id = c.id
+      AND (r.points_completed, r.points_in_progress, r.points_skipped)
+          IS DISTINCT FROM (c.completed, c.in_progress, c.skipped)
+    """,
+]
+
+
+def repair_status_fields(full: bool = False):
+    """
+    Пересобирает текущие статусы и счётчики из журналов; исправляет только расходящиеся строки.
+    Сверяет изменённое с прошлой сверки (отметка REPAIR_WATERMARK), full или без отметки — всё.
+    """
+    try:
+        with sync_engine.begin() as conn:
+            started_at = conn.execute(select(func.now())).scalar()
+            mark = None if full else read_watermark(conn, REPAIR_WATERMARK)
+            since = mark.at - REPAIR_SLACK if mark and mark.at else None
+            fixed = [conn.execute(text(sql), {"since": since}).rowcount for sql in _REPAIR_SQL]
+            write_watermark(conn, REPAIR_WATERMARK, at=started_at)
+        if any(fixed):
+            print(f"Сверка статусов: исправлено строк {fixed}")
+    except Exception as e:
+        print(f"Ошибка сверки статусов: {e}")
+
+
+async def run_status_repair():
+    # Первая сверка — сразу после старта, в фоне: приём запросов её не ждёт
+    while True:
+        await asyncio.to_thread(repair_status_fields)
+        await asyncio.sleep(REPAIR_INTERVAL_SECONDS)
@@ -0,0 +1,21 @@
+from datetime import date, datetime
+from sqlalchemy import Row, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models import MaintenanceWatermark
+
+# Докуда фоновая задача дошла (maintenance_watermarks): пересборка продолжается с отметки,
+# а не начинается заново и не считается законченной по одному наличию строк.
+# Отметка пишется в той же транзакции, что и обработанный кусок, — упавшая задача её не сдвигает.
+
+
+def read_watermark(conn, name: str) -> Row | None:
+    return conn.execute(select(MaintenanceWatermark).where(MaintenanceWatermark.name == name)).first()
+
+
+def write_watermark(conn, name: str, day: date | None = None, at: datetime | None = None):
+    values = {"name": name, "day": day, "at": at}
+    statement = pg_insert(MaintenanceWatermark).values(**values)
+    conn.execute(statement.on_conflict_do_update(
+        index_elements=[MaintenanceWatermark.name],
+        set_={"day": statement.excluded.day, "at": statement.excluded.at, "changeDateTime": func.now()},
+    ))
@@ -0,0 +1,199 @@
+import asyncio
+import time
+from contextlib import suppress
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database_app import async_engine
+from .mileage import mark_mileage_changed
+from fleet import fleet_positions
+from geofence import geofence_index
+from live import publish_fixes
+from metrics import WRITE_BUFFER_FLUSH_DURATION, WRITE_BUFFER_PENDING, WRITE_BUFFER_ROWS
+from models import LogEntry
+
+# Отложенная запись телеметрии (write-behind): строки копятся в памяти процесса
+# и уходят в базу одним executemany и одним коммитом раз в FLUSH_INTERVAL_SECONDS
+# или по FLUSH_ROWS строк — что наступит раньше. Запрос получает ответ сразу после
+# постановки строки в очередь и не держит соединение из пула.
+# Очередь ограничена MAX_PENDING_ROWS: при переполнении запись ждёт сброса (backpressure),
+# а если база не успевает дольше ENQUEUE_TIMEOUT_SECONDS — вызывающий получает BufferFull.
+# Строки в очереди теряются только при аварийном завершении процесса; при штатной
+# остановке close() дописывает всё, что осталось.
+# Пачка коммитится сама по себе, дополнительная работа (on_flush) идёт после — в своей транзакции:
+# её ошибка попадает в лог, но записанные строки остаются в базе.
+#
+# С tail_key буфер помнит самую свежую (по tail_order) ещё не записанную строку каждого ключа —
+# входной фильтр повторов сравнивает новые отметки машины и с ней (pending_tail), а не только
+# с записанной: иначе за интервал сброса повторы болтливого устройства прошли бы все.
+#
+# Журналы статусов точек сюда не идут: вместе с записью в журнал в той же транзакции
+# обновляются текущий статус точки и дневные агрегаты (database/status_tracking.py).
+
+FLUSH_INTERVAL_SECONDS = 0.2
+FLUSH_ROWS = 1000
+MAX_PENDING_ROWS = 50_000
+ENQUEUE_TIMEOUT_SECONDS = 5
+# Неудачный сброс повторяется; после последней попытки пачка отбрасывается,
+# чтобы одна битая строка не остановила запись остальных
+FLUSH_RETRIES = 3
+RETRY_DELAY_SECONDS = 1
+
+
+class BufferFull(Exception):
+    """Очередь заполнена или закрыта — строку нужно записать напрямую или повторить позже."""
+
+
+class WriteBuffer:
+    def __init__(self, model, flush_rows: int = FLUSH_ROWS, flush_interval: float = FLUSH_INTERVAL_SECONDS,
+                 max_pending: int = MAX_PENDING_ROWS, on_flush=None, tail_key: str | None = None,
+                 tail_order: str | None = None):
+        """
+        on_flush(session, rows) — дополнительная работа над записанной пачкой в отдельной транзакции.
+        tail_key, tail_order — колонки ключа и порядка для pending_tail.
+        """
+        self.model = model
+        self.table = model.__tablename__
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.on_flush = on_flush
+        self.tail_key = tail_key
+        self.tail_order = tail_order
+        self._tails: dict = {}
+        self._queue: asyncio.Queue | None = None
+        self._arrived: asyncio.Event | None = None  # в очереди появились строки
+        self._ready: asyncio.Event | None = None  # набралась пачка или идёт остановка
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    def start(self):
+        """Запускает сброс в текущем цикле событий; вызывается при старте приложения или первой строкой."""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._arrived, self._ready = asyncio.Event(), asyncio.Event()
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def add(self, **values):
+        """
+        Ставит строку в очередь. Значения по умолчанию колонок подставит INSERT при сбросе,
+        поэтому время события и id, нужные в ответе, передаются явно.
+        """
+        if self._closing:
+            raise BufferFull(self.table)
+        self.start()
+        try:
+            self._queue.put_nowait(values)
+        except asyncio.QueueFull:
+            WRITE_BUFFER_ROWS.inc(table=self.table, result="waited")
+            try:
+                await asyncio.wait_for(self._queue.put(values), ENQUEUE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                WRITE_BUFFER_ROWS.inc(table=self.table, result="rejected")
+                raise BufferFull(self.table)
+
+        if self.tail_key:
+            self._remember_tail(values)
+        WRITE_BUFFER_ROWS.inc(table=self.table, result="queued")
+        WRITE_BUFFER_PENDING.set(self._queue.qsize(), table=self.table)
+        self._arrived.set()
+        if self._queue.qsize() >= self.flush_rows:
+            self._ready.set()
+
+    async def add_many(self, rows: list[dict]):
+        for values in rows:
+            await self.add(**values)
+
+    def pending_tail(self, key) -> dict | None:
+        """Самая свежая строка ключа, стоящая в очереди или в записываемой пачке; None — всё записано."""
+        return self._tails.get(key)
+
+    def _remember_tail(self, values: dict):
+        current = self._tails.get(values[self.tail_key])
+        if current is None or current[self.tail_order] <= values[self.tail_order]:
+            self._tails[values[self.tail_key]] = values
+
+    def _forget_tails(self, rows: list[dict]):
+        # Строка ключа могла смениться более свежей, ещё не записанной, — её не трогаем
+        for values in rows:
+            if self._tails.get(values[self.tail_key]) is values:
+                del self._tails[values[self.tail_key]]
+
+    async def close(self):
+        """Перестаёт принимать строки и дописывает очередь в базу."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._arrived.set()
+        self._ready.set()
+        await self._task
+        self._task = None
+        self._closing = False
+
+    async def _run(self):
+        while not (self._closing and self._queue.empty()):
+            if self._queue.empty():
+                self._arrived.clear()
+                await self._arrived.wait()
+                continue
+
+            # Первая строка уже есть — ждём, пока наберётся пачка, но не дольше интервала
+            self._ready.clear()
+            if self._queue.qsize() < self.flush_rows and not self._closing:
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._ready.wait(), self.flush_interval)
+
+            rows = [self._queue.get_nowait() for _ in range(min(self.flush_rows, self._queue.qsize()))]
+            WRITE_BUFFER_PENDING.set(self._queue.qsize(), table=self.table)
+            await self._flush(rows)
+
+    async def _flush(self, rows: list[dict]):
+        try:
+            await self._write(rows)
+        finally:
+            if self.tail_key:
+                self._forget_tails(rows)
+
+    async def _write(self, rows: list[dict]):
+        for attempt in range(1, FLUSH_RETRIES + 1):
+            started = time.perf_counter()
+            try:
+                async with AsyncSession(async_engine) as session:
+                    await session.execute(insert(self.model), rows)
+                    await session.commit()
+            except Exception as e:
+                print(f"Ошибка записи буфера {self.table} ({len(rows)} строк), попытка {attempt}: {e}")
+                if attempt < FLUSH_RETRIES and not self._closing:
+                    await asyncio.sleep(RETRY_DELAY_SECONDS)
+                    continue
+                WRITE_BUFFER_ROWS.inc(len(rows), table=self.table, result="dropped")
+                return
+            WRITE_BUFFER_FLUSH_DURATION.observe(time.perf_counter() - started, table=self.table)
+            WRITE_BUFFER_ROWS.inc(len(rows), table=self.table, result="written")
+            await self._after_flush(rows)
+            return
+
+    async def _after_flush(self, rows: list[dict]):
+        if not self.on_flush:
+            return
+        try:
+            async with AsyncSession(async_engine) as session:
+                await self.on_flush(session, rows)
+                await session.commit()
+        except Exception as e:
+            WRITE_BUFFER_ROWS.inc(len(rows), table=self.table, result="hook_failed")
+            print(f"Ошибка обработки записанной пачки {self.table} ({len(rows)} строк): {e}")
+
+
+async def _after_log_flush(session, rows: list[dict]):
+    # Строки уже в базе — теперь они видны на карте и входному фильтру повторов
+    for row in rows:
+        fleet_positions.update(row["vehicle_id"], row["latitude"], row["longitude"], row["status"], row["timestamp"])
+        fleet_positions.remember_log(row)
+    # Живая лента, пересчёт пробега и проверка геозон
+    mark_mileage_changed(session, ((row["vehicle_id"], row["timestamp"]) for row in rows))
+    await publish_fixes(session, rows)
+    await geofence_index.check_rows(session, rows)
+
+
+log_buffer = WriteBuffer(LogEntry, on_flush=_after_log_flush, tail_key="vehicle_id", tail_order="timestamp")
@@ -0,0 +1,33 @@
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Запись за один запрос: INSERT/UPDATE ... RETURNING сразу возвращает объект,
+# поэтому после commit не нужен refresh (сессии открываются с expire_on_commit=False).
+# Функции не коммитят — зависимые вставки группируются в одну транзакцию вызывающим кодом.
+# options — опции загрузки связей (selectinload) для возвращаемого объекта;
+# db, model и id только позиционные: у Vehicle есть колонка model.
+
+
+async def insert_returning(db: AsyncSession, model, /, options: tuple = (), **values):
+    result = await db.execute(insert(model).values(**values).returning(model).options(*options))
+    return result.scalar_one()
+
+
+async def insert_many_returning(db: AsyncSession, model, rows: list[dict]) -> list:
+    if not rows:
+        return []
+    result = await db.scalars(insert(model).returning(model), rows)
+    return result.all()
+
+
+async def update_returning(db: AsyncSession, model, object_id, /, options: tuple = (), **values):
+    """UPDATE по id; None, если строки нет. changeDateTime обновляется через onupdate."""
+    result = await db.execute(
+        update(model)
+        .where(model.id == object_id)
+        .values(**values)
+        .returning(model)
+        .options(*options)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one_or_none()
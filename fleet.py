@@ -0,0 +1,140 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from enum import Enum
+from uuid import UUID
+from sqlalchemy import event, select, true
+from sqlalchemy.orm import Session
+from database.database_app import sync_engine
+from models import LogEntry, Vehicle
+
+# Последнее известное положение машин в памяти процесса — для живой карты диспетчера.
+# Обновляется при записи GPS-логов и статусов точек/погрузок с координатами (после коммита),
+# при старте собирается из logs одним запросом. Чтение карты не ходит в базу.
+# Хранилище своё у каждого процесса: приложение запускается одним процессом uvicorn.
+# Здесь же последний записанный GPS-лог машины — с ним входной фильтр сравнивает новые отметки
+# (ingest_filter.py), не обращаясь к базе.
+
+# Ключ в Session.info: положения, записанные в транзакции, применяются после коммита
+PENDING_POSITIONS_KEY = "fleet_positions"
+PENDING_LOGS_KEY = "fleet_last_logs"
+
+LOG_FIELDS = ("id", "vehicle_id", "status", "latitude", "longitude", "timestamp", "createDateTime", "changeDateTime")
+
+
+@dataclass
+class Position:
+    vehicle_id: UUID
+    latitude: float
+    longitude: float
+    status: str | None
+    timestamp: datetime
+    source: str  # gps — лог машины, point — статус точки, loading — статус погрузки
+    updated_at: datetime  # когда положение попало в хранилище — по нему считается since
+
+
+class FleetPositions:
+    def __init__(self):
+        self._positions: dict[UUID, Position] = {}
+        self._last_logs: dict[UUID, dict] = {}  # последний лог машины, в том числе без координат
+
+    def update(self, vehicle_id: UUID, latitude: float | None, longitude: float | None, status,
+               timestamp: datetime, source: str = "gps") -> bool:
+        """Запоминает отметку, если она новее известной; отметки без координат пропускаются."""
+        if vehicle_id is None or latitude is None or longitude is None or timestamp is None:
+            return False
+        timestamp = _aware(timestamp)
+        current = self._positions.get(vehicle_id)
+        # Пачки, накопленные без связи, приходят с опозданием — старое положение не затирает новое
+        if current and current.timestamp >= timestamp:
+            return False
+        if isinstance(status, Enum):
+            status = status.value
+        self._positions[vehicle_id] = Position(
+            vehicle_id, latitude, longitude, status, timestamp, source, datetime.now(timezone.utc)
+        )
+        return True
+
+    def remember_log(self, row: dict):
+        """Запоминает строку logs как последнюю записанную, если она новее известной."""
+        current = self._last_logs.get(row["vehicle_id"])
+        if current is None or _aware(current["timestamp"]) <= _aware(row["timestamp"]):
+            self._last_logs[row["vehicle_id"]] = {key: row[key] for key in LOG_FIELDS}
+
+    def last_log(self, vehicle_id: UUID) -> dict | None:
+        return self._last_logs.get(vehicle_id)
+
+    def rebuild(self):
+        """Последний GPS-лог каждой машины: по одному чтению индекса (vehicle_id, timestamp) на машину."""
+        latest = (
+            select(LogEntry.latitude, LogEntry.longitude, LogEntry.status, LogEntry.timestamp)
+            .where(LogEntry.vehicle_id == Vehicle.id, LogEntry.latitude.isnot(None), LogEntry.longitude.isnot(None))
+            .order_by(LogEntry.timestamp.desc())
+            .limit(1)
+            .lateral()
+        )
+        last_log = (
+            select(*(getattr(LogEntry, key) for key in LOG_FIELDS))
+            .where(LogEntry.vehicle_id == Vehicle.id)
+            .order_by(LogEntry.timestamp.desc())
+            .limit(1)
+            .lateral()
+        )
+        with sync_engine.connect() as conn:
+            rows = conn.execute(select(Vehicle.id, latest).join(latest, true())).all()
+            last_logs = conn.execute(select(last_log).select_from(Vehicle).join(last_log, true())).mappings().all()
+        self._positions.clear()
+        for vehicle_id, latitude, longitude, status, timestamp in rows:
+            self.update(vehicle_id, latitude, longitude, status, timestamp)
+        self._last_logs = {row["vehicle_id"]: dict(row) for row in last_logs}
+
+    def positions(self, bbox: tuple | None = None, since: datetime | None = None) -> list[dict]:
+        """
+        Положения машин; bbox — (min_lat, min_lon, max_lat, max_lon), since — только попавшие в хранилище позже:
+        отметка с устройства приходит с задержкой, поэтому сравнивается время получения, а не фиксации.
+        """
+        if since and since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        items = []
+        for position in self._positions.values():
+            if since and position.updated_at <= since:
+                continue
+            if bbox and not (bbox[0] <= position.latitude <= bbox[2] and bbox[1] <= position.longitude <= bbox[3]):
+                continue
+            items.append(asdict(position))
+        return items
+
+
+def _aware(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)  # время без пояса в приложении — utcnow()
+    return timestamp
+
+
+fleet_positions = FleetPositions()
+
+
+def note_position(db, vehicle_id: UUID, latitude: float | None, longitude: float | None, status,
+                  timestamp: datetime, source: str = "gps"):
+    """Положение из транзакции; попадёт в хранилище после коммита."""
+    if latitude is not None and longitude is not None:
+        db.info.setdefault(PENDING_POSITIONS_KEY, []).append((vehicle_id, latitude, longitude, status, timestamp, source))
+
+
+def note_logs(db, rows: list[dict]):
+    """Записанные строки logs; последняя станет известной фильтру после коммита."""
+    if rows:
+        db.info.setdefault(PENDING_LOGS_KEY, []).append(max(rows, key=lambda row: _aware(row["timestamp"])))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session):
+    for values in session.info.pop(PENDING_POSITIONS_KEY, ()):
+        fleet_positions.update(*values)
+    for row in session.info.pop(PENDING_LOGS_KEY, ()):
+        fleet_positions.remember_log(row)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop(PENDING_POSITIONS_KEY, None)
+    session.info.pop(PENDING_LOGS_KEY, None)
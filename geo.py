@@ -0,0 +1,194 @@
+import heapq
+import numpy as np
+
+# Упрощение GPS-трека для карты. Координаты переводятся в метры локальной
+# равнопромежуточной проекцией (для трека в пределах города погрешность ничтожна),
+# дальше — Дугласа–Пекера по допуску в метрах и/или Висвалингама до заданного
+# числа точек. Вершины, где меняется статус машины, а также первая и последняя
+# точки сохраняются всегда: трек режется по ним на отрезки, которые упрощаются отдельно.
+# Пробег за день (track_mileage) считается гаверсинусом по массивам отметок целиком.
+
+METERS_PER_DEGREE = 111_320
+EARTH_RADIUS_M = 6_371_000
+
+# Пробег: отметка, до которой и от которой машина «едет» быстрее MAX_SPEED_KMH, — выброс GPS
+MAX_SPEED_KMH = 150
+OUTLIER_PASSES = 3
+# Медленнее — стоянка: дрожание координат на месте не идёт в пробег
+MOVING_SPEED_KMH = 3
+# Разрыв между отметками длиннее — связь пропала: расстояние считается, время не делится на движение и стоянку
+MAX_GAP_SECONDS = 10 * 60
+
+
+def to_meters(lat: np.ndarray, lon: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Локальные координаты в метрах относительно первой точки."""
+    x = (lon - lon[0]) * METERS_PER_DEGREE * np.cos(np.radians(lat[0]))
+    y = (lat - lat[0]) * METERS_PER_DEGREE
+    return x, y
+
+
+def status_vertices(status: np.ndarray) -> np.ndarray:
+    """Маска обязательных вершин: концы трека и точки смены статуса (первая точка с новым статусом)."""
+    locked = np.zeros(len(status), dtype=bool)
+    if len(status):
+        locked[[0, -1]] = True
+        locked[1:] |= status[1:] != status[:-1]
+    return locked
+
+
+def douglas_peucker(x: np.ndarray, y: np.ndarray, tolerance: float, locked: np.ndarray | None = None) -> np.ndarray:
+    """Маска оставленных точек: отклонение выброшенных от ломаной не больше tolerance."""
+    n = len(x)
+    keep = np.zeros(n, dtype=bool) if locked is None else locked.copy()
+    if n < 3:
+        keep[:] = True
+        return keep
+    keep[[0, -1]] = True
+
+    anchors = np.flatnonzero(keep)
+    stack = list(zip(anchors[:-1], anchors[1:]))
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        dx, dy = x[j] - x[i], y[j] - y[i]
+        px, py = x[i + 1:j] - x[i], y[i + 1:j] - y[i]
+        norm = np.hypot(dx, dy)
+        # Расстояние до прямой через концы отрезка; если концы совпали (стоянка) — до точки
+        distance = np.abs(dy * px - dx * py) / norm if norm > 0 else np.hypot(px, py)
+        k = int(np.argmax(distance))
+        if distance[k] > tolerance:
+            m = i + 1 + k
+            keep[m] = True
+            stack.extend(((i, m), (m, j)))
+    return keep
+
+
+def visvalingam(x: np.ndarray, y: np.ndarray, count: int, locked: np.ndarray | None = None) -> np.ndarray:
+    """
+    Маска из count точек (или всех обязательных, если их больше): по одной убирается точка
+    с наименьшей площадью треугольника с соседями.
+    """
+    n = len(x)
+    keep = np.ones(n, dtype=bool)
+    if n <= max(count, 2):
+        return keep
+    locked = np.zeros(n, dtype=bool) if locked is None else locked.copy()
+    locked[[0, -1]] = True
+
+    # Площади начальных треугольников — векторно, дальше цикл по куче на списках Python:
+    # поэлементный доступ к массивам NumPy в цикле в разы медленнее
+    inner = np.flatnonzero(~locked)
+    area = np.full(n, np.inf)
+    area[inner] = np.abs(
+        (x[inner] - x[inner - 1]) * (y[inner + 1] - y[inner - 1]) - (x[inner + 1] - x[inner - 1]) * (y[inner] - y[inner - 1])
+    ) / 2
+    heap = list(zip(area[inner].tolist(), inner.tolist()))
+    heapq.heapify(heap)
+
+    xs, ys, area, fixed = x.tolist(), y.tolist(), area.tolist(), locked.tolist()
+    prev, following = list(range(-1, n - 1)), list(range(1, n + 1))
+    removed = [False] * n
+    remaining = n
+    while remaining > count and heap:
+        value, i = heapq.heappop(heap)
+        if removed[i] or value != area[i]:
+            continue  # устаревшая запись кучи
+        removed[i] = True
+        remaining -= 1
+        p, q = prev[i], following[i]
+        following[p], prev[q] = q, p
+        for k in (p, q):
+            if not fixed[k]:
+                a, c = prev[k], following[k]
+                triangle = abs((xs[k] - xs[a]) * (ys[c] - ys[a]) - (xs[c] - xs[a]) * (ys[k] - ys[a])) / 2
+                # Площадь не меньше уже убранной — иначе соседи «проваливаются» раньше времени
+                area[k] = max(triangle, value)
+                heapq.heappush(heap, (area[k], k))
+
+    keep[np.array(removed)] = False
+    return keep
+
+
+def simplify_track(lat: np.ndarray, lon: np.ndarray, status: np.ndarray,
+                   tolerance_m: float | None = None, max_points: int | None = None) -> np.ndarray:
+    """Индексы оставленных точек трека по возрастанию."""
+    if len(lat) < 3:
+        return np.arange(len(lat))
+    x, y = to_meters(lat, lon)
+    locked = status_vertices(status)
+
+    keep = douglas_peucker(x, y, tolerance_m, locked) if tolerance_m else np.ones(len(x), dtype=bool)
+    indices = np.flatnonzero(keep)
+    if max_points and len(indices) > max_points:
+        indices = indices[visvalingam(x[indices], y[indices], max_points, locked[indices])]
+    return indices
+
+
+def haversine_m(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Расстояние по большому кругу в метрах, поэлементно по массивам градусов."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(h, 1)))
+
+
+def _segment_speeds(seconds: np.ndarray, lat: np.ndarray, lon: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    distance = haversine_m(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    duration = np.diff(seconds)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Две отметки в одну секунду в разных местах — бесконечная скорость, в одном месте — стоянка
+        speed = np.where(duration > 0, distance / duration * 3.6, np.where(distance > 0, np.inf, 0.0))
+    return distance, duration, speed
+
+
+def reject_outliers(seconds: np.ndarray, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    Маска принятых отметок: выброс — внутренняя точка, скорость к которой и от которой выше MAX_SPEED_KMH
+    («прыжок» туда и обратно). Убираются за несколько проходов — соседние выбросы маскируют друг друга.
+    Крайние отметки проверяются по одному отрезку: выброс, если соседний с ним отрезок нормальный.
+    """
+    keep = np.ones(len(seconds), dtype=bool)
+    for _ in range(OUTLIER_PASSES):
+        index = np.flatnonzero(keep)
+        if len(index) < 2:
+            break
+        _, _, speed = _segment_speeds(seconds[index], lat[index], lon[index])
+        fast = speed > MAX_SPEED_KMH
+        spikes = np.zeros(len(index), dtype=bool)
+        spikes[1:-1] = fast[:-1] & fast[1:]
+        spikes[0] = len(index) > 2 and fast[0] and not fast[1]
+        spikes[-1] = fast[-1] and (len(index) < 3 or not fast[-2])
+        if not spikes.any():
+            break
+        keep[index[spikes]] = False
+    return keep
+
+
+def track_mileage(seconds: np.ndarray, lat: np.ndarray, lon: np.ndarray) -> dict:
+    """
+    Пробег и время по отметкам одной машины, упорядоченным по времени (seconds — секунды эпохи):
+    distance_km — сумма отрезков движения, moving_seconds и idle_seconds — время в движении и на стоянке,
+    rejected_count — отброшенные выбросы, max_speed_kmh — по принятым отметкам.
+    """
+    keep = reject_outliers(seconds, lat, lon) if len(seconds) > 1 else np.ones(len(seconds), dtype=bool)
+    seconds, lat, lon = seconds[keep], lat[keep], lon[keep]
+    result = {
+        "distance_km": 0.0,
+        "moving_seconds": 0,
+        "idle_seconds": 0,
+        "fixes_count": int(len(seconds)),
+        "rejected_count": int((~keep).sum()),
+        "max_speed_kmh": None,
+    }
+    if len(seconds) < 2:
+        return result
+
+    distance, duration, speed = _segment_speeds(seconds, lat, lon)
+    moving = speed >= MOVING_SPEED_KMH
+    connected = duration <= MAX_GAP_SECONDS
+    result["distance_km"] = float(distance[moving].sum() / 1000)
+    result["moving_seconds"] = int(round(duration[moving & connected].sum()))
+    result["idle_seconds"] = int(round(duration[~moving & connected].sum()))
+    if (connected & (duration > 0)).any():
+        result["max_speed_kmh"] = float(speed[connected & (duration > 0)].max())
+    return result
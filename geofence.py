@@ -0,0 +1,198 @@
+import time
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from uuid import UUID
+import numpy as np
+from sqlalchemy import Date, event, literal, select
+from sqlalchemy.orm import Session
+from database.mileage import MILEAGE_TZ, local_day
+from database.status_tracking import apply_point_departure, apply_point_status
+from geo import METERS_PER_DEGREE, haversine_m
+from live import publish, status_event
+from metrics import GEOFENCE_EVENTS
+from models import RoutePlan, RoutePoint, RoutePointStatusEnum
+
+# Автоматическое прибытие и убытие по GPS: каждая отметка машины сверяется с точками её
+# сегодняшних маршрутов. Машина, пробывшая в радиусе GEOFENCE_RADIUS_M не меньше
+# GEOFENCE_MIN_DWELL_SECONDS, прибыла — статус arrived со временем входа (если водитель не отметил
+# прибытие сам); проезд мимо точки прибытием не считается. Выход за GEOFENCE_EXIT_RADIUS_M после
+# прибытия — время убытия и время на точке. Радиус выхода больше радиуса входа, чтобы дрожание
+# GPS на границе не давало ложных убытий.
+#
+# Точки машины держатся в памяти процесса отсортированными по широте: полоса [lat - r, lat + r]
+# находится двоичным поиском, расстояние считается только до точек полосы — O(log n) на отметку.
+# Набор точек перечитывается из базы раз в INDEX_TTL_SECONDS (правки маршрута) и при смене дня.
+# Повторного прибытия или убытия не бывает: условия проверяются в самом запросе, набор в памяти
+# лишь отсекает лишние проверки (после отката он сходится с базой при следующей сборке).
+
+GEOFENCE_RADIUS_M = 100
+GEOFENCE_EXIT_RADIUS_M = 150
+GEOFENCE_MIN_DWELL_SECONDS = 60
+INDEX_TTL_SECONDS = 60
+AUTO_NOTE = "Автоматически по геозоне"
+
+# Ключ в Session.info: точки, внутри которых машина оказалась по отметкам транзакции, — применяются после коммита
+PENDING_INSIDE_KEY = "geofence_inside"
+
+
+@dataclass
+class Fence:
+    point_id: UUID
+    route_plan_id: UUID
+    latitude: float
+    longitude: float
+    arrived: bool  # прибытие уже есть — ждём только убытия
+
+
+class VehicleFences:
+    """Незавершённые точки сегодняшних маршрутов машины, упорядоченные по широте."""
+
+    def __init__(self, day: date, fences: list[Fence]):
+        self.day = day
+        self.built_at = time.monotonic()
+        self.fences = sorted(fences, key=lambda fence: fence.latitude)
+        self._index()
+
+    def _index(self):
+        self.latitudes = np.array([fence.latitude for fence in self.fences])
+        self.longitudes = np.array([fence.longitude for fence in self.fences])
+        self.by_id = {fence.point_id: fence for fence in self.fences}
+
+    def near(self, latitude: float, longitude: float, radius_m: float) -> list[Fence]:
+        delta = radius_m / METERS_PER_DEGREE
+        begin = bisect_left(self.latitudes, latitude - delta)
+        end = bisect_right(self.latitudes, latitude + delta)
+        if begin == end:
+            return []
+        distance = haversine_m(self.latitudes[begin:end], self.longitudes[begin:end], latitude, longitude)
+        return [self.fences[begin + i] for i in np.flatnonzero(distance <= radius_m)]
+
+    def discard(self, point_id: UUID):
+        if point_id in self.by_id:
+            self.fences = [fence for fence in self.fences if fence.point_id != point_id]
+            self._index()
+
+
+def _distance_m(fence: Fence, latitude: float, longitude: float) -> float:
+    return float(haversine_m(fence.latitude, fence.longitude, latitude, longitude))
+
+
+class GeofenceIndex:
+    def __init__(self):
+        self._vehicles: dict[UUID, VehicleFences] = {}
+        # Точки, в радиусе которых машина сейчас, и время входа — по закоммиченным отметкам
+        self._inside: dict[UUID, dict[UUID, datetime]] = {}
+
+    async def _fences(self, db, vehicle_id: UUID, day: date) -> VehicleFences:
+        fences = self._vehicles.get(vehicle_id)
+        if fences and fences.day == day and time.monotonic() - fences.built_at < INDEX_TTL_SECONDS:
+            return fences
+
+        result = await db.execute(
+            select(RoutePoint.id, RoutePoint.route_plan_id, RoutePoint.latitude, RoutePoint.longitude, RoutePoint.arrival_time)
+            .join(RoutePlan, RoutePoint.route_plan_id == RoutePlan.id)
+            .where(
+                RoutePlan.vehicle_id == vehicle_id,
+                RoutePlan.date >= literal(day, Date),
+                RoutePlan.date < literal(day + timedelta(days=1), Date),
+                RoutePoint.latitude.isnot(None),
+                RoutePoint.longitude.isnot(None),
+                RoutePoint.departure_time.is_(None),
+                RoutePoint.current_status.is_distinct_from(RoutePointStatusEnum.skipped),
+            )
+        )
+        fences = VehicleFences(day, [
+            Fence(point_id, route_plan_id, latitude, longitude, arrival_time is not None)
+            for point_id, route_plan_id, latitude, longitude, arrival_time in result.all()
+        ])
+        self._vehicles[vehicle_id] = fences
+        return fences
+
+    async def check_fixes(self, db, vehicle_id: UUID, fixes: list[tuple]):
+        """
+        fixes — отметки машины (timestamp, latitude, longitude) по возрастанию времени.
+        Пишет прибытия и убытия в транзакцию db; не коммитит. Отметки не сегодняшнего дня пропускаются.
+        """
+        today = datetime.now(MILEAGE_TZ).date()
+        fixes = [fix for fix in fixes if fix[1] is not None and fix[2] is not None and local_day(fix[0]) == today]
+        if vehicle_id is None or not fixes:
+            return
+        fences = await self._fences(db, vehicle_id, today)
+        pending = db.info.setdefault(PENDING_INSIDE_KEY, {})
+        inside = dict(pending.get(vehicle_id, self._inside.get(vehicle_id, {})))
+        if not fences.fences and not inside:
+            return
+
+        for timestamp, latitude, longitude in fixes:
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)  # время без пояса в приложении — utcnow()
+            near = {fence.point_id: fence for fence in fences.near(latitude, longitude, GEOFENCE_RADIUS_M)}
+            left = [
+                point_id for point_id in inside
+                if point_id not in near and (
+                    point_id not in fences.by_id
+                    or _distance_m(fences.by_id[point_id], latitude, longitude) > GEOFENCE_EXIT_RADIUS_M
+                )
+            ]
+            for point_id in left:
+                del inside[point_id]
+                fence = fences.by_id.get(point_id)
+                if fence is not None and fence.arrived:
+                    await self._depart(db, vehicle_id, fences, fence, timestamp)
+            for point_id in near:
+                inside.setdefault(point_id, timestamp)
+            for point_id, entered_at in inside.items():
+                fence = fences.by_id.get(point_id)
+                if fence is not None and not fence.arrived and timestamp - entered_at >= timedelta(seconds=GEOFENCE_MIN_DWELL_SECONDS):
+                    await self._arrive(db, fence, entered_at, latitude, longitude)
+        pending[vehicle_id] = inside
+
+    async def check_rows(self, db, rows: list[dict]):
+        """Строки logs (пачка или сброс буфера) — по машинам, в порядке времени."""
+        by_vehicle = defaultdict(list)
+        for row in rows:
+            by_vehicle[row["vehicle_id"]].append((row["timestamp"], row["latitude"], row["longitude"]))
+        for vehicle_id, fixes in by_vehicle.items():
+            await self.check_fixes(db, vehicle_id, sorted(fixes, key=lambda fix: fix[0]))
+
+    async def _arrive(self, db, fence: Fence, timestamp: datetime, latitude: float, longitude: float):
+        fence.arrived = True
+        # Водитель мог отметить прибытие, завершить или пропустить точку после сборки набора
+        point = await db.scalar(
+            select(RoutePoint).where(
+                RoutePoint.id == fence.point_id,
+                RoutePoint.arrival_time.is_(None),
+                RoutePoint.departure_time.is_(None),
+                RoutePoint.current_status.is_distinct_from(RoutePointStatusEnum.skipped),
+            )
+        )
+        if point is None:
+            return
+        await apply_point_status(db, point, RoutePointStatusEnum.arrived, timestamp, latitude, longitude, note=AUTO_NOTE)
+        GEOFENCE_EVENTS.inc(kind="arrival")
+
+    async def _depart(self, db, vehicle_id: UUID, fences: VehicleFences, fence: Fence, timestamp: datetime):
+        fences.discard(fence.point_id)
+        point = await apply_point_departure(db, fence.point_id, timestamp)
+        if point is None:
+            return
+        await publish(db, status_event(
+            "point_departure", point.id, point.route_plan_id, vehicle_id, point.current_status,
+            point.latitude, point.longitude, timestamp,
+        ))
+        GEOFENCE_EVENTS.inc(kind="departure")
+
+
+geofence_index = GeofenceIndex()
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session):
+    geofence_index._inside.update(session.info.pop(PENDING_INSIDE_KEY, {}))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop(PENDING_INSIDE_KEY, None)
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta, timezone
+from geo import haversine_m
+from fleet import fleet_positions
+from metrics import INGEST_FIXES_DROPPED
+
+# Входной фильтр GPS-отметок: стоящий телефон шлёт одну и ту же точку по нескольку раз в секунду,
+# и каждая стала бы строкой logs, раздувая таблицу и все последующие чтения.
+# Отметка не записывается, если статус тот же, что у предыдущей записанной отметки машины,
+# с неё прошло меньше DEDUP_INTERVAL_SECONDS и машина не сдвинулась дальше DEDUP_DISTANCE_M.
+# Смена статуса записывается всегда; стоящая машина оставляет одну отметку в DEDUP_INTERVAL_SECONDS.
+# Предыдущая отметка берётся из памяти (fleet_positions.last_log), а не из базы; отметки, которые
+# ещё стоят в буфере отложенной записи, fleet_positions увидит только после сброса пачки — самую
+# свежую из них передаёт вызывающий (pending), и сравнение идёт с более новой из двух.
+# Отметки старше предыдущей (пачка, накопленная без связи) с ней не сравниваются — такие отметки
+# сравниваются между собой, и записанная последней отметка для следующих живых отметок не меняется.
+
+DEDUP_DISTANCE_M = 15  # порядок дрожания GPS у стоящего телефона
+DEDUP_INTERVAL_SECONDS = 60
+
+
+def _aware(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)  # время без пояса в приложении — utcnow()
+    return timestamp
+
+
+def _located(row: dict) -> bool:
+    return row["latitude"] is not None and row["longitude"] is not None
+
+
+def repeat_reason(previous: dict | None, row: dict) -> str | None:
+    """Почему row повторяет предыдущую записанную отметку previous; None — row нужно записать."""
+    if previous is None or row["status"] != previous["status"]:
+        return None
+    age = _aware(row["timestamp"]) - _aware(previous["timestamp"])
+    if not timedelta(0) <= age < timedelta(seconds=DEDUP_INTERVAL_SECONDS):
+        return None
+    if not _located(row):
+        # Пропажа координат после отметки с ними — тоже событие
+        return None if _located(previous) else "no_position"
+    if _located(previous) and haversine_m(
+        previous["latitude"], previous["longitude"], row["latitude"], row["longitude"]
+    ) <= DEDUP_DISTANCE_M:
+        return "same_place"
+    return None
+
+
+def newest_fix(*rows: dict | None) -> dict | None:
+    known = [row for row in rows if row is not None]
+    return max(known, key=lambda row: _aware(row["timestamp"])) if known else None
+
+
+def thin_fixes(rows: list[dict], pending: dict | None = None) -> list[dict]:
+    """
+    Строки logs одной машины без повторов; порядок строк сохраняется.
+    pending — последняя отметка машины, поставленная в очередь на запись, но ещё не записанная.
+    Отметка не раньше последней записанной сравнивается с ней или с последней оставленной после неё;
+    более ранняя отметка из накопленной пачки — с предыдущей оставленной отметкой этой пачки.
+    """
+    if not rows:
+        return rows
+    latest = newest_fix(fleet_positions.last_log(rows[0]["vehicle_id"]), pending)
+    stored_at = _aware(latest["timestamp"]) if latest is not None else None
+    backlog_previous = None
+    dropped = set()
+    for index in sorted(range(len(rows)), key=lambda i: _aware(rows[i]["timestamp"])):
+        row = rows[index]
+        backlog = stored_at is not None and _aware(row["timestamp"]) < stored_at
+        reason = repeat_reason(backlog_previous if backlog else latest, row)
+        if reason:
+            INGEST_FIXES_DROPPED.inc(reason=reason)
+            dropped.add(index)
+        elif backlog:
+            backlog_previous = row
+        else:
+            latest = row
+    return [row for index, row in enumerate(rows) if index not in dropped] if dropped else rows
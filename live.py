@@ -0,0 +1,182 @@
+import asyncio
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from uuid import UUID
+from sqlalchemy import text
+from database.database_app import async_engine
+from metrics import LIVE_EVENTS, LIVE_SUBSCRIBERS
+
+# Живая лента событий для диспетчерских карт: GPS-отметки машин и статусы точек и погрузок.
+# Пишущий код отправляет событие через pg_notify в той же транзакции, что и запись, —
+# Postgres доставит его только после коммита и выбросит при откате. Каждый процесс приложения
+# держит одно соединение с LISTEN и раздаёт полученные события своим подписчикам в памяти,
+# так что событие, записанное любым процессом, видят клиенты всех процессов.
+
+LIVE_CHANNEL = "live_events"
+# Очередь подписчика: медленный клиент теряет самые старые события, а не тормозит остальных
+SUBSCRIBER_QUEUE_SIZE = 1000
+# Проверка соединения LISTEN и пауза перед переподключением
+LISTEN_CHECK_SECONDS = 5
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"{type(value).__name__} не сериализуется")
+
+
+def position_event(vehicle_id, latitude, longitude, status, timestamp) -> dict:
+    return {
+        "type": "position",
+        "vehicle_id": vehicle_id,
+        "latitude": latitude,
+        "longitude": longitude,
+        "status": status,
+        "timestamp": timestamp,
+    }
+
+
+def status_event(kind: str, object_id, route_id, vehicle_id, status, latitude, longitude, timestamp) -> dict:
+    """kind — point_status или loading_status; object_id — id точки или погрузки."""
+    return {
+        "type": kind,
+        "id": object_id,
+        "route_id": route_id,
+        "vehicle_id": vehicle_id,
+        "status": status,
+        "latitude": latitude,
+        "longitude": longitude,
+        "timestamp": timestamp,
+    }
+
+
+async def publish(db, *events: dict):
+    """Отправляет события в транзакции db одним запросом; подписчики получат их после коммита."""
+    if not events:
+        return
+    payloads = [json.dumps(event, default=_json_default, ensure_ascii=False) for event in events]
+    await db.execute(
+        text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+        {"channel": LIVE_CHANNEL, "payloads": payloads},
+    )
+
+
+async def publish_fixes(db, rows: list[dict]):
+    """
+    Последняя отметка с координатами каждой машины из пачки строк logs.
+    Промежуточные точки пачки карте не нужны — они видны в треке машины.
+    """
+    latest = {}
+    for row in rows:
+        if row["latitude"] is None or row["longitude"] is None:
+            continue
+        current = latest.get(row["vehicle_id"])
+        if current is None or current["timestamp"] <= row["timestamp"]:  # при равном времени — более поздняя в пачке
+            latest[row["vehicle_id"]] = row
+    await publish(db, *(
+        position_event(row["vehicle_id"], row["latitude"], row["longitude"], row["status"], row["timestamp"])
+        for row in latest.values()
+    ))
+
+
+@dataclass(eq=False)
+class Subscription:
+    """
+    Фильтры подписки складываются через И, значения внутри фильтра — через ИЛИ:
+    vehicle_ids — машины (подписка на водителя или маршрут разворачивается в его машины),
+    route_ids — статусы только этих маршрутов, bbox — (min_lat, min_lon, max_lat, max_lon).
+    """
+    vehicle_ids: set | None = None
+    route_ids: set | None = None
+    bbox: tuple | None = None
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE))
+
+    def matches(self, event: dict) -> bool:
+        if self.vehicle_ids is not None and event.get("vehicle_id") not in self.vehicle_ids:
+            return False
+        if self.route_ids is not None and event["type"] != "position" and event.get("route_id") not in self.route_ids:
+            return False
+        if self.bbox is not None:
+            latitude, longitude = event.get("latitude"), event.get("longitude")
+            if latitude is None or longitude is None:
+                return False
+            min_lat, min_lon, max_lat, max_lon = self.bbox
+            if not (min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon):
+                return False
+        return True
+
+    def push(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            LIVE_EVENTS.inc(result="dropped")
+        self.queue.put_nowait(event)
+
+
+class LiveHub:
+    def __init__(self):
+        self._subscriptions: set[Subscription] = set()
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, subscription: Subscription) -> Subscription:
+        self._subscriptions.add(subscription)
+        LIVE_SUBSCRIBERS.set(len(self._subscriptions))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+        LIVE_SUBSCRIBERS.set(len(self._subscriptions))
+
+    def dispatch(self, payload: str):
+        """Раздаёт событие из канала подходящим подписчикам этого процесса."""
+        event = json.loads(payload)
+        LIVE_EVENTS.inc(result="received")
+        for subscription in self._subscriptions:
+            if subscription.matches(event):
+                subscription.push(event)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self):
+        # Отдельное долгоживущее соединение из пула: LISTEN привязан к соединению
+        def on_notify(connection, pid, channel, payload):
+            try:
+                self.dispatch(payload)
+            except Exception as e:
+                print(f"Ошибка разбора события {LIVE_CHANNEL}: {e}")
+
+        while True:
+            try:
+                async with async_engine.connect() as conn:
+                    raw = (await conn.get_raw_connection()).driver_connection
+                    await raw.add_listener(LIVE_CHANNEL, on_notify)
+                    try:
+                        while not raw.is_closed():
+                            await asyncio.sleep(LISTEN_CHECK_SECONDS)
+                    finally:
+                        if not raw.is_closed():
+                            await raw.remove_listener(LIVE_CHANNEL, on_notify)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Ошибка подписки на {LIVE_CHANNEL}: {e}")
+            await asyncio.sleep(LISTEN_CHECK_SECONDS)
+
+
+live_hub = LiveHub()
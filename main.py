@@ -2,10 +2,21 @@ from datetime import datetime
 from fastapi import FastAPI, HTTPException, Query
 import httpx
 from pydantic import BaseModel
+import asyncio
 from database.database_app import create_db_if_not_exists, create_tables
+from database.partitions import maintain_partitions, run_partition_maintenance
+from database.schema_upgrades import upgrade_schema
+from database.status_tracking import run_status_repair
+from database.daily_stats import refresh_pending_routes, run_daily_stats_refresh, run_pending_stats_refresh
+from database.mileage import run_mileage_refresh
+from database.write_buffer import log_buffer
+from fleet import fleet_positions
+from live import live_hub
 from migration import run_auto_migrations
 from fastapi.middleware.cors import CORSMiddleware
-from routers import addresses, deliveryTypes, legalEntities, loading_places, loadings, stats, tariffs, transportCompanies, users, vehicles, logs, auth, trail, stores
+from routers import addresses, deliveryTypes, exports, fleet, legalEntities, loading_places, loadings, stats, tariffs, transportCompanies, users, vehicles, logs, auth, trail, stores
+from routers import metrics as metrics_router
+from metrics import GEOCODER_REQUEST_DURATION, GEOCODER_REQUESTS, MetricsMiddleware
 from fastapi import Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import delete, or_, select
@@ -15,6 +26,9 @@ from models import Address, DeliveryType, LegalEntityType, Loading, LoadingPlace
 
 create_db_if_not_exists()
 create_tables()
+# create_all не меняет существующие таблицы — новые колонки и индексы добавляются здесь
+upgrade_schema()
+maintain_partitions()
 
 # выполняем autogenerate+upgrade
 # run_auto_migrations()
@@ -29,13 +43,41 @@ app.add_middleware(
     allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],  
 )
+app.add_middleware(MetricsMiddleware)
+
+background_tasks = set()
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # Карта машин собирается из logs до приёма запросов; без базы приложение всё равно стартует
+    try:
+        await asyncio.to_thread(fleet_positions.rebuild)
+    except Exception as e:
+        print(f"Ошибка загрузки положений машин: {e}")
+    for job in (run_partition_maintenance, run_status_repair, run_daily_stats_refresh, run_pending_stats_refresh, run_mileage_refresh):
+        task = asyncio.create_task(job())
+        background_tasks.add(task)
+    log_buffer.start()
+    live_hub.start()
+
+
+@app.on_event("shutdown")
+async def drain_write_buffers():
+    # Дописываем в базу всё, что успели принять в буфер отложенной записи
+    await log_buffer.close()
+    await live_hub.stop()
+    # и пересчитываем агрегаты маршрутов, стоящих в очереди
+    await refresh_pending_routes()
 
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(vehicles.router)
 app.include_router(logs.router)
+app.include_router(fleet.router)
 app.include_router(trail.router)
 app.include_router(stats.router)
+app.include_router(exports.router)
 app.include_router(addresses.router)
 app.include_router(stores.router)
 app.include_router(legalEntities.router)
@@ -44,6 +86,7 @@ app.include_router(transportCompanies.router)
 app.include_router(tariffs.router)
 app.include_router(loading_places.router)
 app.include_router(loadings.router)
+app.include_router(metrics_router.router)
 
 # Определение модели для ответа
 class GeocodeResponse(BaseModel):
@@ -56,18 +99,25 @@ async def geocode(address: str):
 
     async with httpx.AsyncClient() as client:
         try:
-            response = await client.get(url, headers={"User-Agent": "YourAppName (contact@yourapp.com)"})
+            with GEOCODER_REQUEST_DURATION.time():
+                response = await client.get(url, headers={"User-Agent": "YourAppName (contact@yourapp.com)"})
             response.raise_for_status()  
             data = response.json()
             
             if not data:
+                GEOCODER_REQUESTS.inc(outcome="not_found")
                 raise HTTPException(status_code=404, detail="Address not found")
             
+            GEOCODER_REQUESTS.inc(outcome="ok")
             return GeocodeResponse(lat=float(data[0]["lat"]), lng=float(data[0]["lon"]))
         
+        except HTTPException:
+            raise
         except httpx.HTTPStatusError as e:
+            GEOCODER_REQUESTS.inc(outcome="error")
             raise HTTPException(status_code=e.response.status_code, detail=f"HTTP error occurred: {e}")
         except Exception as e:
+            GEOCODER_REQUESTS.inc(outcome="error")
             raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
@@ -113,18 +163,22 @@ async def geocode_excel(file: UploadFile = File(...)):
                 params = {"format": "json", "q": address}
                 headers = {"User-Agent": "YourAppName (contact@yourapp.com)"}
 
-                resp = await client.get(url, params=params, headers=headers)
+                with GEOCODER_REQUEST_DURATION.time():
+                    resp = await client.get(url, params=params, headers=headers)
                 resp.raise_for_status()
                 data = resp.json()
 
                 if data:
                     lat = float(data[0]["lat"])
                     lon = float(data[0]["lon"])
+                    GEOCODER_REQUESTS.inc(outcome="ok")
                 else:
                     lat, lon = None, None
+                    GEOCODER_REQUESTS.inc(outcome="not_found")
 
                 results.append({"address": address, "lat": lat, "lon": lon})
             except Exception:
+                GEOCODER_REQUESTS.inc(outcome="error")
                 results.append({"address": address, "lat": None, "lon": None})
 
     # Создаём новый Excel с координатами
@@ -0,0 +1,302 @@
+import functools
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+# Метрики приложения в текстовом формате Prometheus.
+# Всё хранится в памяти процесса: запись метрики — это пара операций со словарём,
+# поэтому измерения на горячих эндпоинтах практически ничего не стоят.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def _header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ключ меток -> [счётчики по корзинам (+Inf последней), сумма, количество]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ===================== HTTP =====================
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Длительность обработки HTTP-запроса",
+    ("method", "route", "status"),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Количество запросов, обрабатываемых в данный момент",
+    ("method",),
+)
+
+# ===================== База данных =====================
+DB_POOL_SIZE = Gauge("db_pool_size", "Размер пула соединений")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Соединения, выданные из пула")
+DB_POOL_CHECKED_IN = Gauge("db_pool_checked_in", "Свободные соединения в пуле")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Соединения сверх размера пула")
+
+# ===================== Геокодер =====================
+GEOCODER_REQUEST_DURATION = Histogram(
+    "geocoder_request_duration_seconds",
+    "Длительность запроса к геокодеру",
+)
+GEOCODER_REQUESTS = Counter(
+    "geocoder_requests_total",
+    "Запросы к геокодеру по результату",
+    ("outcome",),
+)
+GEOCODER_CACHE = Counter(
+    "geocoder_cache_total",
+    "Поиск координат адреса: hit — адрес уже есть в справочнике, miss — нужен геокодер",
+    ("result",),
+)
+
+# ===================== Статистика =====================
+STATS_CACHE = Counter(
+    "stats_cache_total",
+    "Кэш статистики: hit — готовый результат, coalesced — ожидание идущего расчёта, miss — новый расчёт",
+    ("report", "result"),
+)
+
+# ===================== Отложенная запись =====================
+WRITE_BUFFER_ROWS = Counter(
+    "write_buffer_rows_total",
+    "Строки буфера отложенной записи: queued, written, dropped, waited — ожидание места, rejected — очередь полна, hook_failed — записаны, но обработка после записи не удалась",
+    ("table", "result"),
+)
+WRITE_BUFFER_PENDING = Gauge(
+    "write_buffer_pending_rows",
+    "Строки в очереди буфера отложенной записи",
+    ("table",),
+)
+WRITE_BUFFER_FLUSH_DURATION = Histogram(
+    "write_buffer_flush_duration_seconds",
+    "Длительность сброса пачки буфера в базу",
+    ("table",),
+)
+
+# ===================== Входной фильтр GPS =====================
+INGEST_FIXES_DROPPED = Counter(
+    "ingest_fixes_dropped_total",
+    "Отброшенные повторные отметки: same_place — на месте предыдущей, no_position — без координат с тем же статусом",
+    ("reason",),
+)
+
+# ===================== Живая лента =====================
+LIVE_EVENTS = Counter(
+    "live_events_total",
+    "События живой ленты: received — получено из канала, dropped — выброшено из очереди медленного клиента",
+    ("result",),
+)
+LIVE_SUBSCRIBERS = Gauge("live_subscribers", "Открытые подписки на живую ленту")
+
+# ===================== Геозоны =====================
+GEOFENCE_EVENTS = Counter(
+    "geofence_events_total",
+    "Автоматические прибытия (arrival) и убытия (departure) по GPS-отметкам",
+    ("kind",),
+)
+
+# ===================== Импорт =====================
+IMPORT_JOBS = Counter(
+    "import_jobs_total",
+    "Запуски импорта маршрутов из Excel",
+    ("endpoint", "outcome"),
+)
+IMPORT_ROWS = Counter(
+    "import_rows_total",
+    "Строки, обработанные импортом маршрутов",
+    ("endpoint",),
+)
+IMPORT_JOB_DURATION = Histogram(
+    "import_job_duration_seconds",
+    "Длительность импорта маршрутов",
+    ("endpoint",),
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+
+
+def update_pool_metrics(pool):
+    """Снимает текущее состояние пула соединений SQLAlchemy."""
+    DB_POOL_SIZE.set(pool.size())
+    DB_POOL_CHECKED_OUT.set(pool.checkedout())
+    DB_POOL_CHECKED_IN.set(pool.checkedin())
+    DB_POOL_OVERFLOW.set(pool.overflow())
+
+
+def track_import(endpoint: str):
+    """Декоратор эндпоинта импорта: число запусков по исходу и длительность."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                IMPORT_JOBS.inc(endpoint=endpoint, outcome="error")
+                raise
+            finally:
+                IMPORT_JOB_DURATION.observe(time.perf_counter() - start, endpoint=endpoint)
+            IMPORT_JOBS.inc(endpoint=endpoint, outcome="ok")
+            return result
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: латентность по маршруту/статусу и число активных запросов."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc(method=method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec(method=method)
+            # Шаблон пути (/routes/{route_id}), а не фактический URL — иначе метки размножатся
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=method,
+                route=getattr(route, "path", "<unmatched>"),
+                status=status_code,
+            )
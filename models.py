@@ -1,8 +1,9 @@
 from datetime import datetime
 from sqlalchemy import (
-    Boolean, Column, Integer, String, ForeignKey, DateTime, Float, Enum, Table
+    Boolean, Column, Date, Integer, String, ForeignKey, DateTime, Float, Enum, Index, Table
 )
 from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy.sql import func
 import enum
 import uuid
 from sqlalchemy.dialects.postgresql import UUID
@@ -15,6 +16,7 @@ class TimestampMixin:
 # ===================== Пользователь =====================
 class User(Base, TimestampMixin):
     __tablename__ = "users"
+    __table_args__ = (Index("ix_users_create_date_time_id", "createDateTime", "id"),)
 
     id = Column(UUID(as_uuid=True), default=uuid.uuid4, primary_key=True)
     username = Column(String, nullable=False)
@@ -85,15 +87,21 @@ class StatusEnum(str, enum.Enum):
 
 
 # ===================== Логи транспортных средств =====================
+# Журналы секционированы по месяцам (см. database/partitions.py),
+# поэтому timestamp входит в первичный ключ.
 class LogEntry(Base, TimestampMixin):
     __tablename__ = "logs"
+    __table_args__ = (
+        Index("ix_logs_vehicle_id_timestamp", "vehicle_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
     id = Column(UUID(as_uuid=True), default=uuid.uuid4, primary_key=True)
     vehicle_id = Column(UUID(as_uuid=True), ForeignKey("vehicles.id"))
     status = Column(Enum(StatusEnum), default=StatusEnum.idle)
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
-    timestamp = Column(DateTime(timezone=True), default=datetime.utcnow)
+    timestamp = Column(DateTime(timezone=True), default=datetime.utcnow, primary_key=True)
 
     vehicle = relationship("Vehicle", back_populates="logs")
 
@@ -118,6 +126,10 @@ class RouteStatusEnum(str, enum.Enum):
 # ===================== План маршрута =====================
 class RoutePlan(Base, TimestampMixin):
     __tablename__ = "route_plans"
+    __table_args__ = (
+        Index("ix_route_plans_create_date_time_id", "createDateTime", "id"),
+        Index("ix_route_plans_date", "date"),
+    )
 
     id = Column(UUID(as_uuid=True), default=uuid.uuid4, primary_key=True)
     vehicle_id = Column(UUID(as_uuid=True), ForeignKey("vehicles.id"))
@@ -130,6 +142,11 @@ class RoutePlan(Base, TimestampMixin):
     start_datetime = Column(DateTime(timezone=True), nullable=True)
     end_datetime = Column(DateTime(timezone=True), nullable=True)
 
+    # Счётчики точек по текущему статусу — пересчитываются при каждой смене статуса точки
+    points_completed = Column(Integer, nullable=False, default=0, server_default="0")
+    points_in_progress = Column(Integer, nullable=False, default=0, server_default="0")  # en_route + arrived
+    points_skipped = Column(Integer, nullable=False, default=0, server_default="0")
+
     vehicle = relationship("Vehicle", back_populates="route_plans")
     delivery_type = relationship("DeliveryType", back_populates="routes")
     points = relationship("RoutePoint", back_populates="route_plan", cascade="all, delete-orphan")
@@ -150,6 +167,7 @@ class RoutePointStatusEnum(str, enum.Enum):
 # ===================== Адрес =====================
 class Address(Base, TimestampMixin):
     __tablename__ = "addresses"
+    __table_args__ = (Index("ix_addresses_create_date_time_id", "createDateTime", "id"),)
 
     id = Column(UUID(as_uuid=True), default=uuid.uuid4, primary_key=True)
     address_1c = Column(String, nullable=False)
@@ -169,6 +187,7 @@ class Address(Base, TimestampMixin):
 # ===================== Магазин =====================
 class Store(Base, TimestampMixin):
     __tablename__ = "stores"
+    __table_args__ = (Index("ix_stores_create_date_time_id", "createDateTime", "id"),)
 
     id = Column(UUID(as_uuid=True), default=uuid.uuid4, primary_key=True)
     uuid_1c = Column(String, nullable=False, unique=True)
@@ -182,6 +201,11 @@ class Store(Base, TimestampMixin):
 # ===================== Точка маршрута =====================
 class RoutePoint(Base, TimestampMixin):
     __tablename__ = "route_points"
+    __table_args__ = (
+        Index("ix_route_points_create_date_time_id", "createDateTime", "id"),
+        # Точки маршрута в порядке прибытия — окно lag() для времени в пути между точками
+        Index("ix_route_points_route_plan_id_arrival_time", "route_plan_id", "arrival_time"),
+    )
 
     id = Column(UUID(as_uuid=True), default=uuid.uuid4, primary_key=True)
     route_plan_id = Column(UUID(as_uuid=True), ForeignKey("route_plans.id"))
@@ -197,6 +221,11 @@ class RoutePoint(Base, TimestampMixin):
     longitude = Column(Float, nullable=True)
     status = Column(Enum(RoutePointStatusEnum), default=RoutePointStatusEnum.planned)
 
+    # Последний статус из журнала; NULL — статусов ещё не было
+    current_status = Column(Enum(RoutePointStatusEnum), nullable=True)
+    current_status_at = Column(DateTime(timezone=True), nullable=True)
+    status_changes_count = Column(Integer, nullable=False, default=0, server_default="0")
+
     address_id = Column(UUID(as_uuid=True), ForeignKey("addresses.id"), nullable=True)
     store_id = Column(UUID(as_uuid=True), ForeignKey("stores.id"), nullable=True)
 
@@ -215,11 +244,15 @@ class RoutePoint(Base, TimestampMixin):
 # ===================== Лог статусов точки маршрута =====================
 class RoutePointStatusLog(Base, TimestampMixin):
     __tablename__ = "route_point_status_logs"
+    __table_args__ = (
+        Index("ix_route_point_status_logs_point_id_timestamp", "point_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
     id = Column(UUID(as_uuid=True), default=uuid.uuid4, primary_key=True)
     point_id = Column(UUID(as_uuid=True), ForeignKey("route_points.id"), nullable=False)
     status = Column(Enum(RoutePointStatusEnum), nullable=False)
-    timestamp = Column(DateTime(timezone=True), default=datetime.utcnow)
+    timestamp = Column(DateTime(timezone=True), default=datetime.utcnow, primary_key=True)
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
     note = Column(String, nullable=True)
@@ -248,6 +281,7 @@ class Tariff(Base, TimestampMixin):
 # ===================== Места загрузки =====================
 class LoadingPlace(Base, TimestampMixin):
     __tablename__ = "loading_places"
+    __table_args__ = (Index("ix_loading_places_create_date_time_id", "createDateTime", "id"),)
 
     id = Column(UUID(as_uuid=True), default=uuid.uuid4, primary_key=True)
     uuid_1c = Column(String, nullable=True, unique=True) 
@@ -281,6 +315,10 @@ class Loading(Base, TimestampMixin):
     longitude = Column(Float, nullable=True)  # Геолокация: долгота
     status = Column(Enum(RoutePointStatusEnum), default=RoutePointStatusEnum.planned)  # Текущий статус загрузки
 
+    current_status = Column(Enum(RoutePointStatusEnum), nullable=True)  # Последний статус из журнала
+    current_status_at = Column(DateTime(timezone=True), nullable=True)  # Время последнего статуса
+    status_changes_count = Column(Integer, nullable=False, default=0, server_default="0")  # Количество записей в журнале
+
     route_plan = relationship("RoutePlan", back_populates="loadings")
     loading_place = relationship("LoadingPlace", back_populates="loadings")
 
@@ -295,13 +333,82 @@ class Loading(Base, TimestampMixin):
 # ===================== Лог статусов загрузки =====================
 class LoadingStatusLog(Base, TimestampMixin):
     __tablename__ = "loading_status_logs"
+    __table_args__ = (
+        Index("ix_loading_status_logs_loading_id_timestamp", "loading_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     loading_id = Column(UUID(as_uuid=True), ForeignKey("loadings.id"), nullable=False)
     status = Column(Enum(RoutePointStatusEnum), nullable=False)
-    timestamp = Column(DateTime(timezone=True), default=datetime.utcnow)
+    timestamp = Column(DateTime(timezone=True), default=datetime.utcnow, primary_key=True)
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
     note = Column(String, nullable=True)
 
     loading = relationship("Loading", back_populates="status_logs")
+
+
+# ===================== Дневные агрегаты статистики =====================
+class DailyStatsMixin:
+    """Счётчики точек маршрутов за день; day — дата маршрута (RoutePlan.date)."""
+    day = Column(Date, primary_key=True)
+    points_total = Column(Integer, nullable=False, default=0)
+    points_with_status = Column(Integer, nullable=False, default=0)
+    points_planned = Column(Integer, nullable=False, default=0)
+    points_en_route = Column(Integer, nullable=False, default=0)
+    points_arrived = Column(Integer, nullable=False, default=0)
+    points_completed = Column(Integer, nullable=False, default=0)
+    points_skipped = Column(Integer, nullable=False, default=0)
+    payment_sum = Column(Float, nullable=False, default=0)
+    payment_with_status_sum = Column(Float, nullable=False, default=0)  # оплата точек, у которых был статус
+    duration_sum = Column(Integer, nullable=False, default=0)
+    duration_count = Column(Integer, nullable=False, default=0)
+    max_duration_minutes = Column(Integer, nullable=True)
+    max_duration_point_id = Column(UUID(as_uuid=True), nullable=True)
+    # Строки пишутся через INSERT ... SELECT, поэтому время — серверное
+    changeDateTime = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class DriverDailyStats(Base, DailyStatsMixin):
+    __tablename__ = "driver_daily_stats"
+
+    driver_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+
+
+class VehicleDailyStats(Base, DailyStatsMixin):
+    __tablename__ = "vehicle_daily_stats"
+
+    vehicle_id = Column(UUID(as_uuid=True), ForeignKey("vehicles.id", ondelete="CASCADE"), primary_key=True)
+
+
+class StoreDailyStats(Base, DailyStatsMixin):
+    __tablename__ = "store_daily_stats"
+
+    store_id = Column(UUID(as_uuid=True), ForeignKey("stores.id", ondelete="CASCADE"), primary_key=True)
+
+# Пробег и время движения машины за день по GPS-логам (database/mileage.py)
+class VehicleDailyMileage(Base):
+    __tablename__ = "vehicle_daily_mileage"
+
+    day = Column(Date, primary_key=True)  # местный день (Asia/Barnaul)
+    vehicle_id = Column(UUID(as_uuid=True), ForeignKey("vehicles.id", ondelete="CASCADE"), primary_key=True)
+    distance_km = Column(Float, nullable=False, default=0)
+    moving_seconds = Column(Integer, nullable=False, default=0)
+    idle_seconds = Column(Integer, nullable=False, default=0)
+    fixes_count = Column(Integer, nullable=False, default=0)
+    rejected_count = Column(Integer, nullable=False, default=0)  # выбросы, отброшенные по скорости
+    max_speed_kmh = Column(Float, nullable=True)
+    first_fix_at = Column(DateTime(timezone=True), nullable=True)
+    last_fix_at = Column(DateTime(timezone=True), nullable=True)
+    changeDateTime = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+# Отметки фоновых задач обслуживания: докуда пересобраны агрегаты, сверены статусы и т.п.
+class MaintenanceWatermark(Base):
+    __tablename__ = "maintenance_watermarks"
+
+    name = Column(String, primary_key=True)
+    day = Column(Date, nullable=True)  # последний обработанный день
+    at = Column(DateTime(timezone=True), nullable=True)  # время, до которого изменения обработаны
+    changeDateTime = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
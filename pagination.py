@@ -0,0 +1,82 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import DateTime, Integer, tuple_
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Лимиты страниц по умолчанию
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# Маршруты тянут за собой точки — для них страницы меньше
+ROUTES_DEFAULT_LIMIT = 20
+ROUTES_MAX_LIMIT = 200
+
+
+def _dump(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _load(value, column):
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, UUID):
+        return uuid.UUID(value)
+    if isinstance(column.type, Integer):
+        return int(value)
+    return value
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([_dump(v) for v in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(columns):
+            raise ValueError
+        return [_load(v, c) for v, c in zip(values, columns)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+
+async def paginate(
+    db: AsyncSession,
+    query,
+    columns: tuple,
+    cursor: str | None = None,
+    limit: int = DEFAULT_LIMIT,
+) -> dict:
+    """
+    Keyset-пагинация: сортировка по columns (по убыванию, последняя — уникальный id),
+    курсор хранит значения этих колонок у последней записи страницы.
+    Колонки сортировки не должны меняться у записи: по changeDateTime изменённая во время листания
+    запись переехала бы на уже пройденную страницу или попала бы в выдачу дважды.
+    Поэтому справочники и маршруты листаются по (createDateTime, id), журналы — по (timestamp, id).
+    Возвращает {"items": [...], "next_cursor": str | None}.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        query = query.where(tuple_(*columns) < tuple_(*values))
+
+    query = query.order_by(*(c.desc() for c in columns)).limit(limit + 1)
+    result = await db.execute(query)
+    items = result.scalars().all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(*(getattr(last, c.key) for c in columns))
+
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,156 @@
+import time
+from itertools import permutations
+import numpy as np
+from geo import haversine_m
+
+# Порядок объезда точек маршрута по координатам (задача коммивояжёра с закреплёнными концами).
+# Расстояния — гаверсинус по прямой, матрица считается одним векторным вызовом.
+# До EXACT_MAX_POINTS точек перебираются все порядки — ответ точный. Для больших маршрутов
+# начальный объезд — «ближайший сосед», затем он улучшается локальным поиском до исчерпания
+# бюджета времени: 2-opt разворачивает участок пути, Or-opt переносит цепочку из 1–3 точек
+# (в том числе развёрнутой) на другое место. Выигрыш всех вариантов для одной позиции
+# считается массивом NumPy, поэтому маршрут из 60 точек сходится за десятки миллисекунд.
+# Локальный поиск останавливается в локальном минимуме: кратчайший путь он не гарантирует.
+#
+# Путь всегда идёт от закреплённого начала к закреплённому концу. Свободный конец — фиктивная
+# вершина с нулевым расстоянием до всех точек: путь с ней эквивалентен пути, который может
+# начаться или закончиться в любой точке.
+
+OPTIMIZE_BUDGET_SECONDS = 0.5
+# 8! = 40320 порядков — один векторный расчёт за миллисекунды
+EXACT_MAX_POINTS = 8
+OR_OPT_MAX_SEGMENT = 3
+# Улучшения меньше сантиметра — погрешность округления, на них поиск бы зацикливался
+MIN_GAIN_M = 0.01
+
+
+def distance_matrix(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Попарные расстояния в метрах между точками (lat[i], lon[i])."""
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    return haversine_m(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+
+def path_length(dist: np.ndarray, path: np.ndarray) -> float:
+    return float(dist[path[:-1], path[1:]].sum())
+
+
+def _exact(dist: np.ndarray, count: int, start: int, end: int) -> np.ndarray:
+    """Кратчайший путь start → все точки 0..count-1 → end полным перебором порядков."""
+    orders = np.array(list(permutations(range(count))))
+    paths = np.c_[np.full(len(orders), start), orders, np.full(len(orders), end)]
+    lengths = dist[paths[:, :-1], paths[:, 1:]].sum(axis=1)
+    return paths[int(np.argmin(lengths))]
+
+
+def _nearest_neighbour(dist: np.ndarray, count: int, start: int, end: int) -> np.ndarray:
+    """Путь start → ближайшая ещё не посещённая точка → … → end; точки — вершины 0..count-1."""
+    path = [start]
+    left = np.arange(len(dist)) < count
+    left[start] = False
+    while left.any():
+        candidates = np.flatnonzero(left)
+        current = candidates[np.argmin(dist[path[-1], candidates])]
+        path.append(current)
+        left[current] = False
+    path.append(end)
+    return np.array(path)
+
+
+def _two_opt(dist: np.ndarray, path: np.ndarray, deadline: float) -> bool:
+    """Один проход 2-opt: для каждой позиции i — лучший разворот участка path[i..j]. True — путь улучшился."""
+    improved = False
+    for i in range(1, len(path) - 2):
+        if time.perf_counter() >= deadline:
+            break
+        j = np.arange(i + 1, len(path) - 1)
+        a, b = path[i - 1], path[i]
+        c, e = path[j], path[j + 1]
+        gain = dist[a, b] + dist[c, e] - dist[a, c] - dist[b, e]
+        best = int(np.argmax(gain))
+        if gain[best] > MIN_GAIN_M:
+            path[i:j[best] + 1] = path[i:j[best] + 1][::-1].copy()
+            improved = True
+    return improved
+
+
+def _or_opt(dist: np.ndarray, path: np.ndarray, deadline: float) -> tuple[np.ndarray, bool]:
+    """Один проход Or-opt: перенос цепочки path[i:i+L] между path[k] и path[k+1]. Возвращает путь и признак улучшения."""
+    improved = False
+    for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+        i = 1
+        while i + length <= len(path) - 1 and time.perf_counter() < deadline:
+            first, last = path[i], path[i + length - 1]
+            before, after = path[i - 1], path[i + length]
+            removal = dist[before, first] + dist[last, after] - dist[before, after]
+
+            # Рёбра (path[k], path[k+1]) вне цепочки и не касающиеся её
+            k = np.r_[np.arange(0, i - 1), np.arange(i + length, len(path) - 1)]
+            if not len(k):
+                i += 1
+                continue
+            left, right = path[k], path[k + 1]
+            edge = dist[left, right]
+            forward = dist[left, first] + dist[last, right] - edge
+            backward = dist[left, last] + dist[first, right] - edge
+            insertion = np.minimum(forward, backward)
+            best = int(np.argmin(insertion))
+            if removal - insertion[best] > MIN_GAIN_M:
+                segment = path[i:i + length]
+                if backward[best] < forward[best]:
+                    segment = segment[::-1]
+                rest = np.r_[path[:i], path[i + length:]]
+                position = k[best] + 1 if k[best] < i else k[best] - length + 1
+                path = np.r_[rest[:position], segment, rest[position:]]
+                improved = True
+            else:
+                i += 1
+    return path, improved
+
+
+def optimize_route(lat, lon, start: tuple | None = None, end: tuple | None = None,
+                   budget_seconds: float = OPTIMIZE_BUDGET_SECONDS) -> tuple[np.ndarray, float, float]:
+    """
+    lat, lon — координаты точек в текущем порядке; start, end — закреплённые (lat, lon) начала и конца пути
+    или None. Возвращает новый порядок (индексы точек) и длину пути в метрах до и после.
+    """
+    count = len(lat)
+    if not count:
+        return np.zeros(0, dtype=int), 0.0, 0.0
+    deadline = time.perf_counter() + budget_seconds
+
+    # Вершины: точки 0..count-1, начало count, конец count + 1
+    anchors = [start or (0.0, 0.0), end or (0.0, 0.0)]
+    dist = distance_matrix(np.r_[lat, [a[0] for a in anchors]], np.r_[lon, [a[1] for a in anchors]])
+    for node, anchor in ((count, start), (count + 1, end)):
+        if anchor is None:
+            dist[node, :] = dist[:, node] = 0.0
+    start_node, end_node = count, count + 1
+
+    current = np.r_[start_node, np.arange(count), end_node]
+    before = path_length(dist, current)
+
+    if count <= EXACT_MAX_POINTS:
+        path = _exact(dist, count, start_node, end_node)
+        # Равный по длине порядок (тот же путь в обратную сторону) не повод переставлять точки
+        if before - path_length(dist, path) <= MIN_GAIN_M:
+            path = current
+        return path[1:-1], before, path_length(dist, path)
+
+    if start is None:
+        # Без закреплённого начала — лучший из «ближайших соседей» от каждой точки
+        tours = [_nearest_neighbour(dist, count, first, end_node) for first in range(count)]
+        path = np.r_[start_node, min(tours, key=lambda tour: path_length(dist, tour))]
+    else:
+        path = _nearest_neighbour(dist, count, start_node, end_node)
+    # Текущий порядок мог быть уже хорошим — поиск начинается с лучшего из двух
+    if before < path_length(dist, path):
+        path = current.copy()
+
+    while time.perf_counter() < deadline:
+        improved = _two_opt(dist, path, deadline)
+        path, moved = _or_opt(dist, path, deadline)
+        if not (improved or moved):
+            break
+
+    after = path_length(dist, path)
+    return path[1:-1], before, after
@@ -1,19 +1,23 @@
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from database.database_app import get_session
+from database.writes import insert_many_returning, insert_returning, update_returning
 from models import Address
-from schemas.schemas import AddressCreate, AddressOut
+from pagination import DEFAULT_LIMIT, MAX_LIMIT, paginate
+from schemas.schemas import AddressCreate, AddressOut, Page
 from uuid import UUID
 
 router = APIRouter(prefix="/addresses", tags=["Адреса"])
 
 
-@router.get("/", response_model=list[AddressOut], summary="Список адресов")
-async def get_addresses(db: AsyncSession = Depends(get_session)):
-    result = await db.execute(select(Address))
-    return result.scalars().all()
+@router.get("/", response_model=Page[AddressOut], summary="Список адресов")
+async def get_addresses(
+    cursor: str | None = Query(None, description="Курсор следующей страницы"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT, description="Размер страницы"),
+    db: AsyncSession = Depends(get_session)
+):
+    return await paginate(db, select(Address), (Address.createDateTime, Address.id), cursor, limit)
 
 
 @router.get("/{address_id}", response_model=AddressOut, summary="Получить адрес по ID")
@@ -27,29 +31,18 @@ async def get_address(address_id: UUID, db: AsyncSession = Depends(get_session))
 
 @router.post("/", response_model=AddressOut, summary="Создать адрес")
 async def create_address(address: AddressCreate, db: AsyncSession = Depends(get_session)):
-    db_address = Address(**address.dict())
-    db.add(db_address)
+    db_address = await insert_returning(db, Address, **address.dict())
     await db.commit()
-    await db.refresh(db_address)
     return db_address
 
 
 @router.put("/{address_id}", response_model=AddressOut, summary="Обновить адрес")
 async def update_address(address_id: UUID, address: AddressCreate, db: AsyncSession = Depends(get_session)):
-    result = await db.execute(select(Address).where(Address.id == address_id))
-    db_address = result.scalar_one_or_none()
+    db_address = await update_returning(db, Address, address_id, **address.dict())
     if not db_address:
         raise HTTPException(status_code=404, detail="Адрес не найден")
 
-    for key, value in address.dict().items():
-        setattr(db_address, key, value)
-
-    if hasattr(db_address, "changeDateTime"):
-        db_address.changeDateTime = datetime.utcnow()
-
-    db.add(db_address)
     await db.commit()
-    await db.refresh(db_address)
     return db_address
 
 
@@ -122,16 +115,14 @@ async def bulk_upload_addresses(
                 'latitude': float(row['latitude']) if pd.notna(row['latitude']) else None,
                 'longitude': float(row['longitude']) if pd.notna(row['longitude']) else None,
             }
-            addresses_to_create.append(Address(**address_data))
+            addresses_to_create.append(address_data)
             existing_addresses.add(address_1c)
 
             new_addresses_count += 1
         
-        if addresses_to_create:
-            db.add_all(addresses_to_create)
-            await db.commit()
-            for address in addresses_to_create:
-                await db.refresh(address)
+        # Один INSERT ... RETURNING на всю пачку вместо refresh каждой строки
+        addresses_to_create = await insert_many_returning(db, Address, addresses_to_create)
+        await db.commit()
         
         return {
             "message": "Обработка файла завершена",
@@ -1,8 +1,8 @@
-from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from database.database_app import get_session
+from database.writes import insert_returning, update_returning
 from models import DeliveryType
 from schemas.schemas import DeliveryTypeCreate, DeliveryTypeOut
 from uuid import UUID
@@ -27,10 +27,8 @@ async def get_delivery_type(delivery_type_id: UUID, db: AsyncSession = Depends(g
 
 @router.post("/", response_model=DeliveryTypeOut, summary="Создать тип доставки")
 async def create_delivery_type(delivery_type: DeliveryTypeCreate, db: AsyncSession = Depends(get_session)):
-    db_type = DeliveryType(**delivery_type.dict())
-    db.add(db_type)
+    db_type = await insert_returning(db, DeliveryType, **delivery_type.dict())
     await db.commit()
-    await db.refresh(db_type)
     return db_type
 
 
@@ -40,19 +38,11 @@ async def update_delivery_type(
     delivery_type: DeliveryTypeCreate,
     db: AsyncSession = Depends(get_session)
 ):
-    result = await db.execute(select(DeliveryType).where(DeliveryType.id == delivery_type_id))
-    db_type = result.scalar_one_or_none()
+    db_type = await update_returning(db, DeliveryType, delivery_type_id, **delivery_type.dict())
     if not db_type:
         raise HTTPException(status_code=404, detail="Тип доставки не найден")
 
-    for key, value in delivery_type.dict().items():
-        setattr(db_type, key, value)
-
-    if hasattr(db_type, "changeDateTime"):
-        db_type.changeDateTime = datetime.utcnow()
-
     await db.commit()
-    await db.refresh(db_type)
     return db_type
 
 
@@ -0,0 +1,276 @@
+import asyncio
+import csv
+import io
+import tempfile
+from datetime import date, datetime, timedelta
+from enum import Enum
+from uuid import UUID
+from zoneinfo import ZoneInfo
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from openpyxl import Workbook
+from sqlalchemy import BigInteger, Date, Float, String, and_, cast, func, literal, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from columnar import COORD_SCALE, LogColumnsWriter
+from crud import vehicle_logs_query
+from database.daily_stats import daily_rows
+from database.database_app import async_engine, get_session
+from models import Address, LogEntry, RoutePlan, RoutePoint, StatusEnum, Store, User, Vehicle
+from routers.auth import get_current_user
+
+router = APIRouter(prefix="/export", tags=["Экспорт"])
+
+# Выгрузки читаются курсором на сервере БД порциями по EXPORT_CHUNK_ROWS строк
+# и отдаются клиенту по мере чтения, поэтому память воркера не растёт с периодом.
+EXPORT_CHUNK_ROWS = 2000
+# Время в выгрузках — местное, как в журнале логов
+EXPORT_TZ = ZoneInfo("Asia/Barnaul")
+# Собранный xlsx отдаётся клиенту кусками
+XLSX_READ_CHUNK = 1024 * 1024
+# GPS-история читается группами «машина за день» — по LOG_EXPORT_CHUNK_GROUPS за раз
+LOG_EXPORT_CHUNK_GROUPS = 200
+
+
+class ExportFormat(str, Enum):
+    csv = "csv"
+    xlsx = "xlsx"
+
+
+POINT_COLUMNS = [
+    ("Дата маршрута", "route_date"),
+    ("Водитель", "driver"),
+    ("Госномер", "plate_number"),
+    ("№", "order"),
+    ("Документ", "doc"),
+    ("Контрагент", "counterparty"),
+    ("Магазин", "store"),
+    ("Адрес", "address"),
+    ("Статус", "status"),
+    ("Прибытие", "arrival_time"),
+    ("Убытие", "departure_time"),
+    ("Время на точке, мин", "duration_minutes"),
+    ("Оплата", "payment"),
+    ("Комментарий", "note"),
+]
+
+DRIVER_COLUMNS = [
+    ("День", "day"),
+    ("Водитель", "driver"),
+    ("Всего точек", "points_total"),
+    ("Завершено", "points_completed"),
+    ("Пропущено", "points_skipped"),
+    ("Запланировано", "points_planned"),
+    ("В пути", "points_en_route"),
+    ("На точке", "points_arrived"),
+    ("Оплата", "payment_sum"),
+    ("Среднее время на точке, мин", "avg_duration_minutes"),
+]
+
+
+def _points_query(start_date: date, end_date: date):
+    return (
+        select(
+            func.date(RoutePlan.date).label("route_date"),
+            func.concat_ws(" ", User.last_name, User.first_name, User.middle_name).label("driver"),
+            Vehicle.plate_number,
+            RoutePoint.order,
+            RoutePoint.doc,
+            RoutePoint.counterparty,
+            Store.name_1c.label("store"),
+            Address.address_1c.label("address"),
+            RoutePoint.current_status.label("status"),
+            RoutePoint.arrival_time,
+            RoutePoint.departure_time,
+            RoutePoint.duration_minutes,
+            RoutePoint.payment,
+            RoutePoint.note,
+        )
+        .join(RoutePlan, RoutePoint.route_plan_id == RoutePlan.id)
+        .outerjoin(Vehicle, Vehicle.id == RoutePlan.vehicle_id)
+        .outerjoin(User, User.id == Vehicle.owner_id)
+        .outerjoin(Store, Store.id == RoutePoint.store_id)
+        .outerjoin(Address, Address.id == RoutePoint.address_id)
+        .where(
+            RoutePlan.date >= literal(start_date, Date),
+            RoutePlan.date < literal(end_date + timedelta(days=1), Date),
+        )
+        .order_by(RoutePlan.date, RoutePlan.id, RoutePoint.order)
+    )
+
+
+def _drivers_query(start_date: date, end_date: date):
+    rows = daily_rows("driver", start_date, end_date)
+    return (
+        select(
+            rows.c.day,
+            func.concat_ws(" ", User.last_name, User.first_name, User.middle_name).label("driver"),
+            rows.c.points_total,
+            rows.c.points_completed,
+            rows.c.points_skipped,
+            rows.c.points_planned,
+            rows.c.points_en_route,
+            rows.c.points_arrived,
+            rows.c.payment_sum,
+            (cast(rows.c.duration_sum, Float) / func.nullif(rows.c.duration_count, 0)).label("avg_duration_minutes"),
+        )
+        .join(User, User.id == rows.c.driver_id)
+        .order_by(rows.c.day, User.last_name, User.first_name)
+    )
+
+
+def _cell(value):
+    """Значение ячейки: время — местное без пояса (openpyxl не пишет aware-datetime), статусы — строкой."""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(EXPORT_TZ).replace(tzinfo=None)
+        return value
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+async def _stream_rows(query, fields: list[str]):
+    """Порции строк запроса с серверного курсора; сессия своя — зависимость закрывается до отправки тела."""
+    async with AsyncSession(async_engine) as session:
+        result = await session.stream(query.execution_options(yield_per=EXPORT_CHUNK_ROWS))
+        async for partition in result.mappings().partitions():
+            yield [[_cell(row[field]) for field in fields] for row in partition]
+
+
+async def _csv_body(query, columns):
+    # ';' и BOM — файл сразу открывается в Excel с русской локалью
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    writer.writerow([title for title, _ in columns])
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+
+    async for rows in _stream_rows(query, [field for _, field in columns]):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def _xlsx_body(query, columns, title: str):
+    # write_only-книга держит строки во временном файле, а не в памяти;
+    # xlsx — zip-архив, поэтому отдаём его после сборки, читая файл кусками
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append([title for title, _ in columns])
+
+    async for rows in _stream_rows(query, [field for _, field in columns]):
+        await asyncio.to_thread(lambda: [sheet.append(row) for row in rows])
+
+    with tempfile.TemporaryFile() as file:
+        await asyncio.to_thread(workbook.save, file)
+        file.seek(0)
+        while chunk := await asyncio.to_thread(file.read, XLSX_READ_CHUNK):
+            yield chunk
+
+
+def _logs_query(vehicle_ids, since: datetime, until: datetime):
+    # Строка на машину за день с колонками-массивами: драйвер разбирает массивы целых
+    # в разы быстрее, чем отдельные строки, а время и координаты переводятся в целые в базе
+    def column(value):
+        return func.array_agg(aggregate_order_by(value, LogEntry.timestamp))
+
+    day = func.date_trunc("day", LogEntry.timestamp)
+    return (
+        vehicle_logs_query(vehicle_ids, since, until)
+        .with_only_columns(
+            cast(LogEntry.vehicle_id, String),
+            column(cast(func.round(func.extract("epoch", LogEntry.timestamp) * 1_000_000), BigInteger)),
+            column(cast(func.round(func.coalesce(LogEntry.latitude, 0) * COORD_SCALE), BigInteger)),
+            column(cast(func.round(func.coalesce(LogEntry.longitude, 0) * COORD_SCALE), BigInteger)),
+            column(and_(LogEntry.latitude.isnot(None), LogEntry.longitude.isnot(None))),
+            column(cast(LogEntry.status, String)),
+        )
+        .group_by(LogEntry.vehicle_id, day)
+        .order_by(LogEntry.vehicle_id, day)
+    )
+
+
+async def _npz_body(query):
+    writer = LogColumnsWriter([status.value for status in StatusEnum])
+    async with AsyncSession(async_engine) as session:
+        result = await session.stream(query.execution_options(yield_per=LOG_EXPORT_CHUNK_GROUPS))
+        async for partition in result.partitions():
+            await asyncio.to_thread(writer.add, partition)
+
+    with tempfile.TemporaryFile() as file:
+        await asyncio.to_thread(writer.write, file)
+        file.seek(0)
+        while chunk := await asyncio.to_thread(file.read, XLSX_READ_CHUNK):
+            yield chunk
+
+
+def _export_response(query, columns, name: str, title: str, start_date: date, end_date: date, export_format: ExportFormat):
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="Конец периода раньше начала")
+
+    filename = f"{name}_{start_date.isoformat()}_{end_date.isoformat()}.{export_format.value}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if export_format == ExportFormat.xlsx:
+        return StreamingResponse(
+            _xlsx_body(query, columns, title),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers=headers,
+        )
+    return StreamingResponse(_csv_body(query, columns), media_type="text/csv; charset=utf-8", headers=headers)
+
+
+@router.get("/points", summary="Выгрузка точек маршрутов за период")
+async def export_points(
+    start_date: date = Query(..., description="Начало периода"),
+    end_date: date = Query(..., description="Конец периода"),
+    format: ExportFormat = Query(ExportFormat.csv, description="Формат: csv или xlsx"),
+):
+    """Строка на каждую точку маршрута: маршрут, водитель, машина, магазин, статус, время и оплата."""
+    return _export_response(
+        _points_query(start_date, end_date), POINT_COLUMNS, "points", "Точки", start_date, end_date, format
+    )
+
+
+@router.get("/drivers", summary="Выгрузка статистики водителей по дням за период")
+async def export_drivers(
+    start_date: date = Query(..., description="Начало периода"),
+    end_date: date = Query(..., description="Конец периода"),
+    format: ExportFormat = Query(ExportFormat.csv, description="Формат: csv или xlsx"),
+):
+    """Строка на водителя за каждый день с маршрутами: точки по статусам, оплата, среднее время на точке."""
+    return _export_response(
+        _drivers_query(start_date, end_date), DRIVER_COLUMNS, "drivers", "Водители", start_date, end_date, format
+    )
+
+
+@router.get("/logs", summary="Выгрузка GPS-истории машин в колоночном формате NPZ")
+async def export_logs(
+    since: datetime = Query(..., description="Не раньше этого времени"),
+    until: datetime = Query(..., description="Раньше этого времени"),
+    vehicle_id: list[UUID] | None = Query(None, description="Машины пользователя; без параметра — все его машины"),
+    db: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    GPS-логи машин пользователя за интервал [since, until) для аналитики: сжатый NPZ с колонками,
+    время и координаты — разностями соседних строк (формат описан в columnar.py).
+    В разы меньше JSON и читается без разбора:
+    `columnar.logs_frame(np.load(io.BytesIO(response.content)))` — DataFrame
+    с колонками vehicle_id, timestamp, latitude, longitude, status.
+    """
+    if until <= since:
+        raise HTTPException(status_code=400, detail="Конец периода должен быть позже начала")
+    # Как и /logs/all — только машины пользователя
+    vehicle_ids = select(Vehicle.id).where(Vehicle.owner_id == current_user.id)
+    if vehicle_id:
+        owned = set((await db.execute(vehicle_ids.where(Vehicle.id.in_(vehicle_id)))).scalars())
+        if owned != set(vehicle_id):
+            raise HTTPException(status_code=403, detail="У вас нет доступа к этому автомобилю")
+        vehicle_ids = vehicle_id
+    filename = f"logs_{since:%Y%m%dT%H%M}_{until:%Y%m%dT%H%M}.npz"
+    return StreamingResponse(
+        _npz_body(_logs_query(vehicle_ids, since, until)),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,101 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.database_app import get_session
+from fleet import fleet_positions
+from live import Subscription, live_hub
+from models import RoutePlan, Vehicle
+
+router = APIRouter(prefix="/fleet", tags=["Автопарк"])
+
+# Комментарий-пинг в потоке, чтобы прокси не закрывали молчащее соединение
+HEARTBEAT_SECONDS = 15
+
+
+def _bbox(min_lat, min_lon, max_lat, max_lon) -> tuple | None:
+    bounds = (min_lat, min_lon, max_lat, max_lon)
+    if all(value is None for value in bounds):
+        return None
+    if any(value is None for value in bounds):
+        raise HTTPException(status_code=400, detail="Область задаётся всеми четырьмя границами")
+    if max_lat < min_lat or max_lon < min_lon:
+        raise HTTPException(status_code=400, detail="Неверные границы области")
+    return bounds
+
+
+@router.get("/positions", summary="Последнее положение машин")
+async def get_positions(
+    min_lat: float | None = Query(None, ge=-90, le=90, description="Южная граница области"),
+    min_lon: float | None = Query(None, ge=-180, le=180, description="Западная граница области"),
+    max_lat: float | None = Query(None, ge=-90, le=90, description="Северная граница области"),
+    max_lon: float | None = Query(None, ge=-180, le=180, description="Восточная граница области"),
+    since: datetime | None = Query(None, description="Только положения, обновлённые позже (время без пояса — UTC)"),
+):
+    """
+    Последняя известная отметка каждой машины: координаты, статус, время и источник
+    (gps — лог машины, point — статус точки маршрута, loading — статус погрузки) и время получения updated_at.
+
+    Отдаётся из памяти без запроса к базе — карту можно опрашивать каждые несколько секунд;
+    с since приходят только машины, сдвинувшиеся с прошлого опроса (передавайте server_time прошлого ответа).
+    """
+    bbox = _bbox(min_lat, min_lon, max_lat, max_lon)
+    server_time = datetime.now(timezone.utc)
+    items = fleet_positions.positions(bbox, since)
+    return {"server_time": server_time, "count": len(items), "items": items}
+
+
+async def _event_stream(subscription: Subscription):
+    live_hub.subscribe(subscription)
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            data = json.dumps(event, ensure_ascii=False)  # событие уже разобрано из JSON канала
+            yield f"event: {event['type']}\ndata: {data}\n\n"
+    finally:
+        live_hub.unsubscribe(subscription)
+
+
+@router.get("/live", summary="Живая лента положений и статусов (SSE)")
+async def live_events(
+    route_id: UUID | None = Query(None, description="Маршрут: положения его машины и статусы его точек и погрузки"),
+    driver_id: UUID | None = Query(None, description="Водитель: положения и статусы его машин"),
+    min_lat: float | None = Query(None, ge=-90, le=90, description="Южная граница области"),
+    min_lon: float | None = Query(None, ge=-180, le=180, description="Западная граница области"),
+    max_lat: float | None = Query(None, ge=-90, le=90, description="Северная граница области"),
+    max_lon: float | None = Query(None, ge=-180, le=180, description="Восточная граница области"),
+    db: AsyncSession = Depends(get_session),
+):
+    """
+    Поток Server-Sent Events: события position (GPS-отметка машины), point_status и loading_status
+    приходят сразу после коммита записи — в том числе записанной другим процессом приложения.
+    Фильтры складываются: маршрут и водитель сужают поток до их машин, область — до событий внутри неё.
+    Без фильтров приходят все события. Медленный клиент теряет самые старые события из своей очереди.
+    """
+    subscription = Subscription(bbox=_bbox(min_lat, min_lon, max_lat, max_lon))
+    if route_id is not None:
+        vehicle_id = await db.scalar(select(RoutePlan.vehicle_id).where(RoutePlan.id == route_id))
+        if vehicle_id is None:
+            raise HTTPException(status_code=404, detail="Маршрут не найден")
+        subscription.vehicle_ids = {str(vehicle_id)}
+        subscription.route_ids = {str(route_id)}
+    if driver_id is not None:
+        vehicle_ids = {str(v) for v in (await db.scalars(select(Vehicle.id).where(Vehicle.owner_id == driver_id))).all()}
+        if not vehicle_ids:
+            raise HTTPException(status_code=404, detail="У водителя нет машин")
+        subscription.vehicle_ids = vehicle_ids if subscription.vehicle_ids is None else subscription.vehicle_ids & vehicle_ids
+    await db.close()  # соединение из пула не держим всё время подписки
+
+    return StreamingResponse(
+        _event_stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,8 +1,8 @@
-from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from database.database_app import get_session
+from database.writes import insert_returning, update_returning
 from models import LegalEntityType
 from schemas.schemas import LegalEntityTypeCreate, LegalEntityTypeOut
 from uuid import UUID
@@ -27,27 +27,18 @@ async def get_legal_entity(entity_id: UUID, db: AsyncSession = Depends(get_sessi
 
 @router.post("/", response_model=LegalEntityTypeOut, summary="Создать тип юридического лица")
 async def create_legal_entity(entity: LegalEntityTypeCreate, db: AsyncSession = Depends(get_session)):
-    db_entity = LegalEntityType(**entity.dict())
-    db.add(db_entity)
+    db_entity = await insert_returning(db, LegalEntityType, **entity.dict())
     await db.commit()
-    await db.refresh(db_entity)
     return db_entity
 
 
 @router.put("/{entity_id}", response_model=LegalEntityTypeOut, summary="Обновить тип юридического лица")
 async def update_legal_entity(entity_id: UUID, entity: LegalEntityTypeCreate, db: AsyncSession = Depends(get_session)):
-    result = await db.execute(select(LegalEntityType).where(LegalEntityType.id == entity_id))
-    db_entity = result.scalar_one_or_none()
+    db_entity = await update_returning(db, LegalEntityType, entity_id, **entity.dict())
     if not db_entity:
         raise HTTPException(status_code=404, detail="Тип юридического лица не найден")
 
-    for key, value in entity.dict().items():
-        setattr(db_entity, key, value)
-
-    if hasattr(db_entity, "changeDateTime"):
-        db_entity.changeDateTime = datetime.utcnow()
     await db.commit()
-    await db.refresh(db_entity)
     return db_entity
 
 
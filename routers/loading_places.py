@@ -1,19 +1,24 @@
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from database.database_app import get_session
+from database.writes import insert_returning, update_returning
 from models import LoadingPlace, Address
+from pagination import DEFAULT_LIMIT, MAX_LIMIT, paginate
 from uuid import UUID
 
 router = APIRouter(prefix="/loading_places", tags=["Места загрузок"])
 
 
 # ===================== Получить все =====================
-@router.get("/", summary="Получить список всех мест загрузок")
-async def get_all_loading_places(db: AsyncSession = Depends(get_session)):
-    result = await db.execute(select(LoadingPlace))
-    return result.scalars().all()
+@router.get("/", summary="Получить список мест загрузок постранично")
+async def get_all_loading_places(
+    cursor: str | None = Query(None, description="Курсор следующей страницы"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT, description="Размер страницы"),
+    db: AsyncSession = Depends(get_session)
+):
+    return await paginate(db, select(LoadingPlace), (LoadingPlace.createDateTime, LoadingPlace.id), cursor, limit)
 
 
 # ===================== Получить одно =====================
@@ -44,7 +49,9 @@ async def create_loading_place(
     if not address:
         raise HTTPException(status_code=400, detail="Указанный адрес не найден")
 
-    new_place = LoadingPlace(
+    new_place = await insert_returning(
+        db,
+        LoadingPlace,
         name=name,
         address_id=address.id,
         contact_name=contact_name,
@@ -53,10 +60,7 @@ async def create_loading_place(
         note=note,
         uuid_1c=uuid_1c
     )
-
-    db.add(new_place)
     await db.commit()
-    await db.refresh(new_place)
     return new_place
 
 
@@ -71,26 +75,23 @@ async def update_loading_place(
     note: str | None = None,
     db: AsyncSession = Depends(get_session)
 ):
-    result = await db.execute(select(LoadingPlace).where(LoadingPlace.id == loading_place_id))
-    place = result.scalars().first()
-    if not place:
-        raise HTTPException(status_code=404, detail="Место загрузки не найдено")
-
+    values = {}
     if name is not None:
-        place.name = name
+        values["name"] = name
     if contact_name is not None:
-        place.contact_name = contact_name
+        values["contact_name"] = contact_name
     if phone is not None:
-        place.phone = phone
+        values["phone"] = phone
     if work_hours is not None:
-        place.work_hours = work_hours
+        values["work_hours"] = work_hours
     if note is not None:
-        place.note = note
+        values["note"] = note
+
+    place = await update_returning(db, LoadingPlace, loading_place_id, changeDateTime=datetime.utcnow(), **values)
+    if not place:
+        raise HTTPException(status_code=404, detail="Место загрузки не найдено")
 
-    place.changeDateTime = datetime.utcnow()
-    db.add(place)
     await db.commit()
-    await db.refresh(place)
     return place
 
 
@@ -3,6 +3,9 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from database.database_app import get_session
+from database.writes import insert_returning, update_returning
+from database.daily_stats import mark_routes_changed
+from database.status_tracking import apply_loading_status
 from routers.auth import get_current_user
 from models import Address, Loading, LoadingPlace, LoadingStatusLog, RoutePointStatusEnum, Vehicle, RoutePlan, User
 from datetime import datetime
@@ -44,14 +47,15 @@ async def add_loading_to_route(
     if not loading_place:
         if not loading_place_name or not address:
             raise HTTPException(status_code=400, detail="Для нового места погрузки нужно указать 'loading_place_name' и 'address'")
-        addr = Address(address_1c=address)
-        db.add(addr)
-        await db.flush()
-        loading_place = LoadingPlace(uuid_1c=loading_place_uuid, name=loading_place_name, address_id=addr.id)
-        db.add(loading_place)
-        await db.flush()
-
-    loading = Loading(
+        # Адрес, место и погрузка создаются в одной транзакции — по одному INSERT ... RETURNING
+        addr = await insert_returning(db, Address, address_1c=address)
+        loading_place = await insert_returning(
+            db, LoadingPlace, uuid_1c=loading_place_uuid, name=loading_place_name, address_id=addr.id
+        )
+
+    loading = await insert_returning(
+        db,
+        Loading,
         route_plan_id=route.id,
         loading_place_id=loading_place.id,
         start_time=start_time,
@@ -61,11 +65,8 @@ async def add_loading_to_route(
         weight=weight,
         note=note
     )
-    loading.changeDateTime = datetime.utcnow()
-
-    db.add(loading)
+    await mark_routes_changed(db, [route.id])
     await db.commit()
-    await db.refresh(loading)
     return loading
 
 
@@ -125,11 +126,6 @@ async def update_loading(
     status: str | None = None,
     db: AsyncSession = Depends(get_session)
 ):
-    result = await db.execute(select(Loading).where(Loading.id == loading_id))
-    loading = result.scalars().first()
-    if not loading:
-        raise HTTPException(status_code=404, detail="Погрузка не найдена")
-
     updates = dict(
         start_time=start_time,
         end_time=end_time,
@@ -139,15 +135,14 @@ async def update_loading(
         note=note,
         status=status
     )
-    for k, v in updates.items():
-        if v is not None and hasattr(loading, k):
-            setattr(loading, k, v)
+    values = {k: v for k, v in updates.items() if v is not None and hasattr(Loading, k)}
+
+    loading = await update_returning(db, Loading, loading_id, changeDateTime=datetime.utcnow(), **values)
+    if not loading:
+        raise HTTPException(status_code=404, detail="Погрузка не найдена")
 
-    loading.changeDateTime = datetime.utcnow()
-    
-    db.add(loading)
+    await mark_routes_changed(db, [loading.route_plan_id])
     await db.commit()
-    await db.refresh(loading)
     return loading
 
 
@@ -159,6 +154,7 @@ async def delete_loading(loading_id: UUID, db: AsyncSession = Depends(get_sessio
     if not loading:
         raise HTTPException(status_code=404, detail="Погрузка не найдена")
 
+    await mark_routes_changed(db, [loading.route_plan_id])
     await db.delete(loading)
     await db.commit()
     return {"detail": "Погрузка успешно удалена"}
@@ -184,26 +180,17 @@ async def add_loading_log(
     if not loading:
         raise HTTPException(status_code=404, detail="Погрузка не найдена")
 
-    # Создаём лог
-    log = LoadingStatusLog(
-        loading_id=loading.id,
-        status=status,
-        note=note,
-        latitude=latitude,
-        longitude=longitude
-    )
-    db.add(log)
-
-    # Обновляем статус самой погрузки
-    loading.status = status
+    # Лог и статус самой погрузки — в одной транзакции
+    coordinates = {}
     if latitude is not None:
-        loading.latitude = latitude
+        coordinates["latitude"] = latitude
     if longitude is not None:
-        loading.longitude = longitude
-    db.add(loading)
+        coordinates["longitude"] = longitude
 
+    loading = await apply_loading_status(
+        db, loading, status, datetime.utcnow(), latitude, longitude, note, coordinates
+    )
     await db.commit()
-    await db.refresh(loading)
 
     return {
         "detail": "Статус обновлён",
@@ -237,22 +224,8 @@ async def update_loading_status(
     if loading.route_plan.vehicle.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Нет доступа")
 
-    # Обновляем статус
-    loading.status = status
-
-    # Создаем лог статуса
-    from models import LoadingStatusLog
-    log = LoadingStatusLog(
-        loading_id=loading.id,
-        status=status,
-        timestamp=datetime.utcnow(),
-        latitude=latitude,
-        longitude=longitude,
-        note=note
-    )
-
-    db.add_all([loading, log])
+    # Статус и лог статуса
+    loading = await apply_loading_status(db, loading, status, datetime.utcnow(), latitude, longitude, note)
     await db.commit()
-    await db.refresh(loading)
     return loading
 
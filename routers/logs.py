@@ -17,17 +17,28 @@ async def get_vehicle_by_user(db: AsyncSession, user_id: UUID, vehicle_id: UUID)
     )
     vehicle = result.scalars().first()
     return vehicle
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from datetime import datetime, timedelta
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from database.database_app import get_session
 from routers.auth import get_current_user
-from schemas.schemas import LogCreate, LogOut
+from schemas.schemas import LogBatchOut, LogCreate, LogFix, LogOut, Page
 from models import LogEntry, User, Vehicle
-from crud import create_log, get_vehicle_logs
+from crud import create_log, create_logs, get_vehicle_logs, queue_log, queue_logs, vehicle_logs_query
+from database.write_buffer import BufferFull
+from pagination import DEFAULT_LIMIT, MAX_LIMIT, paginate
+from geo import simplify_track
 
 router = APIRouter(prefix="/logs", tags=["Логи"])
 
+# Отметок в одной пачке: несколько часов записи трека без связи
+LOG_BATCH_MAX = 10_000
+# Окно упрощённого трека: сырые отметки окна читаются в память целиком
+TRACK_MAX_DAYS = 7
+
 # Получение автомобиля пользователя по его id
 async def get_user_vehicle(db: AsyncSession, user_id: int):
     result = await db.execute(
@@ -37,48 +48,154 @@ async def get_user_vehicle(db: AsyncSession, user_id: int):
     return vehicle
 
 # Добавление лога для машины пользователя (автомобиль выбирается автоматически)
-@router.post("/", response_model=LogOut, summary="Добавить лог", description="Записывает новое событие: смена статуса, геопозиция и время")
-async def add_log(log: LogCreate, db: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+@router.post("/", response_model=LogOut, summary="Добавить лог", description="Записывает новое событие: смена статуса, геопозиция и время. С buffered=true ответ приходит сразу, а запись попадает в базу общей пачкой в течение долей секунды. Повтор предыдущей отметки (тот же статус и место, меньше минуты спустя) не записывается — в ответе отметка, с которой он слился")
+async def add_log(
+    log: LogCreate,
+    buffered: bool = Query(False, description="Отложенная запись через общий буфер"),
+    db: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
     vehicle = await get_user_vehicle(db, current_user.id)
     
     if not vehicle:
         raise HTTPException(status_code=403, detail="У вас нет автомобилей для записи логов")
     
+    if buffered:
+        try:
+            return await queue_log(vehicle.id, log)
+        except BufferFull:
+            raise HTTPException(status_code=503, detail="Очередь записи логов переполнена, повторите позже")
+
     return await create_log(db, vehicle.id, log)
 
+# Пачка логов для машины пользователя: машина определяется один раз, строки пишутся одним INSERT
+@router.post("/batch", response_model=LogBatchOut, summary="Добавить пачку логов", description="Записывает накопленные приложением отметки (до 10 000 за раз) и возвращает их число. Время без пояса считается местным, без времени — временем приёма. Повторы отметок на месте не записываются и считаются в dropped")
+async def add_logs_batch(
+    fixes: list[LogFix],
+    buffered: bool = Query(False, description="Отложенная запись через общий буфер"),
+    db: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    if len(fixes) > LOG_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"В пачке больше {LOG_BATCH_MAX} отметок, разделите её")
+
+    vehicle = await get_user_vehicle(db, current_user.id)
+
+    if not vehicle:
+        raise HTTPException(status_code=403, detail="У вас нет автомобилей для записи логов")
+
+    if buffered:
+        try:
+            queued = len(await queue_logs(vehicle.id, fixes))
+        except BufferFull:
+            raise HTTPException(status_code=503, detail="Очередь записи логов переполнена, повторите позже")
+        return {"received": len(fixes), "inserted": 0, "queued": queued, "dropped": len(fixes) - queued}
+
+    inserted = await create_logs(db, vehicle.id, fixes) if fixes else 0
+    return {"received": len(fixes), "inserted": inserted, "dropped": len(fixes) - inserted}
+
 # Получение логов для машины пользователя (автомобиль выбирается автоматически)
-@router.get("/", response_model=list[LogOut], summary="История машины", description="Возвращает все логи для выбранной машины")
-async def get_logs(db: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+@router.get("/", response_model=Page[LogOut], summary="История машины", description="Возвращает логи машины за интервал [since, until) постранично, новые сначала")
+async def get_logs(
+    since: datetime | None = Query(None, description="Не раньше этого времени"),
+    until: datetime | None = Query(None, description="Раньше этого времени"),
+    cursor: str | None = Query(None, description="Курсор следующей страницы"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT, description="Размер страницы"),
+    db: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
     vehicle = await get_user_vehicle(db, current_user.id)
 
     if not vehicle:
         raise HTTPException(status_code=403, detail="У вас нет автомобилей для получения логов")
     
-    return await get_vehicle_logs(db, vehicle.id)
+    return await get_vehicle_logs(db, vehicle.id, since, until, cursor, limit)
 
 # Получение всех логов для всех машин пользователя
-@router.get("/all", response_model=list[LogOut], summary="Все логи", description="Возвращает список всех логов по всем машинам пользователя")
-async def get_all_logs(db: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
-    user_vehicles = current_user.vehicles
-    
-    if not user_vehicles:
-        return []
-    
-    vehicle_ids = [vehicle.id for vehicle in user_vehicles]
-    result = await db.execute(
-        select(LogEntry).where(LogEntry.vehicle_id.in_(vehicle_ids))
-    )
-    return result.scalars().all()
+@router.get("/all", response_model=Page[LogOut], summary="Все логи", description="Возвращает логи по всем машинам пользователя за интервал [since, until) постранично, новые сначала")
+async def get_all_logs(
+    since: datetime | None = Query(None, description="Не раньше этого времени"),
+    until: datetime | None = Query(None, description="Раньше этого времени"),
+    cursor: str | None = Query(None, description="Курсор следующей страницы"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT, description="Размер страницы"),
+    db: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    # Машины пользователя — подзапросом в том же запросе: ленивая связь current_user.vehicles
+    # в асинхронной сессии не загружается
+    vehicle_ids = select(Vehicle.id).where(Vehicle.owner_id == current_user.id)
+    # Журнал только дописывается, поэтому ключ страницы — время фиксации (ключ секционирования)
+    query = vehicle_logs_query(vehicle_ids, since, until)
+    return await paginate(db, query, (LogEntry.timestamp, LogEntry.id), cursor, limit)
 
 # Получение логов для автомобилей пользователя
-@router.get("/{vehicle_id}", response_model=list[LogOut], summary="История машины", description="Возвращает все логи для выбранной машины")
-async def get_logs(vehicle_id: UUID, db: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+@router.get("/{vehicle_id}", response_model=Page[LogOut], summary="История машины", description="Возвращает логи выбранной машины за интервал [since, until) постранично, новые сначала")
+async def get_logs(
+    vehicle_id: UUID,
+    since: datetime | None = Query(None, description="Не раньше этого времени"),
+    until: datetime | None = Query(None, description="Раньше этого времени"),
+    cursor: str | None = Query(None, description="Курсор следующей страницы"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT, description="Размер страницы"),
+    db: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
     vehicle = await get_vehicle_by_user(db, current_user.id, vehicle_id)
 
     if not vehicle:
         raise HTTPException(status_code=403, detail="У вас нет доступа к этому автомобилю")
     
-    return await get_vehicle_logs(db, vehicle_id)
+    return await get_vehicle_logs(db, vehicle_id, since, until, cursor, limit)
+
+# Упрощённый трек машины для карты
+@router.get("/{vehicle_id}/track", summary="Трек машины для карты", description="Упрощённая ломаная трека за интервал: точки, без которых линия отклоняется не больше чем на tolerance_m метров, не больше max_points штук. Точки смены статуса сохраняются всегда")
+async def get_track(
+    vehicle_id: UUID,
+    start: datetime = Query(..., description="Начало интервала"),
+    end: datetime = Query(..., description="Конец интервала"),
+    tolerance_m: float = Query(5, ge=0, le=1000, description="Допуск отклонения в метрах, 0 — без упрощения по допуску"),
+    max_points: int | None = Query(None, ge=2, le=50_000, description="Не больше стольких точек"),
+    db: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    if end <= start:
+        raise HTTPException(status_code=400, detail="Конец интервала раньше начала")
+    if end - start > timedelta(days=TRACK_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"Трек доступен за интервал не больше {TRACK_MAX_DAYS} дней")
+
+    vehicle = await get_vehicle_by_user(db, current_user.id, vehicle_id)
+
+    if not vehicle:
+        raise HTTPException(status_code=403, detail="У вас нет доступа к этому автомобилю")
+
+    # Только нужные колонки и без ORM-объектов — отметок за день бывают десятки тысяч
+    result = await db.execute(
+        select(LogEntry.timestamp, LogEntry.latitude, LogEntry.longitude, LogEntry.status)
+        .where(
+            LogEntry.vehicle_id == vehicle_id,
+            LogEntry.timestamp >= start,
+            LogEntry.timestamp < end,
+            LogEntry.latitude.isnot(None),
+            LogEntry.longitude.isnot(None),
+        )
+        .order_by(LogEntry.timestamp)
+    )
+    rows = result.all()
+
+    lat = np.array([r.latitude for r in rows], dtype=float)
+    lon = np.array([r.longitude for r in rows], dtype=float)
+    status = np.array([r.status.value if r.status else "" for r in rows])
+    indices = await asyncio.to_thread(simplify_track, lat, lon, status, tolerance_m, max_points)
+
+    # Ответ по колонкам: i-й элемент каждого массива — одна точка ломаной
+    return {
+        "vehicle_id": vehicle_id,
+        "total": len(rows),
+        "count": len(indices),
+        "timestamp": [rows[i].timestamp for i in indices],
+        "latitude": np.round(lat[indices], 6).tolist(),
+        "longitude": np.round(lon[indices], 6).tolist(),
+        "status": status[indices].tolist(),
+    }
 
 
 
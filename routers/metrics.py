@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from database.database_app import async_engine
+import metrics
+
+router = APIRouter(tags=["Мониторинг"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, summary="Метрики в формате Prometheus")
+async def get_metrics():
+    metrics.update_pool_metrics(async_engine.pool)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,20 +1,342 @@
-from fastapi import APIRouter, Query, Depends
+import asyncio
+import math
+from enum import Enum
+from fastapi import APIRouter, HTTPException, Query, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import desc, select, func, case
-from datetime import date
-from database.database_app import get_session
+from sqlalchemy import ARRAY, JSON, Date, DateTime, Float, Integer, cast, desc, exists, literal, or_, select, func, case, text, type_coerce, union_all
+from sqlalchemy.dialects.postgresql import array
+from datetime import date, datetime, time, timedelta
+from uuid import UUID
+from database.daily_stats import LEVELS, VALUE_COLUMNS, aggregate_select, daily_rows
+from database.database_app import async_engine
+from database.partitions import status_log_bounds
 from models import (
-    RoutePointStatusLog, User, Vehicle, RoutePlan, RoutePoint, RoutePointStatusEnum
+    Address, Loading, LoadingPlace, LoadingStatusLog, LogEntry, Store, User, Vehicle, RoutePlan, RoutePoint, RoutePointStatusEnum, RoutePointStatusLog,
+    VehicleDailyMileage
 )
 from sqlalchemy.sql import over
+from stats_cache import stats_cache
 
 router = APIRouter(prefix="/statistics", tags=["Статистика"])
 
+
+class StatsMode(str, Enum):
+    sequential = "sequential"  # разделы по очереди в одной сессии
+    concurrent = "concurrent"  # разделы параллельно, каждый на своём соединении из пула
+    single = "single"  # один запрос: общие наборы в MATERIALIZED CTE, разделы собираются в json
+
+
+# ===================== Запросы разделов =====================
+def _plan_period(start_date: date, end_date: date):
+    return (
+        RoutePlan.date >= literal(start_date, Date),
+        RoutePlan.date < literal(end_date + timedelta(days=1), Date),
+    )
+
+
+def _all_routes_rows(vehicle_rows, start_date: date, end_date: date):
+    # Агрегаты по машинам не видят маршрутов без машины — их точки досчитываются по сырым строкам
+    unassigned = aggregate_select("vehicle", start_date, end_date, unassigned=True).subquery()
+    return union_all(
+        select(*(vehicle_rows.c[c] for c in VALUE_COLUMNS)),
+        select(*(unassigned.c[c] for c in VALUE_COLUMNS)),
+    ).subquery()
+
+
+def _totals_query(rows):
+    return select(
+        func.coalesce(func.sum(rows.c.points_with_status), 0).label("points_with_status"),
+        func.coalesce(func.sum(rows.c.points_planned), 0).label("planned"),
+        func.coalesce(func.sum(rows.c.points_en_route), 0).label("en_route"),
+        func.coalesce(func.sum(rows.c.points_arrived), 0).label("arrived"),
+        func.coalesce(func.sum(rows.c.points_completed), 0).label("completed"),
+        func.coalesce(func.sum(rows.c.points_skipped), 0).label("skipped"),
+        func.coalesce(func.sum(rows.c.payment_with_status_sum), 0).label("payment_with_status_sum"),
+        func.coalesce(func.sum(rows.c.duration_sum), 0).label("duration_sum"),
+        func.coalesce(func.sum(rows.c.duration_count), 0).label("duration_count"),
+    )
+
+
+def _legs_query(start_date: date, end_date: date):
+    """
+    Точки с прибытием за период: время работы и время в пути от предыдущей точки маршрута —
+    от её убытия до прибытия на эту (lag() по прибытиям внутри маршрута).
+    """
+    previous_departure = func.lag(RoutePoint.departure_time).over(
+        partition_by=RoutePoint.route_plan_id,
+        order_by=(RoutePoint.arrival_time, RoutePoint.order),
+    )
+    return (
+        select(
+            RoutePoint.id,
+            RoutePoint.address_id,
+            RoutePoint.store_id,
+            Vehicle.owner_id.label("driver_id"),
+            RoutePoint.duration_minutes.label("service_minutes"),
+            func.extract("epoch", RoutePoint.arrival_time - previous_departure).label("travel_seconds"),
+        )
+        .join(RoutePlan, RoutePoint.route_plan_id == RoutePlan.id)
+        .outerjoin(Vehicle, Vehicle.id == RoutePlan.vehicle_id)
+        .where(
+            RoutePlan.date >= literal(start_date, Date),
+            RoutePlan.date < literal(end_date + timedelta(days=1), Date),
+            RoutePoint.arrival_time.isnot(None),
+        )
+    ).subquery("legs")
+
+
+def _longest_road_query(start_date: date, end_date: date):
+    legs = _legs_query(start_date, end_date)
+    return (
+        select(
+            legs.c.id,
+            Address.address_1c.label("address"),
+            legs.c.travel_seconds.label("travel_time")
+        )
+        .outerjoin(Address, Address.id == legs.c.address_id)
+        .where(legs.c.travel_seconds.isnot(None))
+        .order_by(legs.c.travel_seconds.desc(), legs.c.id)
+        .limit(1)
+    )
+
+
+def _longest_service_query(rows):
+    longest_point = (
+        select(rows.c.max_duration_point_id)
+        .where(rows.c.max_duration_minutes.isnot(None))
+        .order_by(rows.c.max_duration_minutes.desc(), rows.c.max_duration_point_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            RoutePoint.id,
+            Address.address_1c.label("address"),
+            RoutePoint.duration_minutes
+        )
+        .outerjoin(Address, Address.id == RoutePoint.address_id)
+        .where(RoutePoint.id == longest_point)
+    )
+
+
+def _drivers_query(driver_rows, start_date: date, end_date: date):
+    """
+    Водители с маршрутами за период, а также водители без машины или с машиной без единого маршрута —
+    с нулями; водители, чьи маршруты все вне периода, в список не входят.
+    """
+    per_driver = (
+        select(
+            driver_rows.c.driver_id,
+            func.sum(driver_rows.c.points_total).label("total_points"),
+            func.sum(driver_rows.c.points_completed).label("completed_points"),
+            func.sum(driver_rows.c.duration_sum).label("duration_sum"),
+            func.sum(driver_rows.c.duration_count).label("duration_count"),
+        )
+        .group_by(driver_rows.c.driver_id)
+    ).subquery()
+
+    return (
+        select(
+            User.id,
+            User.first_name,
+            User.last_name,
+            func.coalesce(per_driver.c.total_points, 0).label("total_points"),
+            func.coalesce(per_driver.c.completed_points, 0).label("completed_points"),
+            per_driver.c.duration_sum,
+            per_driver.c.duration_count
+        )
+        .outerjoin(per_driver, per_driver.c.driver_id == User.id)
+        .where(or_(
+            exists().where(Vehicle.owner_id == User.id, RoutePlan.vehicle_id == Vehicle.id, *_plan_period(start_date, end_date)),
+            ~exists().where(Vehicle.owner_id == User.id),
+            exists().where(Vehicle.owner_id == User.id, ~exists().where(RoutePlan.vehicle_id == Vehicle.id)),
+        ))
+    )
+
+
+def _vehicles_query(vehicle_rows, start_date: date, end_date: date):
+    """Машины с маршрутами за период и машины без единого маршрута — с нулями."""
+    per_vehicle = (
+        select(
+            vehicle_rows.c.vehicle_id,
+            func.sum(vehicle_rows.c.points_total).label("total_points"),
+            func.sum(vehicle_rows.c.points_completed).label("completed_points"),
+            func.sum(vehicle_rows.c.duration_sum).label("duration_sum"),
+            func.sum(vehicle_rows.c.duration_count).label("duration_count"),
+        )
+        .group_by(vehicle_rows.c.vehicle_id)
+    ).subquery()
+
+    return (
+        select(
+            Vehicle.id,
+            Vehicle.plate_number,
+            func.coalesce(per_vehicle.c.total_points, 0).label("total_points"),
+            func.coalesce(per_vehicle.c.completed_points, 0).label("completed_points"),
+            per_vehicle.c.duration_sum,
+            per_vehicle.c.duration_count
+        )
+        .outerjoin(per_vehicle, per_vehicle.c.vehicle_id == Vehicle.id)
+        .where(or_(
+            exists().where(RoutePlan.vehicle_id == Vehicle.id, *_plan_period(start_date, end_date)),
+            ~exists().where(RoutePlan.vehicle_id == Vehicle.id),
+        ))
+    )
+
+
+def _section_queries(start_date: date, end_date: date, materialize: bool = False) -> dict:
+    """Запросы разделов; с materialize общие наборы дневных строк оформляются как MATERIALIZED CTE."""
+    # Прошедшие дни берутся из дневных агрегатов, сегодняшний — из сырых строк,
+    # поэтому время ответа не зависит от объёма истории
+    vehicle_rows = daily_rows("vehicle", start_date, end_date, cte_name="vehicle_rows" if materialize else None)
+    driver_rows = daily_rows("driver", start_date, end_date, cte_name="driver_rows" if materialize else None)
+    return {
+        "totals": _totals_query(_all_routes_rows(vehicle_rows, start_date, end_date)),
+        "longest_road": _longest_road_query(start_date, end_date),
+        "longest_service": _longest_service_query(_all_routes_rows(vehicle_rows, start_date, end_date)),
+        "drivers": _drivers_query(driver_rows, start_date, end_date),
+        "vehicles": _vehicles_query(vehicle_rows, start_date, end_date),
+    }
+
+
+# ===================== Выполнение =====================
+async def _run_sequential(db: AsyncSession, queries: dict) -> dict:
+    return {name: (await db.execute(query)).mappings().all() for name, query in queries.items()}
+
+
+async def _run_on_own_connection(query):
+    async with AsyncSession(async_engine) as session:
+        return (await session.execute(query)).mappings().all()
+
+
+async def _run_concurrent(queries: dict) -> dict:
+    # У AsyncSession одно соединение, поэтому параллельно идут только запросы на разных сессиях
+    results = await asyncio.gather(*(_run_on_own_connection(query) for query in queries.values()))
+    return dict(zip(queries, results))
+
+
+async def _run_single(db: AsyncSession, queries: dict) -> dict:
+    # Каждый раздел сворачивается в json-массив строк, и весь ответ приходит одной строкой
+    columns = []
+    for name, query in queries.items():
+        section = query.subquery(name)
+        columns.append(
+            select(func.coalesce(func.json_agg(section.table_valued(), type_=JSON), text("'[]'::json")))
+            .scalar_subquery()
+            .label(name)
+        )
+    row = (await db.execute(select(*columns))).mappings().one()
+    return {name: row[name] for name in queries}
+
+
+# ===================== Сборка ответа =====================
+def _ratio(numerator, denominator) -> float:
+    # Суммы приходят то Decimal (обычный запрос), то числами из json — считаем во float, чтобы ответ не зависел от режима
+    return float(numerator) / float(denominator)
+
+
+def _completion_row(r) -> dict:
+    return {
+        "total_points": r["total_points"],
+        "completed_points": r["completed_points"],
+        "completion_percentage": _ratio(r["completed_points"], r["total_points"]) * 100 if r["total_points"] else 0,
+        "avg_duration_minutes": _ratio(r["duration_sum"], r["duration_count"]) if r["duration_count"] else 0
+    }
+
+
+def _build_response(rows: dict) -> dict:
+    # --- 1. Сводка по точкам ---
+    totals = rows["totals"][0]
+    points_stats = {
+        status: totals[status.value]
+        for status in (
+            RoutePointStatusEnum.planned,
+            RoutePointStatusEnum.en_route,
+            RoutePointStatusEnum.arrived,
+            RoutePointStatusEnum.completed,
+            RoutePointStatusEnum.skipped,
+        )
+        if totals[status.value]
+    }
+
+    points_summary = {
+        "total_points": totals["points_with_status"],
+        "completed": points_stats.get(RoutePointStatusEnum.completed, 0),
+        "en_route": points_stats.get(RoutePointStatusEnum.en_route, 0),
+        "arrived": points_stats.get(RoutePointStatusEnum.arrived, 0),
+        "planned": points_stats.get(RoutePointStatusEnum.planned, 0),
+        "skipped": points_stats.get(RoutePointStatusEnum.skipped, 0),
+        "in_progress": points_stats.get(RoutePointStatusEnum.en_route, 0) + points_stats.get(RoutePointStatusEnum.arrived, 0),
+        "remaining": points_stats.get(RoutePointStatusEnum.planned, 0) + points_stats.get(RoutePointStatusEnum.skipped, 0),
+        "status_counts": points_stats
+    }
+
+    # --- 2. Самая долгая дорога ---
+    longest_road_row = rows["longest_road"][0] if rows["longest_road"] else None
+    longest_road = {
+        "point_id": longest_road_row["id"],
+        "address": longest_road_row["address"],
+        "travel_time_seconds": longest_road_row["travel_time"]
+    } if longest_road_row else None
+
+    # --- 3. Самая долгая работа на точке ---
+    longest_service_row = rows["longest_service"][0] if rows["longest_service"] else None
+    longest_service = {
+        "point_id": longest_service_row["id"],
+        "address": longest_service_row["address"],
+        "duration_minutes": longest_service_row["duration_minutes"]
+    } if longest_service_row else None
+
+    # --- 4. Среднее время на точку ---
+    avg_duration = _ratio(totals["duration_sum"], totals["duration_count"]) if totals["duration_count"] else 0
+
+    # --- 5. Статистика по водителям ---
+    drivers_stats = [
+        {"driver_id": r["id"], "name": f"{r['first_name']} {r['last_name']}", **_completion_row(r)}
+        for r in rows["drivers"]
+    ]
+
+    # --- 6. Статистика по транспортным средствам ---
+    vehicles_stats = [
+        {"vehicle_id": r["id"], "plate_number": r["plate_number"], **_completion_row(r)}
+        for r in rows["vehicles"]
+    ]
+
+    # --- 7. Общая сводка: как и сводка по точкам — только точки, у которых был статус ---
+    total_summary = {
+        "total_points": totals["points_with_status"],
+        "completed_points": totals["completed"],
+        "total_payment": float(totals["payment_with_status_sum"]),
+        "avg_duration_minutes": avg_duration
+    }
+
+    return {
+        "points_summary": points_summary,
+        "longest_road": longest_road,
+        "longest_service": longest_service,
+        "avg_duration_minutes": avg_duration,
+        "drivers_stats": drivers_stats,
+        "vehicles_stats": vehicles_stats,
+        "total_summary": total_summary
+    }
+
+
+async def collect_full_statistics(db: AsyncSession, start_date: date, end_date: date, mode: StatsMode = StatsMode.sequential) -> dict:
+    queries = _section_queries(start_date, end_date, materialize=mode == StatsMode.single)
+    if mode == StatsMode.concurrent:
+        rows = await _run_concurrent(queries)
+    elif mode == StatsMode.single:
+        rows = await _run_single(db, queries)
+    else:
+        rows = await _run_sequential(db, queries)
+    return _build_response(rows)
+
+
 @router.get("/full", summary="Полная статистика за период")
 async def full_statistics(
     start_date: date = Query(..., description="Начало периода"),
     end_date: date = Query(..., description="Конец периода"),
-    db: AsyncSession = Depends(get_session)
+    mode: StatsMode = Query(StatsMode.sequential, description="Способ выполнения: sequential, concurrent или single"),
 ):
     """
     points_summary – сводка по точкам маршрута:
@@ -35,7 +357,7 @@ async def full_statistics(
 
     address — адрес точки
 
-    travel_time_seconds — время в пути к точке
+    travel_time_seconds — время в пути к точке от убытия с предыдущей точки маршрута
 
     longest_service – точка с самой долгой работой:
 
@@ -84,196 +406,672 @@ async def full_statistics(
     total_payment — общая сумма оплаты
 
     avg_duration_minutes — среднее время на точку за весь период
+
+    mode — способ выполнения, на ответ не влияет:
+    sequential — разделы по очереди в одной сессии;
+    concurrent — разделы параллельно на отдельных соединениях пула;
+    single — один запрос, общие наборы считаются один раз (MATERIALIZED CTE)
+
+    Ответ кэшируется по периоду (режим в ключ не входит — ответ от него не зависит).
+    Период в прошлом хранится долго, период с сегодняшним днём сбрасывается
+    при смене статусов и импортах маршрутов за его дни.
     """
+    async def compute():
+        # Своя сессия: расчёт могут ждать и другие запросы, он не должен зависеть от этого
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            return await collect_full_statistics(session, start_date, end_date, mode)
 
-    latest_status_subq = (
-        select(
-            RoutePointStatusLog.point_id,
-            RoutePointStatusLog.status,
-            func.row_number().over(
-                partition_by=RoutePointStatusLog.point_id,
-                order_by=RoutePointStatusLog.timestamp.desc()
-            ).label("rn")
-        )
-        .join(RoutePoint)
-        .join(RoutePlan)
-        .where(RoutePlan.date >= start_date, RoutePlan.date <= end_date)
-    ).subquery()
+    return await stats_cache.get_or_compute("full", start_date, end_date, compute)
 
-    # --- 1. Сводка по точкам ---
-    points_res = await db.execute(
-        select(
-            latest_status_subq.c.status,
-            func.count(latest_status_subq.c.point_id)
+
+# ===================== Ряды по интервалам =====================
+class SeriesBucket(str, Enum):
+    hour = "hour"
+    day = "day"
+    week = "week"
+
+
+class SeriesGroup(str, Enum):
+    driver = "driver"
+    vehicle = "vehicle"
+    store = "store"
+
+
+# Почасовые ряды считаются по сырым строкам — ограничиваем период
+SERIES_MAX_HOUR_DAYS = 31
+
+SERIES_FIELDS = ("total", "completed", "skipped", "planned", "payment")
+
+
+def _series_names(group: SeriesGroup):
+    """Модель и подпись группы для ответа."""
+    if group == SeriesGroup.driver:
+        return User, func.concat_ws(" ", User.first_name, User.last_name)
+    if group == SeriesGroup.vehicle:
+        return Vehicle, Vehicle.plate_number
+    return Store, Store.name_1c
+
+
+def _series_query(start_date: date, end_date: date, bucket: SeriesBucket, group: SeriesGroup):
+    """Один запрос: суммы по (интервал, группа) с подписью группы."""
+    level = group.value
+    if bucket == SeriesBucket.hour:
+        # Часы — по времени последнего статуса точки (без статуса — по дате маршрута), в часовом поясе сессии
+        _, _, source = LEVELS[level]
+        status = RoutePoint.current_status
+        moment = cast(func.coalesce(RoutePoint.current_status_at, RoutePlan.date), DateTime)
+        period = func.date_trunc("hour", moment)
+        grouped = (
+            select(
+                period.label("bucket"),
+                source.label("key"),
+                func.count(RoutePoint.id).label("total"),
+                func.count(RoutePoint.id).filter(status == RoutePointStatusEnum.completed).label("completed"),
+                func.count(RoutePoint.id).filter(status == RoutePointStatusEnum.skipped).label("skipped"),
+                func.count(RoutePoint.id).filter(status == RoutePointStatusEnum.planned).label("planned"),
+                func.coalesce(func.sum(RoutePoint.payment), 0).label("payment"),
+                func.coalesce(func.sum(RoutePoint.duration_minutes), 0).label("duration_sum"),
+                func.count(RoutePoint.duration_minutes).label("duration_count"),
+            )
+            .select_from(RoutePoint)
+            .join(RoutePlan, RoutePoint.route_plan_id == RoutePlan.id)
+        )
+        if group == SeriesGroup.driver:
+            grouped = grouped.join(Vehicle, Vehicle.id == RoutePlan.vehicle_id)
+        grouped = grouped.where(
+            RoutePlan.date >= literal(start_date, Date),
+            RoutePlan.date < literal(end_date + timedelta(days=1), Date),
+            source.isnot(None),
+        )
+    else:
+        # Дни и недели — по дням маршрутов из дневных агрегатов
+        rows = daily_rows(level, start_date, end_date)
+        period = cast(func.date_trunc(bucket.value, rows.c.day), Date)
+        source = rows.c[LEVELS[level][1].key]
+        grouped = select(
+            period.label("bucket"),
+            source.label("key"),
+            func.sum(rows.c.points_total).label("total"),
+            func.sum(rows.c.points_completed).label("completed"),
+            func.sum(rows.c.points_skipped).label("skipped"),
+            func.sum(rows.c.points_planned).label("planned"),
+            func.sum(rows.c.payment_sum).label("payment"),
+            func.sum(rows.c.duration_sum).label("duration_sum"),
+            func.sum(rows.c.duration_count).label("duration_count"),
         )
-        .where(latest_status_subq.c.rn == 1)
-        .group_by(latest_status_subq.c.status)
+    grouped = grouped.group_by(period, source).subquery()
+
+    model, name = _series_names(group)
+    return (
+        select(grouped, name.label("name"))
+        .outerjoin(model, model.id == grouped.c.key)
+        .order_by(grouped.c.key, grouped.c.bucket)
     )
-    points_stats = dict(points_res.all())
 
-    points_summary = {
-        "total_points": sum(points_stats.values()) if points_stats else 0,
-        "completed": points_stats.get(RoutePointStatusEnum.completed, 0),
-        "en_route": points_stats.get(RoutePointStatusEnum.en_route, 0),
-        "arrived": points_stats.get(RoutePointStatusEnum.arrived, 0),
-        "planned": points_stats.get(RoutePointStatusEnum.planned, 0),
-        "skipped": points_stats.get(RoutePointStatusEnum.skipped, 0),
-        "in_progress": points_stats.get(RoutePointStatusEnum.en_route, 0) + points_stats.get(RoutePointStatusEnum.arrived, 0),
-        "remaining": points_stats.get(RoutePointStatusEnum.planned, 0) + points_stats.get(RoutePointStatusEnum.skipped, 0),
-        "status_counts": points_stats
+
+def _series_buckets(start_date: date, end_date: date, bucket: SeriesBucket) -> list:
+    """Все интервалы периода, включая пустые, — чтобы ряды шли без пропусков."""
+    if bucket == SeriesBucket.hour:
+        current, last, step = datetime.combine(start_date, time()), datetime.combine(end_date, time(23)), timedelta(hours=1)
+    elif bucket == SeriesBucket.week:
+        current, last, step = start_date - timedelta(days=start_date.weekday()), end_date, timedelta(days=7)
+    else:
+        current, last, step = start_date, end_date, timedelta(days=1)
+
+    buckets = []
+    while current <= last:
+        buckets.append(current)
+        current += step
+    return buckets
+
+
+async def collect_series(db: AsyncSession, start_date: date, end_date: date, bucket: SeriesBucket, group: SeriesGroup) -> dict:
+    rows = (await db.execute(_series_query(start_date, end_date, bucket, group))).mappings().all()
+
+    # Час последнего статуса может выйти за границы периода (точка закрыта после полуночи)
+    buckets = sorted(set(_series_buckets(start_date, end_date, bucket)) | {r["bucket"] for r in rows})
+    position = {b: i for i, b in enumerate(buckets)}
+
+    series = {}
+    for r in rows:
+        item = series.get(r["key"])
+        if item is None:
+            item = series[r["key"]] = {
+                "key": r["key"],
+                "name": r["name"],
+                **{field: [0] * len(buckets) for field in SERIES_FIELDS},
+                "avg_duration_minutes": [0] * len(buckets),
+            }
+        i = position[r["bucket"]]
+        for field in SERIES_FIELDS:
+            item[field][i] = r[field]
+        item["payment"][i] = float(r["payment"])
+        if r["duration_count"]:
+            item["avg_duration_minutes"][i] = float(r["duration_sum"]) / float(r["duration_count"])
+
+    return {
+        "bucket": bucket,
+        "group_by": group,
+        "buckets": buckets,
+        "series": list(series.values()),
     }
 
-    # --- 2. Самая долгая дорога ---
-    longest_road_res = await db.execute(
+
+@router.get("/series", summary="Ряды статистики по интервалам")
+async def statistics_series(
+    start_date: date = Query(..., description="Начало периода"),
+    end_date: date = Query(..., description="Конец периода"),
+    bucket: SeriesBucket = Query(SeriesBucket.day, description="Интервал: hour, day или week"),
+    group_by: SeriesGroup = Query(SeriesGroup.driver, description="Группировка: driver, vehicle или store"),
+):
+    """
+    Ряды по интервалам периода для графиков — вместо запроса /full на каждый день.
+
+    Ответ по колонкам: buckets — начала интервалов (неделя начинается с понедельника,
+    часы — по времени последнего статуса точки), series — по элементу на группу:
+
+    key, name — водитель / машина / магазин
+
+    total, completed, skipped, planned — число точек по интервалам
+
+    payment — сумма оплаты по интервалам
+
+    avg_duration_minutes — среднее время работы на точке по интервалам
+
+    Значения i-го элемента каждого массива относятся к buckets[i]; группы без точек за период не выводятся.
+    """
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="Конец периода раньше начала")
+    if bucket == SeriesBucket.hour and (end_date - start_date).days >= SERIES_MAX_HOUR_DAYS:
+        raise HTTPException(status_code=400, detail=f"Почасовые ряды доступны за период не больше {SERIES_MAX_HOUR_DAYS} дней")
+
+    async def compute():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            return await collect_series(session, start_date, end_date, bucket, group_by)
+
+    return await stats_cache.get_or_compute(
+        "series", start_date, end_date, compute, bucket=bucket.value, group_by=group_by.value
+    )
+
+
+# ===================== Перцентили времени работы и в пути =====================
+class AnalyticsGroup(str, Enum):
+    store = "store"
+    address = "address"
+    driver = "driver"
+
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+def _percentiles(column, where=None):
+    """Все перцентили PERCENTILES одним агрегатом — одна сортировка на группу."""
+    aggregate = func.percentile_cont(array(PERCENTILES)).within_group(column)
+    if where is not None:
+        aggregate = aggregate.filter(where)
+    return type_coerce(aggregate, ARRAY(Float))
+
+
+def _analytics_query(start_date: date, end_date: date, group: AnalyticsGroup):
+    """Перцентили по группам и итог по всем точкам (ROLLUP) одним запросом."""
+    legs = _legs_query(start_date, end_date)
+    key = legs.c[f"{group.value}_id"]
+    travel_minutes = legs.c.travel_seconds / 60
+
+    grouped = (
         select(
-            RoutePoint.id,
-            RoutePoint.address,
-            (func.extract("epoch", RoutePoint.arrival_time) - func.extract("epoch", RoutePoint.departure_time)).label("travel_time")
+            key.label("key"),
+            func.grouping(key).label("is_total"),
+            func.count(legs.c.service_minutes).label("service_count"),
+            func.avg(legs.c.service_minutes).label("service_avg"),
+            _percentiles(legs.c.service_minutes).label("service_percentiles"),
+            func.count(travel_minutes).filter(travel_minutes >= 0).label("travel_count"),
+            func.avg(travel_minutes).filter(travel_minutes >= 0).label("travel_avg"),
+            # Отрицательное время в пути — рассинхрон часов или правка задним числом, в расчёт не берём
+            _percentiles(travel_minutes, travel_minutes >= 0).label("travel_percentiles"),
         )
-        .join(RoutePoint.route_plan)
+        .where(key.isnot(None))
+        .group_by(func.rollup(key))
+    ).subquery()
+
+    if group == AnalyticsGroup.store:
+        model, name = Store, Store.name_1c
+    elif group == AnalyticsGroup.address:
+        model, name = Address, Address.address_1c
+    else:
+        model, name = User, func.concat_ws(" ", User.first_name, User.last_name)
+
+    return (
+        select(grouped, name.label("name"))
+        .outerjoin(model, model.id == grouped.c.key)
+        .order_by(grouped.c.is_total.desc(), name)
+    )
+
+
+def _analytics_row(r, kinds=("service", "travel")) -> dict:
+    row = {}
+    for kind in kinds:
+        values = r[f"{kind}_percentiles"] or [None] * len(PERCENTILES)
+        row[f"{kind}_count"] = r[f"{kind}_count"]
+        row[f"{kind}_avg_minutes"] = float(r[f"{kind}_avg"]) if r[f"{kind}_avg"] is not None else None
+        for share, value in zip(PERCENTILES, values):
+            row[f"{kind}_p{round(share * 100)}_minutes"] = float(value) if value is not None else None
+    return row
+
+
+async def collect_analytics(db: AsyncSession, start_date: date, end_date: date, group: AnalyticsGroup) -> dict:
+    rows = (await db.execute(_analytics_query(start_date, end_date, group))).mappings().all()
+    total = next((r for r in rows if r["is_total"]), None)
+    return {
+        "group_by": group,
+        "percentiles": list(PERCENTILES),
+        "overall": _analytics_row(total) if total else None,
+        "items": [{"key": r["key"], "name": r["name"], **_analytics_row(r)} for r in rows if not r["is_total"]],
+    }
+
+
+@router.get("/analytics", summary="Перцентили времени работы на точке и времени в пути")
+async def statistics_analytics(
+    start_date: date = Query(..., description="Начало периода"),
+    end_date: date = Query(..., description="Конец периода"),
+    group_by: AnalyticsGroup = Query(AnalyticsGroup.store, description="Группировка: store, address или driver"),
+):
+    """
+    Время работы на точке (duration_minutes) и время в пути между соседними точками маршрута
+    (от убытия с предыдущей до прибытия на эту) по группам, в минутах:
+
+    overall — по всем точкам периода, items — по магазинам, адресам или водителям
+
+    service_count, service_avg_minutes, service_p50/p90/p99_minutes — время работы
+
+    travel_count, travel_avg_minutes, travel_p50/p90/p99_minutes — время в пути;
+    первая точка маршрута и точки, где предыдущая не закрыта, в расчёт не входят
+    """
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="Конец периода раньше начала")
+
+    async def compute():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            return await collect_analytics(session, start_date, end_date, group_by)
+
+    return await stats_cache.get_or_compute("analytics", start_date, end_date, compute, group_by=group_by.value)
+
+
+# ===================== Погрузки по складам =====================
+LOADING_FIELDS = ("loadings", "completed", "volume", "weight")
+
+
+def _loadings_query(start_date: date, end_date: date):
+    """
+    Погрузки маршрутов периода по складам и дням (ROLLUP: склад и день, склад, итог) одним запросом.
+    Время — по журналу статусов погрузки, без журнала — по start_time/end_time самой погрузки.
+    """
+    log = LoadingStatusLog
+    # Журнал читается в окне вокруг дат маршрутов, как у статусов точек, — Postgres читает только
+    # нужные месячные секции; статусы за окном заменяют start_time/end_time погрузки
+    log_from, log_to = status_log_bounds(start_date, end_date)
+    in_period = (
+        select(Loading.id)
+        .join(RoutePlan, RoutePlan.id == Loading.route_plan_id)
         .where(
-            RoutePlan.date >= start_date,
-            RoutePlan.date <= end_date,
-            RoutePoint.arrival_time.isnot(None),
-            RoutePoint.departure_time.isnot(None)
+            RoutePlan.date >= literal(start_date, Date),
+            RoutePlan.date < literal(end_date + timedelta(days=1), Date),
         )
-        .order_by((func.extract("epoch", RoutePoint.arrival_time) - func.extract("epoch", RoutePoint.departure_time)).desc())
-        .limit(1)
     )
-    longest_road_row = longest_road_res.first()
-    longest_road = {
-        "point_id": longest_road_row.id,
-        "address": longest_road_row.address,
-        "travel_time_seconds": longest_road_row.travel_time
-    } if longest_road_row else None
+    events = (
+        select(
+            log.loading_id,
+            func.min(log.timestamp).filter(log.status == RoutePointStatusEnum.arrived).label("arrived_at"),
+            func.min(log.timestamp).filter(log.status == RoutePointStatusEnum.loading).label("loading_at"),
+            func.max(log.timestamp).filter(log.status == RoutePointStatusEnum.loading_completed).label("completed_at"),
+        )
+        .where(log.loading_id.in_(in_period), log.timestamp >= log_from, log.timestamp < log_to)
+        .group_by(log.loading_id)
+    ).subquery()
 
-    # --- 3. Самая долгая работа на точке ---
-    longest_service_res = await db.execute(
+    started_at = func.coalesce(events.c.loading_at, Loading.start_time)
+    finished_at = func.coalesce(events.c.completed_at, Loading.end_time)
+    rows = (
         select(
-            RoutePoint.id,
-            RoutePoint.address,
-            RoutePoint.duration_minutes
+            Loading.loading_place_id,
+            func.date(RoutePlan.date).label("day"),
+            Loading.volume,
+            Loading.weight,
+            finished_at.isnot(None).label("is_completed"),
+            (func.extract("epoch", finished_at - started_at) / 60).label("duration_minutes"),
+            # Очередь — от прибытия на склад до начала погрузки
+            (func.extract("epoch", started_at - events.c.arrived_at) / 60).label("queue_minutes"),
         )
-        .join(RoutePoint.route_plan)
-        .where(
-            RoutePlan.date >= start_date,
-            RoutePlan.date <= end_date,
-            RoutePoint.duration_minutes.isnot(None)
+        .join(RoutePlan, RoutePlan.id == Loading.route_plan_id)
+        .outerjoin(events, events.c.loading_id == Loading.id)
+        .where(Loading.id.in_(in_period))
+    ).subquery()
+
+    # Отрицательные интервалы — статусы, записанные не по порядку, в расчёт не берём
+    duration, queue = rows.c.duration_minutes, rows.c.queue_minutes
+    grouped = (
+        select(
+            rows.c.loading_place_id.label("key"),
+            rows.c.day,
+            func.grouping(rows.c.loading_place_id).label("is_total"),
+            func.grouping(rows.c.day).label("is_place_total"),
+            func.count().label("loadings"),
+            func.count().filter(rows.c.is_completed).label("completed"),
+            func.coalesce(func.sum(rows.c.volume), 0).label("volume"),
+            func.coalesce(func.sum(rows.c.weight), 0).label("weight"),
+            func.count(duration).filter(duration >= 0).label("duration_count"),
+            func.avg(duration).filter(duration >= 0).label("duration_avg"),
+            _percentiles(duration, duration >= 0).label("duration_percentiles"),
+            func.count(queue).filter(queue >= 0).label("queue_count"),
+            func.avg(queue).filter(queue >= 0).label("queue_avg"),
+            _percentiles(queue, queue >= 0).label("queue_percentiles"),
         )
-        .order_by(RoutePoint.duration_minutes.desc())
-        .limit(1)
-    )
-    longest_service_row = longest_service_res.first()
-    longest_service = {
-        "point_id": longest_service_row.id,
-        "address": longest_service_row.address,
-        "duration_minutes": longest_service_row.duration_minutes
-    } if longest_service_row else None
+        .group_by(func.rollup(rows.c.loading_place_id, rows.c.day))
+    ).subquery()
 
-    # --- 4. Среднее время на точку ---
-    avg_duration_res = await db.execute(
-        select(func.avg(RoutePoint.duration_minutes))
-        .join(RoutePoint.route_plan)
-        .where(RoutePlan.date >= start_date, RoutePlan.date <= end_date)
-        .where(RoutePoint.duration_minutes.isnot(None))
+    return (
+        select(grouped, LoadingPlace.name.label("name"))
+        .outerjoin(LoadingPlace, LoadingPlace.id == grouped.c.key)
+        .order_by(grouped.c.is_total.desc(), LoadingPlace.name, grouped.c.key, grouped.c.is_place_total.desc(), grouped.c.day)
     )
-    avg_duration = avg_duration_res.scalar() or 0
 
-    # --- 5. Статистика по водителям ---
-    drivers_res = await db.execute(
-        select(
-            User.id,
-            User.first_name,
-            User.last_name,
-            func.count(RoutePoint.id).label("total_points"),
-            func.sum(
-                case(
-                    (latest_status_subq.c.status == RoutePointStatusEnum.completed, 1),
-                    else_=0
-                )
-            ).label("completed_points"),
-            func.avg(RoutePoint.duration_minutes).label("avg_duration_minutes")
-        )
-        .outerjoin(Vehicle, Vehicle.owner_id == User.id)
-        .outerjoin(RoutePlan, RoutePlan.vehicle_id == Vehicle.id)
-        .outerjoin(RoutePoint, RoutePoint.route_plan_id == RoutePlan.id)
-        .outerjoin(latest_status_subq, latest_status_subq.c.point_id == RoutePoint.id)
+
+def _loadings_row(r) -> dict:
+    return {
+        **{field: r[field] for field in LOADING_FIELDS},
+        "volume": float(r["volume"]),
+        "weight": float(r["weight"]),
+        **_analytics_row(r, ("duration", "queue")),
+    }
+
+
+async def collect_loadings(db: AsyncSession, start_date: date, end_date: date) -> dict:
+    rows = (await db.execute(_loadings_query(start_date, end_date))).mappings().all()
+
+    overall, places = None, {}
+    for r in rows:
+        if r["is_total"]:
+            overall = _loadings_row(r)
+        elif r["is_place_total"]:
+            places[r["key"]] = {"key": r["key"], "name": r["name"], **_loadings_row(r), "days": []}
+        else:
+            places[r["key"]]["days"].append({"day": r["day"], **_loadings_row(r)})
+
+    return {
+        "percentiles": list(PERCENTILES),
+        "overall": overall,
+        "items": list(places.values()),
+    }
+
+
+@router.get("/loadings", summary="Погрузки по складам: объём, длительность и очередь")
+async def statistics_loadings(
+    start_date: date = Query(..., description="Начало периода"),
+    end_date: date = Query(..., description="Конец периода"),
+):
+    """
+    Погрузки маршрутов периода: overall — по всем складам, items — по складам с разбивкой по дням (days).
+
+    loadings, completed — всего погрузок и завершённых
+
+    volume, weight — суммарные объём и вес
+
+    duration_count, duration_avg_minutes, duration_p50/p90/p99_minutes — длительность погрузки
+    (от статуса loading до loading_completed)
+
+    queue_count, queue_avg_minutes, queue_p50/p90/p99_minutes — ожидание в очереди
+    (от прибытия на склад до начала погрузки)
+    """
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="Конец периода раньше начала")
+
+    async def compute():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            return await collect_loadings(session, start_date, end_date)
+
+    return await stats_cache.get_or_compute("loadings", start_date, end_date, compute)
+
+
+# ===================== Тепловая карта =====================
+class HeatmapSource(str, Enum):
+    gps = "gps"  # GPS-трек машин (logs)
+    status = "status"  # статусы точек маршрутов
+    all = "all"
+
+
+HEATMAP_MAX_DAYS = 31
+HEATMAP_MAX_CELLS = 250_000
+# Разрыв между GPS-отметками больше этого — машина была без связи или выключена, в стоянку не засчитываем
+HEATMAP_MAX_GAP_MINUTES = 10
+# Ожидание на точке (от прибытия до следующего статуса) больше этого — забытый статус
+HEATMAP_MAX_WAIT_MINUTES = 180
+METERS_PER_DEGREE = 111_320
+
+
+def _heatmap_steps(min_lat: float, max_lat: float, cell_m: int) -> tuple[float, float]:
+    """Шаг сетки в градусах: по долготе — с поправкой на широту середины области."""
+    lat_step = cell_m / METERS_PER_DEGREE
+    lon_step = lat_step / max(math.cos(math.radians((min_lat + max_lat) / 2)), 0.01)
+    return lat_step, lon_step
+
+
+def _heatmap_samples(model, partition, start: datetime, end: datetime, bbox: tuple, max_minutes: int,
+                     dwell_status=None, scope=None):
+    """
+    Отметки журнала в области и периоде с временем до следующей отметки того же владельца, в секундах.
+    Следующая отметка ищется среди всех отметок владельца за период — вне области и без координат тоже:
+    машина, уехавшая из области, не копит время на последней отметке в ней. Область отбирается уже
+    после окна. Разрыв больше max_minutes (нет связи, забытый статус) во время не засчитывается.
+    scope(query) — дополнительные условия на отметки (машина).
+    """
+    min_lat, min_lon, max_lat, max_lon = bbox
+    next_at = func.coalesce(
+        func.lead(model.timestamp).over(partition_by=partition, order_by=model.timestamp),
+        # Последняя отметка: для ожидания на точке — до текущего момента или конца периода
+        func.least(func.now(), literal(end, DateTime(timezone=True))) if dwell_status is not None else model.timestamp,
+    )
+    gap = func.extract("epoch", next_at - model.timestamp)
+    dwell = case((gap <= max_minutes * 60, gap), else_=0)
+    if dwell_status is not None:
+        dwell = case((model.status == dwell_status, dwell), else_=0)
+    rows = (
+        select(model.latitude, model.longitude, dwell.label("dwell_seconds"))
         .where(
-            ((RoutePlan.date >= start_date) & (RoutePlan.date <= end_date)) | (RoutePlan.id == None)
+            model.timestamp >= literal(start, DateTime(timezone=True)),
+            model.timestamp < literal(end, DateTime(timezone=True)),
         )
-        .where((latest_status_subq.c.rn == 1) | (latest_status_subq.c.rn == None))
-        .group_by(User.id)
+    )
+    if scope is not None:
+        rows = scope(rows)
+    rows = rows.subquery()
+    return select(rows.c.latitude, rows.c.longitude, rows.c.dwell_seconds).where(
+        rows.c.latitude.between(min_lat, max_lat), rows.c.longitude.between(min_lon, max_lon)
     )
 
-    drivers_stats = [
-        {
-            "driver_id": r.id,
-            "name": f"{r.first_name} {r.last_name}",
-            "total_points": r.total_points,
-            "completed_points": r.completed_points,
-            "completion_percentage": (r.completed_points / r.total_points * 100) if r.total_points else 0,
-            "avg_duration_minutes": r.avg_duration_minutes or 0
-        }
-        for r in drivers_res.all()
-    ]
 
-    # --- 6. Статистика по транспортным средствам ---
-    vehicles_res = await db.execute(
-        select(
-            Vehicle.id,
-            Vehicle.plate_number,
-            func.count(RoutePoint.id).label("total_points"),
-            func.sum(case((latest_status_subq.c.status == RoutePointStatusEnum.completed, 1), else_=0)).label("completed_points"),
-            func.avg(RoutePoint.duration_minutes).label("avg_duration_minutes")
+def _heatmap_query(start: datetime, end: datetime, bbox: tuple, cell_m: int, source: HeatmapSource, vehicle_id: UUID | None):
+    """Один запрос: число отметок и время стоянки по ячейкам сетки; пустые ячейки не возвращаются."""
+    min_lat, min_lon, max_lat, max_lon = bbox
+    lat_step, lon_step = _heatmap_steps(min_lat, max_lat, cell_m)
+
+    parts = []
+    if source in (HeatmapSource.gps, HeatmapSource.all):
+        gps = _heatmap_samples(
+            LogEntry, LogEntry.vehicle_id, start, end, bbox, HEATMAP_MAX_GAP_MINUTES,
+            scope=(lambda query: query.where(LogEntry.vehicle_id == vehicle_id)) if vehicle_id else None,
         )
-        .outerjoin(RoutePlan, RoutePlan.vehicle_id == Vehicle.id)
-        .outerjoin(RoutePoint, RoutePoint.route_plan_id == RoutePlan.id)
-        .outerjoin(latest_status_subq, latest_status_subq.c.point_id == RoutePoint.id)
-        .where(
-            ((RoutePlan.date >= start_date) & (RoutePlan.date <= end_date)) | (RoutePlan.id == None)
+        parts.append(gps.add_columns(literal("gps").label("kind")))
+    if source in (HeatmapSource.status, HeatmapSource.all):
+        def vehicle_points(query):
+            return (
+                query.join(RoutePoint, RoutePoint.id == RoutePointStatusLog.point_id)
+                .join(RoutePlan, RoutePlan.id == RoutePoint.route_plan_id)
+                .where(RoutePlan.vehicle_id == vehicle_id)
+            )
+
+        events = _heatmap_samples(
+            RoutePointStatusLog, RoutePointStatusLog.point_id, start, end, bbox, HEATMAP_MAX_WAIT_MINUTES,
+            dwell_status=RoutePointStatusEnum.arrived, scope=vehicle_points if vehicle_id else None,
+        )
+        parts.append(events.add_columns(literal("status").label("kind")))
+
+    samples = union_all(*parts).subquery()
+    # Ячейка у края области попадает в последнюю строку/столбец, а не в лишнюю
+    row = func.least(func.floor((samples.c.latitude - min_lat) / lat_step), math.ceil((max_lat - min_lat) / lat_step) - 1)
+    col = func.least(func.floor((samples.c.longitude - min_lon) / lon_step), math.ceil((max_lon - min_lon) / lon_step) - 1)
+    is_gps = samples.c.kind == "gps"
+    return (
+        select(
+            cast(row, Integer).label("row"),
+            cast(col, Integer).label("col"),
+            func.count().filter(is_gps).label("samples"),
+            func.count().filter(~is_gps).label("events"),
+            func.coalesce(func.sum(samples.c.dwell_seconds).filter(is_gps), 0).label("dwell_seconds"),
+            func.coalesce(func.sum(samples.c.dwell_seconds).filter(~is_gps), 0).label("wait_seconds"),
         )
-        .where((latest_status_subq.c.rn == 1) | (latest_status_subq.c.rn == None))
-        .group_by(Vehicle.id)
+        .group_by(row, col)
+        .order_by(row, col)
     )
 
-    vehicles_stats = [
-        {
-            "vehicle_id": r.id,
-            "plate_number": r.plate_number,
-            "total_points": r.total_points,
-            "completed_points": r.completed_points,
-            "completion_percentage": (r.completed_points / r.total_points * 100) if r.total_points else 0,
-            "avg_duration_minutes": r.avg_duration_minutes or 0
-        }
-        for r in vehicles_res.all()
-    ]
 
-    # --- 7. Общая сводка ---
-    summary_res = await db.execute(
+async def collect_heatmap(db: AsyncSession, start: datetime, end: datetime, bbox: tuple, cell_m: int,
+                          source: HeatmapSource = HeatmapSource.all, vehicle_id: UUID | None = None) -> dict:
+    rows = (await db.execute(_heatmap_query(start, end, bbox, cell_m, source, vehicle_id))).all()
+    lat_step, lon_step = _heatmap_steps(bbox[0], bbox[2], cell_m)
+
+    cells = {"row": [], "col": [], "samples": [], "events": [], "dwell_minutes": [], "wait_minutes": []}
+    for row, col, samples, events, dwell_seconds, wait_seconds in rows:
+        cells["row"].append(row)
+        cells["col"].append(col)
+        cells["samples"].append(samples)
+        cells["events"].append(events)
+        cells["dwell_minutes"].append(round(float(dwell_seconds) / 60, 1))
+        cells["wait_minutes"].append(round(float(wait_seconds) / 60, 1))
+
+    return {
+        "source": source,
+        "cell_m": cell_m,
+        "origin": [bbox[0], bbox[1]],
+        "lat_step": lat_step,
+        "lon_step": lon_step,
+        "cells": cells,
+    }
+
+
+@router.get("/heatmap", summary="Тепловая карта GPS-отметок и статусов в области")
+async def statistics_heatmap(
+    start: datetime = Query(..., description="Начало интервала"),
+    end: datetime = Query(..., description="Конец интервала"),
+    min_lat: float = Query(..., ge=-90, le=90, description="Южная граница области"),
+    min_lon: float = Query(..., ge=-180, le=180, description="Западная граница области"),
+    max_lat: float = Query(..., ge=-90, le=90, description="Северная граница области"),
+    max_lon: float = Query(..., ge=-180, le=180, description="Восточная граница области"),
+    cell_m: int = Query(200, ge=10, le=10_000, description="Размер ячейки сетки, м"),
+    source: HeatmapSource = Query(HeatmapSource.all, description="Источник: gps, status или all"),
+    vehicle_id: UUID | None = Query(None, description="Только одна машина"),
+):
+    """
+    Отметки в области, сведённые в квадратную сетку, — где машины стоят и где водители ждут на точках.
+
+    Ячейка (row, col) начинается в origin + (row * lat_step, col * lon_step); ответ по колонкам,
+    i-й элемент каждого массива cells относится к одной ячейке, пустые ячейки не выводятся:
+
+    samples, dwell_minutes — GPS-отметки и время до следующей отметки машины
+    (разрывы больше 10 минут во время не входят) — стоянки и медленное движение
+
+    events, wait_minutes — статусы точек и время ожидания от прибытия до следующего статуса точки
+    (ожидание дольше 3 часов — забытый статус — во время не входит)
+    """
+    if end <= start:
+        raise HTTPException(status_code=400, detail="Конец интервала раньше начала")
+    if end - start > timedelta(days=HEATMAP_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"Тепловая карта доступна за период не больше {HEATMAP_MAX_DAYS} дней")
+    if max_lat <= min_lat or max_lon <= min_lon:
+        raise HTTPException(status_code=400, detail="Неверные границы области")
+    lat_step, lon_step = _heatmap_steps(min_lat, max_lat, cell_m)
+    if math.ceil((max_lat - min_lat) / lat_step) * math.ceil((max_lon - min_lon) / lon_step) > HEATMAP_MAX_CELLS:
+        raise HTTPException(status_code=400, detail="Слишком мелкая сетка для такой области, увеличьте cell_m")
+
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        return await collect_heatmap(session, start, end, (min_lat, min_lon, max_lat, max_lon), cell_m, source, vehicle_id)
+
+
+# ===================== Пробег =====================
+MILEAGE_FIELDS = ("distance_km", "moving_minutes", "idle_minutes", "fixes_count", "rejected_count")
+
+
+def _mileage_query(start_date: date, end_date: date, vehicle_ids: list[UUID] | None):
+    query = (
         select(
-            func.count(RoutePoint.id).label("total_points"),
-            func.sum(case((latest_status_subq.c.status == RoutePointStatusEnum.completed, 1), else_=0)).label("completed_points"),
-            func.sum(RoutePoint.payment).label("total_payment")
+            VehicleDailyMileage,
+            Vehicle.plate_number,
+            func.concat_ws(" ", User.last_name, User.first_name, User.middle_name).label("driver"),
         )
-        .join(RoutePoint.route_plan)
-        .join(latest_status_subq, latest_status_subq.c.point_id == RoutePoint.id)
-        .where(RoutePlan.date >= start_date, RoutePlan.date <= end_date)
-        .where(latest_status_subq.c.rn == 1)
+        .join(Vehicle, Vehicle.id == VehicleDailyMileage.vehicle_id)
+        .outerjoin(User, User.id == Vehicle.owner_id)
+        .where(VehicleDailyMileage.day >= start_date, VehicleDailyMileage.day <= end_date)
+        .order_by(Vehicle.plate_number, Vehicle.id, VehicleDailyMileage.day)
     )
-    summary_row = summary_res.first()
-    total_summary = {
-        "total_points": summary_row.total_points or 0,
-        "completed_points": summary_row.completed_points or 0,
-        "total_payment": summary_row.total_payment or 0.0,
-        "avg_duration_minutes": avg_duration
-    }
+    if vehicle_ids:
+        query = query.where(VehicleDailyMileage.vehicle_id.in_(vehicle_ids))
+    return query
+
+
+def _mileage_totals(rows: list[dict]) -> dict:
+    totals = {field: sum(r[field] for r in rows) for field in MILEAGE_FIELDS}
+    totals["distance_km"] = round(totals["distance_km"], 2)
+    speeds = [r["max_speed_kmh"] for r in rows if r["max_speed_kmh"] is not None]
+    totals["max_speed_kmh"] = max(speeds) if speeds else None
+    return totals
+
+
+async def collect_mileage(db: AsyncSession, start_date: date, end_date: date, vehicle_ids: list[UUID] | None) -> dict:
+    result = await db.execute(_mileage_query(start_date, end_date, vehicle_ids))
+
+    vehicles, days = {}, []
+    for mileage, plate_number, driver in result.all():
+        day = {
+            "day": mileage.day,
+            "distance_km": round(mileage.distance_km, 2),
+            "moving_minutes": round(mileage.moving_seconds / 60),
+            "idle_minutes": round(mileage.idle_seconds / 60),
+            "fixes_count": mileage.fixes_count,
+            "rejected_count": mileage.rejected_count,
+            "max_speed_kmh": None if mileage.max_speed_kmh is None else round(mileage.max_speed_kmh, 1),
+            "first_fix_at": mileage.first_fix_at,
+            "last_fix_at": mileage.last_fix_at,
+        }
+        vehicles.setdefault(mileage.vehicle_id, {
+            "vehicle_id": mileage.vehicle_id, "plate_number": plate_number, "driver": driver or None, "days": [],
+        })["days"].append(day)
+        days.append(day)
 
     return {
-        "points_summary": points_summary,
-        "longest_road": longest_road,
-        "longest_service": longest_service,
-        "avg_duration_minutes": avg_duration,
-        "drivers_stats": drivers_stats,
-        "vehicles_stats": vehicles_stats,
-        "total_summary": total_summary
+        "overall": _mileage_totals(days),
+        "items": [{**item, **_mileage_totals(item["days"])} for item in vehicles.values()],
     }
+
+
+@router.get("/mileage", summary="Пробег и время движения машин по дням")
+async def statistics_mileage(
+    start_date: date = Query(..., description="Начало периода"),
+    end_date: date = Query(..., description="Конец периода"),
+    vehicle_id: list[UUID] | None = Query(None, description="Машины; без параметра — все"),
+):
+    """
+    Пробег по GPS-логам за местные дни периода: overall — по всем машинам,
+    items — по машинам (госномер, водитель) с разбивкой по дням (days).
+
+    distance_km — пробег по отрезкам движения; moving_minutes, idle_minutes — время в движении
+    (от 3 км/ч) и на стоянке, разрывы связи дольше 10 минут не входят ни туда, ни туда
+
+    fixes_count — отметок в расчёте, rejected_count — отброшенных выбросов (скачок быстрее 150 км/ч),
+    max_speed_kmh — наибольшая скорость между соседними отметками
+
+    Пробег пересчитывается в фоне: свежие отметки попадают в него в течение минуты.
+    """
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="Конец периода раньше начала")
+
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        return await collect_mileage(session, start_date, end_date, vehicle_id)
@@ -1,9 +1,11 @@
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
 from database.database_app import get_session
+from database.writes import insert_returning, update_returning
 from models import Store
+from pagination import DEFAULT_LIMIT, MAX_LIMIT, paginate
 from schemas.schemas import StoreCreate, StoreOut
 from uuid import UUID
 
@@ -11,9 +13,12 @@ router = APIRouter(prefix="/stores", tags=["Магазины"])
 
 
 @router.get("/stores", summary="Список магазинов")
-async def get_stores(db: AsyncSession = Depends(get_session)):
-    result = await db.execute(select(Store))
-    return result.scalars().all()
+async def get_stores(
+    cursor: str | None = Query(None, description="Курсор следующей страницы"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT, description="Размер страницы"),
+    db: AsyncSession = Depends(get_session)
+):
+    return await paginate(db, select(Store), (Store.createDateTime, Store.id), cursor, limit)
 
 @router.get("/stores/{store_id}", summary="Получить магазин по ID")
 async def get_store(store_id: UUID, db: AsyncSession = Depends(get_session)):
@@ -29,24 +34,17 @@ async def create_store(store: StoreCreate, db: AsyncSession = Depends(get_sessio
     existing = result.scalar_one_or_none()
     if existing:
         raise HTTPException(status_code=400, detail="Магазин с таким uuid_1c уже существует")
-    db_store = Store(**store.dict())
-    db.add(db_store)
+    db_store = await insert_returning(db, Store, options=(selectinload(Store.address),), **store.dict())
     await db.commit()
-    await db.refresh(db_store)
     return db_store
 
 
 @router.put("/stores/{store_id}", summary="Обновить магазин")
 async def update_store(store_id: UUID, store: StoreCreate, db: AsyncSession = Depends(get_session)):
-    result = await db.execute(select(Store).where(Store.id == store_id))
-    db_store = result.scalar_one_or_none()
+    db_store = await update_returning(db, Store, store_id, options=(selectinload(Store.address),), **store.dict())
     if not db_store:
         raise HTTPException(status_code=404, detail="Магазин не найден")
-    for key, value in store.dict().items():
-        setattr(db_store, key, value)
-    db_store.changeDateTime = datetime.utcnow()
     await db.commit()
-    await db.refresh(db_store)
     return db_store
 
 @router.delete("/stores/{store_id}", summary="Удалить магазин")
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from database.database_app import get_session
+from database.writes import insert_returning, update_returning
 from models import Tariff
 from schemas.schemas import TariffCreate, TariffOut
 from uuid import UUID
@@ -26,25 +27,18 @@ async def get_tariff(tariff_id: UUID, db: AsyncSession = Depends(get_session)):
 
 @router.post("/", response_model=TariffOut, summary="Создать тариф")
 async def create_tariff(tariff: TariffCreate, db: AsyncSession = Depends(get_session)):
-    db_tariff = Tariff(**tariff.dict())
-    db.add(db_tariff)
+    db_tariff = await insert_returning(db, Tariff, **tariff.dict())
     await db.commit()
-    await db.refresh(db_tariff)
     return db_tariff
 
 
 @router.put("/{tariff_id}", response_model=TariffOut, summary="Обновить тариф")
 async def update_tariff(tariff_id: UUID, tariff: TariffCreate, db: AsyncSession = Depends(get_session)):
-    result = await db.execute(select(Tariff).where(Tariff.id == tariff_id))
-    db_tariff = result.scalar_one_or_none()
+    db_tariff = await update_returning(db, Tariff, tariff_id, **tariff.dict())
     if not db_tariff:
         raise HTTPException(status_code=404, detail="Тариф не найден")
 
-    for key, value in tariff.dict().items():
-        setattr(db_tariff, key, value)
-
     await db.commit()
-    await db.refresh(db_tariff)
     return db_tariff
 
 
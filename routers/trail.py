@@ -1,3 +1,4 @@
+import asyncio
 from io import BytesIO
 from typing import List
 import pandas as pd
@@ -5,17 +6,26 @@ from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from database.database_app import get_session
+from database.writes import insert_returning, update_returning
 from routers.auth import get_current_user
 from models import Address, Loading, LoadingPlace, LoadingStatusLog, RoutePointStatusLog, RouteStatusEnum, Store, Vehicle, RoutePlan, RoutePoint, User
 from crud import create_route_plan, add_route_point
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from schemas.schemas import PointStatusUpdate, RouteDateUpdate
-from sqlalchemy import func, or_
+from sqlalchemy import case, func, or_, update
 import bcrypt
 from sqlalchemy.orm import selectinload
 from fastapi import Body
 from models import RoutePointStatusEnum
 from uuid import UUID
+from collections import defaultdict
+from database.partitions import status_log_bounds
+from database.status_tracking import apply_loading_status, apply_point_status, recount_route_plan
+from database.daily_stats import refresh_daily_stats
+from geofence import geofence_index
+from route_optimizer import optimize_route
+from pagination import DEFAULT_LIMIT, MAX_LIMIT, ROUTES_DEFAULT_LIMIT, ROUTES_MAX_LIMIT, paginate
+from metrics import GEOCODER_CACHE, GEOCODER_REQUEST_DURATION, GEOCODER_REQUESTS, IMPORT_ROWS, track_import
 
 router = APIRouter(prefix="/routes", tags=["Маршруты"])
 
@@ -44,24 +54,37 @@ from sqlalchemy.orm import selectinload
 
 @router.get("/logsAll")
 async def get_route_point_logs(
+    cursor: str | None = Query(None, description="Курсор следующей страницы"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT, description="Размер страницы (точек)"),
     db: AsyncSession = Depends(get_session)
 ):
-    result = await db.execute(
-        select(RoutePoint)
-        .options(selectinload(RoutePoint.route_plan).selectinload(RoutePlan.vehicle))
+    page = await paginate(
+        db,
+        select(RoutePoint).options(
+            selectinload(RoutePoint.route_plan).selectinload(RoutePlan.vehicle),
+            selectinload(RoutePoint.address),
+        ),
+        (RoutePoint.createDateTime, RoutePoint.id),
+        cursor,
+        limit,
     )
-    points = result.scalars().all()
+    points = page["items"]
 
-    if not points:
+    if not points and not cursor:
         raise HTTPException(status_code=404, detail="Точка маршрута не найдена")
 
-    result = await db.execute(
-        select(RoutePointStatusLog)
-        .order_by(RoutePointStatusLog.timestamp)
-    )
-    logs = result.scalars().all()
+    # Логи только для точек текущей страницы
+    logs = []
+    if points:
+        result = await db.execute(
+            select(RoutePointStatusLog)
+            .where(RoutePointStatusLog.point_id.in_([p.id for p in points]))
+            .order_by(RoutePointStatusLog.timestamp)
+        )
+        logs = result.scalars().all()
 
     return {
+        "next_cursor": page["next_cursor"],
         "points": [
             {
                 "id": p.id,
@@ -185,19 +208,15 @@ async def update_route_datetime(
     if route.vehicle.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Нет доступа к этому маршруту")
     
-    updated = False
+    values = {}
     if data.start_datetime:
-        route.start_datetime = data.start_datetime
-        updated = True
+        values["start_datetime"] = data.start_datetime
     if data.end_datetime:
-        route.end_datetime = data.end_datetime
-        updated = True
+        values["end_datetime"] = data.end_datetime
     
-    if updated:
-        route.changeDateTime = datetime.utcnow()
-        db.add(route)
+    if values:
+        route = await update_returning(db, RoutePlan, route.id, **values)
         await db.commit()
-        await db.refresh(route)
     
     return route
 
@@ -229,7 +248,8 @@ async def create_point_for_user(
     route = result.scalars().first()
 
     if not route:
-        route = await create_route_plan(db, vehicle.id, datetime.utcnow().date(), notes="Автоматически созданный маршрут")
+        # Маршрут и точка фиксируются одним commit в add_route_point
+        route = await create_route_plan(db, vehicle.id, datetime.utcnow().date(), notes="Автоматически созданный маршрут", commit=False)
 
     point = await add_route_point(
         db,
@@ -244,11 +264,13 @@ async def create_point_for_user(
     return point
 
 
-@router.get("/filter", summary="Получить все маршруты за период")
+@router.get("/filter", summary="Получить маршруты за период постранично")
 async def get_all_routes(
     db: AsyncSession = Depends(get_session),
     start_date: date | None = Query(None, description="Дата начала фильтрации"),
-    end_date: date | None = Query(None, description="Дата окончания фильтрации")
+    end_date: date | None = Query(None, description="Дата окончания фильтрации"),
+    cursor: str | None = Query(None, description="Курсор следующей страницы"),
+    limit: int = Query(ROUTES_DEFAULT_LIMIT, ge=1, le=ROUTES_MAX_LIMIT, description="Размер страницы"),
 ):
     query = select(RoutePlan).options(
         selectinload(RoutePlan.vehicle)
@@ -266,18 +288,20 @@ async def get_all_routes(
     if end_date:
         query = query.where(RoutePlan.date <= end_date)
 
-    result = await db.execute(query)
-    routes = result.scalars().all()
+    # selectinload подгружает точки только для маршрутов текущей страницы
+    page = await paginate(db, query, (RoutePlan.createDateTime, RoutePlan.id), cursor, limit)
 
-    if not routes:
+    if not page["items"] and not cursor:
         raise HTTPException(status_code=404, detail="Маршруты не найдены")
 
-    return routes
+    return page
 
 
-@router.get("/all", summary="Получить все маршруты")
+@router.get("/all", summary="Получить маршруты постранично")
 async def get_all_routes(
     db: AsyncSession = Depends(get_session),
+    cursor: str | None = Query(None, description="Курсор следующей страницы"),
+    limit: int = Query(ROUTES_DEFAULT_LIMIT, ge=1, le=ROUTES_MAX_LIMIT, description="Размер страницы"),
 ):
     query = select(RoutePlan).options(
         selectinload(RoutePlan.vehicle)
@@ -285,13 +309,12 @@ async def get_all_routes(
         selectinload(RoutePlan.points)
     )
 
-    result = await db.execute(query)
-    routes = result.scalars().all()
+    page = await paginate(db, query, (RoutePlan.createDateTime, RoutePlan.id), cursor, limit)
 
-    if not routes:
+    if not page["items"] and not cursor:
         raise HTTPException(status_code=404, detail="Маршруты не найдены")
 
-    return routes
+    return page
 
 @router.get("/stats", summary="Получить статистику маршрутов и точек")
 async def get_routes_stats(db: AsyncSession = Depends(get_session)):
@@ -381,7 +404,10 @@ async def get_user_routes_summary(
                     "middle_name": route.vehicle.owner.middle_name
                 }
             },
-            "points_count": point_count
+            "points_count": point_count,
+            "points_completed": route.points_completed,
+            "points_in_progress": route.points_in_progress,
+            "points_skipped": route.points_skipped
         })
 
     return route_summaries
@@ -413,37 +439,157 @@ async def move_route_point(
     if new_order == old_order:
         return point 
 
-    result = await db.execute(
-        select(RoutePoint)
-        .where(RoutePoint.route_plan_id == route.id)
-        .order_by(RoutePoint.order)
-    )
-    points = result.scalars().all()
-
+    # Сдвигаем точки между старой и новой позицией одним UPDATE
     if new_order < old_order:
-        for p in points:
-            if new_order <= p.order < old_order:
-                p.order += 1
+        shift = (
+            update(RoutePoint)
+            .where(RoutePoint.route_plan_id == route.id, RoutePoint.order >= new_order, RoutePoint.order < old_order)
+            .values(order=RoutePoint.order + 1)
+        )
     else:
-        for p in points:
-            if old_order < p.order <= new_order:
-                p.order -= 1
+        shift = (
+            update(RoutePoint)
+            .where(RoutePoint.route_plan_id == route.id, RoutePoint.order > old_order, RoutePoint.order <= new_order)
+            .values(order=RoutePoint.order - 1)
+        )
+    await db.execute(shift)
 
-    point.order = new_order
-    db.add_all(points)
+    point = await update_returning(db, RoutePoint, point.id, order=new_order)
     await db.commit()
-    await db.refresh(point)
     return point
 
 
+async def get_loading_place_coordinates(db: AsyncSession, place_id: UUID) -> tuple[float, float]:
+    result = await db.execute(
+        select(Address.latitude, Address.longitude)
+        .join(LoadingPlace, LoadingPlace.address_id == Address.id)
+        .where(LoadingPlace.id == place_id)
+    )
+    row = result.first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Место погрузки не найдено")
+    if row.latitude is None or row.longitude is None:
+        raise HTTPException(status_code=400, detail="У места погрузки нет координат")
+    return row.latitude, row.longitude
+
+
+# Порядок из 1С и добавленные точки не учитывают географию — пересобираем его по координатам.
+# Пройденные точки (есть прибытие или статус) остаются в начале как были, и путь продолжается
+# от последней из них — вместо места выезда; с какого начала считали, ответ говорит в start:
+# visited_point, loading_place или none (начало свободное). Точки без координат уходят в конец в прежнем порядке.
+@router.post("/{route_id}/optimize", summary="Оптимизировать порядок точек маршрута")
+async def optimize_route_points(
+    route_id: UUID,
+    start_place_id: UUID | None = Query(None, description="Место погрузки, откуда машина выезжает"),
+    end_place_id: UUID | None = Query(None, description="Место погрузки, куда машина возвращается"),
+    return_to_start: bool = Query(False, description="Вернуться в место выезда, если конец не задан"),
+    dry_run: bool = Query(False, description="Только посчитать, не меняя порядок"),
+    db: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    result = await db.execute(
+        select(RoutePlan)
+        .options(selectinload(RoutePlan.vehicle))
+        .where(RoutePlan.id == route_id)
+    )
+    route = result.scalars().first()
+    if not route:
+        raise HTTPException(status_code=404, detail="Маршрут не найден")
+    if route.vehicle is None or route.vehicle.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Нет доступа к этому маршруту")
+
+    start = await get_loading_place_coordinates(db, start_place_id) if start_place_id else None
+    end = await get_loading_place_coordinates(db, end_place_id) if end_place_id else None
+    if end is None and return_to_start:
+        if start is None:
+            raise HTTPException(status_code=400, detail="Для возврата укажите место выезда")
+        end = start
+
+    result = await db.execute(
+        select(RoutePoint.id, RoutePoint.latitude, RoutePoint.longitude, RoutePoint.arrival_time, RoutePoint.current_status)
+        .where(RoutePoint.route_plan_id == route_id)
+        .order_by(RoutePoint.order, RoutePoint.createDateTime)
+    )
+    visited, movable, without_coordinates = [], [], []
+    for point in result.all():
+        if point.arrival_time is not None or point.current_status not in (None, RoutePointStatusEnum.planned):
+            visited.append(point)
+        elif point.latitude is None or point.longitude is None:
+            without_coordinates.append(point)
+        else:
+            movable.append(point)
+    located = [point for point in visited if point.latitude is not None and point.longitude is not None]
+    start_kind = "loading_place" if start else "none"
+    if located:
+        start = (located[-1].latitude, located[-1].longitude)
+        start_kind = "visited_point"
+
+    order, before, after = await asyncio.to_thread(
+        optimize_route,
+        [point.latitude for point in movable],
+        [point.longitude for point in movable],
+        start,
+        end,
+    )
+    sequence = [point.id for point in visited + [movable[i] for i in order] + without_coordinates]
+
+    applied = False
+    if not dry_run and after < before:
+        orders = {point_id: position for position, point_id in enumerate(sequence, start=1)}
+        await db.execute(
+            update(RoutePoint)
+            .where(RoutePoint.id.in_(sequence))
+            .values(order=case(orders, value=RoutePoint.id))
+        )
+        await db.commit()
+        applied = True
+
+    return {
+        "route_id": route_id,
+        "points": sequence,
+        "distance_before_km": round(before / 1000, 3),
+        "distance_after_km": round(after / 1000, 3),
+        "start": start_kind,
+        "fixed_points": len(visited),
+        "without_coordinates": len(without_coordinates),
+        "applied": applied,
+    }
+
+
 
 
 
 
 
+async def load_status_logs(db: AsyncSession, owner_key, owners: list, log_from: datetime, log_to: datetime) -> dict:
+    """
+    Логи статусов точек или погрузок owners в окне [log_from, log_to), по id владельца.
+    Если в окне логов меньше, чем в счётчике status_changes_count (статус задним числом,
+    точка перенесена из маршрута другого дня), логи такого владельца дочитываются без границ.
+    """
+    model = owner_key.class_
+    logs = defaultdict(list)
+    if not owners:
+        return logs
+    result = await db.execute(
+        select(model).where(owner_key.in_([o.id for o in owners]), model.timestamp >= log_from, model.timestamp < log_to)
+    )
+    for log in result.scalars().all():
+        logs[getattr(log, owner_key.key)].append(log)
+
+    outside = [o.id for o in owners if len(logs[o.id]) < (o.status_changes_count or 0)]
+    if outside:
+        result = await db.execute(select(model).where(owner_key.in_(outside)))
+        for owner_id in outside:
+            logs[owner_id] = []
+        for log in result.scalars().all():
+            logs[getattr(log, owner_key.key)].append(log)
+    return logs
+
+
 @router.get("/{route_id}/timeline", summary="Получить все точки и погрузки маршрута с логами по времени")
 async def get_route_timeline(route_id: UUID, db: AsyncSession = Depends(get_session)):
-    # Загружаем маршрут с точками и погрузками + логи
+    # Загружаем маршрут с точками и погрузками
     result = await db.execute(
         select(RoutePlan)
         .where(RoutePlan.id == route_id)
@@ -454,15 +600,11 @@ async def get_route_timeline(route_id: UUID, db: AsyncSession = Depends(get_sess
             selectinload(RoutePlan.points)
                 .selectinload(RoutePoint.store)
                 .selectinload(Store.address),
-            selectinload(RoutePlan.points)
-                .selectinload(RoutePoint.status_logs),
             
-            # Загружаем погрузки с местом загрузки и логами
+            # Загружаем погрузки с местом загрузки
             selectinload(RoutePlan.loadings)
                 .selectinload(Loading.loading_place)
                 .selectinload(LoadingPlace.address),
-            selectinload(RoutePlan.loadings)
-                .selectinload(Loading.status_logs)
         )
     )
 
@@ -470,15 +612,27 @@ async def get_route_timeline(route_id: UUID, db: AsyncSession = Depends(get_sess
     if not route:
         raise HTTPException(status_code=404, detail="Маршрут не найден")
 
+    # Логи читаем отдельно с границами по времени вокруг даты маршрута —
+    # так Postgres читает только нужные месячные секции журналов
+    route_day = route.date.date() if route.date else date.today()
+    log_from, log_to = status_log_bounds(route_day, route_day)
+    # Поздняя правка статуса — за окном: верхняя граница не раньше последнего статуса
+    last_status_at = [o.current_status_at for o in [*route.points, *route.loadings] if o.current_status_at]
+    if last_status_at:
+        log_to = max(log_to, max(last_status_at) + timedelta(microseconds=1))
+
+    point_logs = await load_status_logs(db, RoutePointStatusLog.point_id, route.points, log_from, log_to)
+    loading_logs = await load_status_logs(db, LoadingStatusLog.loading_id, route.loadings, log_from, log_to)
+
     timeline = []
 
     # Обрабатываем точки маршрута
     for point in route.points:
-        for log in point.status_logs:
+        for log in point_logs[point.id]:
             timeline.append({
                 "type": "route_point",
                 "id": point.id,
-                "name": point.store.name if point.store else (point.address.address_1c if point.address else None),
+                "name": point.store.name_1c if point.store else (point.address.address_1c if point.address else None),
                 "status": log.status,
                 "latitude": log.latitude,
                 "longitude": log.longitude,
@@ -489,7 +643,7 @@ async def get_route_timeline(route_id: UUID, db: AsyncSession = Depends(get_sess
     # Обрабатываем погрузки
     for loading in route.loadings:
         loading_place_name = loading.loading_place.name if loading.loading_place else None
-        for log in loading.status_logs:
+        for log in loading_logs[loading.id]:
             timeline.append({
                 "type": "loading",
                 "id": loading.id,
@@ -720,26 +874,11 @@ async def update_route_point_status(
         if point.route_plan.vehicle.owner_id != current_user.id:
             raise HTTPException(status_code=403, detail="Нет доступа к этому маршруту")
 
-        point.status = status
-
-        if status == RoutePointStatusEnum.arrived:
-            point.arrival_time = point.arrival_time or now
-        elif status == RoutePointStatusEnum.completed:
-            if not point.arrival_time:
-                point.arrival_time = now
-            point.departure_time = now
-
-        log = RoutePointStatusLog(
-            point_id=point.id,
-            status=status,
-            timestamp=now,
-            latitude=latitude,
-            longitude=longitude
-        )
-
-        db.add_all([point, log])
+        vehicle_id = point.route_plan.vehicle_id
+        point = await apply_point_status(db, point, status, now, latitude, longitude)
+        # Координаты отметки статуса — тоже отметка машины: могут закрыть прибытие или убытие на других точках
+        await geofence_index.check_fixes(db, vehicle_id, [(now, latitude, longitude)])
         await db.commit()
-        await db.refresh(point)
         return point
 
     # --- Если точки маршрута нет, ищем загрузку ---
@@ -756,19 +895,10 @@ async def update_route_point_status(
     if loading.route_plan.vehicle.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Нет доступа к этому маршруту")
 
-    loading.status = status
-    loading.start_time = now
-    log = LoadingStatusLog(
-        loading_id=loading.id,
-        status=status,
-        timestamp=now,
-        latitude=latitude,
-        longitude=longitude
-    )
-
-    db.add_all([loading, log])
+    vehicle_id = loading.route_plan.vehicle_id
+    loading = await apply_loading_status(db, loading, status, now, latitude, longitude, extra_values={"start_time": now})
+    await geofence_index.check_fixes(db, vehicle_id, [(now, latitude, longitude)])
     await db.commit()
-    await db.refresh(loading)
     return loading
 
 
@@ -790,27 +920,10 @@ async def update_route_point_status(
 
     now = data.timestamp or datetime.utcnow()
 
-    point.status = data.new_status
-
-    if data.new_status == RoutePointStatusEnum.arrived:
-        point.arrival_time = point.arrival_time or now
-    elif data.new_status == RoutePointStatusEnum.completed:
-        if not point.arrival_time:
-            point.arrival_time = now
-        point.departure_time = now
-
-    log = RoutePointStatusLog(
-        point_id=point.id,
-        status=data.new_status,
-        timestamp=now,
-        latitude=data.lat,
-        longitude=data.lng
-    )
-    db.add(log)
-
-    db.add(point)
+    vehicle_id = point.route_plan.vehicle_id
+    point = await apply_point_status(db, point, data.new_status, now, data.lat, data.lng)
+    await geofence_index.check_fixes(db, vehicle_id, [(now, data.lat, data.lng)])
     await db.commit()
-    await db.refresh(point)
     return point
 
 
@@ -897,6 +1010,9 @@ async def delete_route_point(point_id: str, db: AsyncSession = Depends(get_sessi
         raise HTTPException(status_code=404, detail="Точка маршрута не найдена")
 
     await db.delete(point)
+    await db.flush()
+    await recount_route_plan(db, point.route_plan_id)
+    await refresh_daily_stats(db, [point.route_plan_id], store_ids=[point.store_id] if point.store_id else [])
     await db.commit()
     return {"status": "success", "message": f"Точка {point_id} удалена"}
 
@@ -920,8 +1036,15 @@ async def relocate_route_points(
         raise HTTPException(status_code=404, detail="Точки маршрута не найдены")
 
     # Переложение точек
+    affected_routes = {point.route_plan_id for point in points} | {new_route.id}
     for point in points:
-        point.route_plan_id = new_route_plan_id
+        point.route_plan_id = new_route.id
+    await db.flush()
+
+    # Счётчики статусов меняются и у старых маршрутов, и у нового
+    for route_plan_id in affected_routes:
+        await recount_route_plan(db, route_plan_id)
+    await refresh_daily_stats(db, affected_routes, store_ids={p.store_id for p in points if p.store_id})
     await db.commit()
 
     return {"status": "success", "message": f"{len(points)} точек перемещено на маршрут {new_route_plan_id}"}
@@ -960,7 +1083,10 @@ async def find_or_create_user(db: AsyncSession, first_name: str | None, last_nam
         password = "".join([last_name or "", first_name[0] if first_name else "", middle_name[0] if middle_name else ""])
         hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
         
-        user = User(
+        # Без commit: весь импорт файла — одна транзакция
+        user = await insert_returning(
+            db,
+            User,
             username=username,
             hashed_password=hashed_password,
             first_name=first_name or "",
@@ -968,9 +1094,6 @@ async def find_or_create_user(db: AsyncSession, first_name: str | None, last_nam
             middle_name=middle_name,
             is_active=True
         )
-        db.add(user)
-        await db.commit()
-        await db.refresh(user)
 
     return user.id
 
@@ -979,14 +1102,13 @@ async def get_or_create_vehicle(db: AsyncSession, user_id: UUID):
     vehicle = result.scalars().first()
 
     if not vehicle:
-        vehicle = Vehicle(
+        vehicle = await insert_returning(
+            db,
+            Vehicle,
             plate_number=f"AUTO_{user_id}",
             model="Неизвестно",
             owner_id=user_id
         )
-        db.add(vehicle)
-        await db.commit()
-        await db.refresh(vehicle)
 
     return vehicle
 
@@ -1003,14 +1125,13 @@ async def get_or_create_route_for_date(db: AsyncSession, user_id: UUID, route_da
     route = result.scalars().first()
 
     if not route:
-        route = RoutePlan(
+        route = await insert_returning(
+            db,
+            RoutePlan,
             vehicle_id=vehicle.id,
             date=route_date,
             status=RouteStatusEnum.planned
         )
-        db.add(route)
-        await db.commit()
-        await db.refresh(route)
 
     return route
 
@@ -1043,13 +1164,17 @@ async def get_coordinates_by_address(address: str) -> GeocodeResponse | None:
     url = f"https://nominatim.openstreetmap.org/search?format=json&q={address}"
     async with httpx.AsyncClient() as client:
         try:
-            response = await client.get(url, headers={"User-Agent": "YourAppName (contact@yourapp.com)"})
+            with GEOCODER_REQUEST_DURATION.time():
+                response = await client.get(url, headers={"User-Agent": "YourAppName (contact@yourapp.com)"})
             response.raise_for_status()
             data = response.json()
             if not data:
+                GEOCODER_REQUESTS.inc(outcome="not_found")
                 return None
+            GEOCODER_REQUESTS.inc(outcome="ok")
             return GeocodeResponse(lat=float(data[0]["lat"]), lng=float(data[0]["lon"]))
         except Exception:
+            GEOCODER_REQUESTS.inc(outcome="error")
             return None
 
 # Парсинг Excel
@@ -1069,24 +1194,29 @@ async def geocode(address: str):
 
     async with httpx.AsyncClient() as client:
         try:
-            response = await client.get(url, headers={"User-Agent": "YourAppName (contact@yourapp.com)"})
+            with GEOCODER_REQUEST_DURATION.time():
+                response = await client.get(url, headers={"User-Agent": "YourAppName (contact@yourapp.com)"})
             response.raise_for_status()  
             data = response.json()
             
             if not data:
+                GEOCODER_REQUESTS.inc(outcome="not_found")
                 lat = float(0)
                 lon = float(0)
             
                 return lat, lon
             
+            GEOCODER_REQUESTS.inc(outcome="ok")
             lat = float(data[0]["lat"])
             lon = float(data[0]["lon"])
             
             return lat, lon
         
         except httpx.HTTPStatusError as e:
+            GEOCODER_REQUESTS.inc(outcome="error")
             raise HTTPException(status_code=e.response.status_code, detail=f"HTTP error occurred: {e}")
         except Exception as e:
+            GEOCODER_REQUESTS.inc(outcome="error")
             raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 # Получение или создание адреса
@@ -1094,19 +1224,20 @@ async def get_or_create_address(db: AsyncSession, address_text: str) -> Address:
     result = await db.execute(select(Address).filter(Address.address_1c == address_text))
     address = result.scalars().first()
     if address:
+        GEOCODER_CACHE.inc(result="hit")
         return address
+    GEOCODER_CACHE.inc(result="miss")
     lat, lon = await geocode(address_text)
-    new_address = Address(
+    return await insert_returning(
+        db,
+        Address,
         address_1c=address_text,
         latitude=lat,
         longitude=lon
     )
 
-    db.add(new_address)
-    await db.flush() 
-    return new_address
-
 @router.post("/upload_excel", summary="Загрузить Excel файл с точками маршрута")
+@track_import("/routes/upload_excel")
 async def upload_excel(
     route_date: datetime = Form(...), 
     file: UploadFile = File(...),
@@ -1114,7 +1245,9 @@ async def upload_excel(
 ):
     df = parse_excel(file)
     df.columns = df.columns.str.strip()
+    IMPORT_ROWS.inc(len(df), endpoint="/routes/upload_excel")
 
+    touched_routes = set()
     for index, row in df.iterrows():
         driver_name = str(row.get("Водитель", "")).strip()
         if not driver_name:
@@ -1131,6 +1264,7 @@ async def upload_excel(
         order_value = row.get("Порядок", index + 1)
         route = await get_or_create_route_for_date(db, driver_id, route_date)
         route_id = route.id
+        touched_routes.add(route_id)
 
         doc_value = safe_str(row.get("Документ"))
         address_value = safe_str(row.get("Торговая точка"))
@@ -1168,6 +1302,7 @@ async def upload_excel(
                 address_obj=address_obj,
                 order=order_value,
                 note=safe_str(row.get("Комментарий")),
+                commit=False,
             )
 
     excel_docs = df["Документ"].apply(str).unique()
@@ -1181,6 +1316,7 @@ async def upload_excel(
     for point in points_to_delete:
         db.delete(point)
 
+    await refresh_daily_stats(db, touched_routes)
     await db.commit()
 
     return {"detail": f"Файл успешно обработан, загружено {len(df)} строк"}\
@@ -1189,6 +1325,7 @@ async def upload_excel(
 
 
 @router.post("/upload_excel_test", summary="Загрузить Excel файл с точками маршрута")
+@track_import("/routes/upload_excel_test")
 async def upload_excel(
     route_date: datetime = Form(...), 
     file: UploadFile = File(...),
@@ -1197,7 +1334,9 @@ async def upload_excel(
 ):
     df = parse_excel(file)
     df.columns = df.columns.str.strip()
+    IMPORT_ROWS.inc(len(df), endpoint="/routes/upload_excel_test")
 
+    touched_routes = set()
     for index, row in df.iterrows():
         driver_name = str(row.get("Водитель", "")).strip()
         if not driver_name:
@@ -1214,6 +1353,7 @@ async def upload_excel(
         order_value = row.get("Порядок", index + 1)
         route = await get_or_create_route_for_date(db, driver_id, route_date)
         route_id = route.id
+        touched_routes.add(route_id)
 
         doc_value = safe_str(row.get("Документ"))
         address_value = safe_str(row.get("Торговая точка"))
@@ -1247,6 +1387,7 @@ async def upload_excel(
                 address_obj=address_obj,
                 order=order_value,
                 note=safe_str(row.get("Комментарий")),
+                commit=False,
             )
 
     excel_docs = df["Документ"].apply(str).unique()
@@ -1260,6 +1401,7 @@ async def upload_excel(
     for point in points_to_delete:
         db.delete(point)
 
+    await refresh_daily_stats(db, touched_routes)
     await db.commit()
 
     return {"detail": f"Файл успешно обработан, загружено {len(df)} строк"}
@@ -1269,6 +1411,7 @@ async def upload_excel(
 
 
 @router.post("/upload_excel_test", summary="Загрузить Excel файл с точками маршрута")
+@track_import("/routes/upload_excel_test")
 async def upload_excel(
     route_date: datetime = Form(...), 
     file: UploadFile = File(...),
@@ -1277,7 +1420,9 @@ async def upload_excel(
 ):
     df = parse_excel(file)
     df.columns = df.columns.str.strip()
+    IMPORT_ROWS.inc(len(df), endpoint="/routes/upload_excel_test")
 
+    touched_routes = set()
     for index, row in df.iterrows():
         driver_name = str(row.get("Водитель", "")).strip()
         if not driver_name:
@@ -1294,6 +1439,7 @@ async def upload_excel(
         order_value = row.get("Порядок", index + 1)
         route = await get_or_create_route_for_date(db, driver_id, route_date)
         route_id = route.id
+        touched_routes.add(route_id)
 
         doc_value = safe_str(row.get("Документ"))
         address_value = safe_str(row.get("Торговая точка"))
@@ -1327,6 +1473,7 @@ async def upload_excel(
                 address_obj=address_obj,
                 order=order_value,
                 note=safe_str(row.get("Комментарий")),
+                commit=False,
             )
 
     excel_docs = df["Документ"].apply(str).unique()
@@ -1340,6 +1487,7 @@ async def upload_excel(
     for point in points_to_delete:
         db.delete(point)
 
+    await refresh_daily_stats(db, touched_routes)
     await db.commit()
 
     return {"detail": f"Файл успешно обработан, загружено {len(df)} строк"}
@@ -1,8 +1,8 @@
-from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from database.database_app import get_session
+from database.writes import insert_returning, update_returning
 from models import TransportCompany
 from schemas.schemas import TransportCompanyCreate, TransportCompanyOut
 from sqlalchemy.orm import selectinload
@@ -34,32 +34,28 @@ async def create_company(company: TransportCompanyCreate, db: AsyncSession = Dep
         if existing:
             raise HTTPException(status_code=400, detail="Компания с таким uuid_1c уже существует")
 
-    db_company = TransportCompany(**company.dict())
-    db.add(db_company)
-    await db.commit()
-    await db.refresh(db_company)
-
-    result = await db.execute(
-        select(TransportCompany)
-        .options(selectinload(TransportCompany.legal_entity_type))
-        .where(TransportCompany.id == db_company.id)
+    db_company = await insert_returning(
+        db,
+        TransportCompany,
+        options=(selectinload(TransportCompany.legal_entity_type),),
+        **company.dict()
     )
-    db_company = result.scalar_one()
-
+    await db.commit()
     return db_company
 
 @router.put("/{company_id}", response_model=TransportCompanyOut, summary="Обновить транспортную компанию")
 async def update_company(company_id: UUID, company: TransportCompanyCreate, db: AsyncSession = Depends(get_session)):
-    result = await db.execute(select(TransportCompany).where(TransportCompany.id == company_id))
-    db_company = result.scalar_one_or_none()
+    db_company = await update_returning(
+        db,
+        TransportCompany,
+        company_id,
+        options=(selectinload(TransportCompany.legal_entity_type),),
+        **company.dict()
+    )
     if not db_company:
         raise HTTPException(status_code=404, detail="Транспортная компания не найдена")
 
-    for key, value in company.dict().items():
-        setattr(db_company, key, value)
-    db_company.changeDateTime = datetime.utcnow()
     await db.commit()
-    await db.refresh(db_company)
     return db_company
 
 
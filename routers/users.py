@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from database.database_app import get_session
 from schemas.schemas import UserCreate, UserOut, UserUpdate
 from models import User
 from crud import create_user, update_user
+from pagination import DEFAULT_LIMIT, MAX_LIMIT, paginate
 from sqlalchemy.orm import joinedload
 from uuid import UUID
 
@@ -16,14 +17,17 @@ async def add_user(user: UserCreate, db: AsyncSession = Depends(get_session)):
     return await create_user(db, user)
 
 
-@router.get("/", summary="Список пользователей", description="Возвращает список всех пользователей")
-async def get_users(db: AsyncSession = Depends(get_session)):
-    result = await db.execute(select(User)
-            .options(
-                joinedload(User.transport_company),  
-                joinedload(User.tariff) 
-            ))
-    return result.scalars().all()
+@router.get("/", summary="Список пользователей", description="Возвращает список пользователей постранично")
+async def get_users(
+    cursor: str | None = Query(None, description="Курсор следующей страницы"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT, description="Размер страницы"),
+    db: AsyncSession = Depends(get_session)
+):
+    query = select(User).options(
+        joinedload(User.transport_company),  
+        joinedload(User.tariff) 
+    )
+    return await paginate(db, query, (User.createDateTime, User.id), cursor, limit)
 
 
 @router.get("/{user_id}", response_model=UserOut, summary="Получить пользователя по ID", description="Возвращает данные пользователя по его ID, включая связанную информацию о транспортной компании и тарифе")
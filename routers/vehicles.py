@@ -1,15 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from database.database_app import get_session
 from models import User, Vehicle
 from routers.auth import get_current_user
-from schemas.schemas import VehicleCreate, VehicleOut, LogCreate, LogOut
+from schemas.schemas import VehicleCreate, VehicleOut, LogCreate, LogOut, Page
 from crud import create_vehicle, create_log, get_vehicle_logs
+from pagination import DEFAULT_LIMIT, MAX_LIMIT
 from uuid import UUID
 
 router = APIRouter(prefix="/vehicles", tags=["Транспортные средства"])
 
+
+# Машина пользователя по id; чужая или несуществующая — 403
+async def get_owned_vehicle(db: AsyncSession, user_id: UUID, vehicle_id: UUID) -> Vehicle:
+    result = await db.execute(select(Vehicle).where(Vehicle.id == vehicle_id, Vehicle.owner_id == user_id))
+    vehicle = result.scalar_one_or_none()
+    if not vehicle:
+        raise HTTPException(status_code=403, detail="У вас нет доступа к этому автомобилю")
+    return vehicle
+
 # Добавление автомобиля
 @router.post("/", response_model=VehicleOut)
 async def add_vehicle(vehicle: VehicleCreate, db: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
@@ -33,12 +44,20 @@ async def get_user_by_id(user_id: UUID, db: AsyncSession = Depends(get_session))
 # Добавление лога для автомобиля
 @router.post("/{vehicle_id}/logs", response_model=LogOut)
 async def add_log(vehicle_id: UUID, log: LogCreate, db: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
-    user_id = current_user.id
-    return await create_log(db, vehicle_id, log, user_id)
+    vehicle = await get_owned_vehicle(db, current_user.id, vehicle_id)
+    return await create_log(db, vehicle.id, log)
 
 
 # Получение логов для автомобиля
-@router.get("/{vehicle_id}/logs", response_model=list[LogOut])
-async def get_logs(vehicle_id: UUID, db: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
-    user_id = current_user.id
-    return await get_vehicle_logs(db, vehicle_id, user_id)
+@router.get("/{vehicle_id}/logs", response_model=Page[LogOut], summary="Логи машины за интервал [since, until) постранично, новые сначала")
+async def get_logs(
+    vehicle_id: UUID,
+    since: datetime | None = Query(None, description="Не раньше этого времени"),
+    until: datetime | None = Query(None, description="Раньше этого времени"),
+    cursor: str | None = Query(None, description="Курсор следующей страницы"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT, description="Размер страницы"),
+    db: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    vehicle = await get_owned_vehicle(db, current_user.id, vehicle_id)
+    return await get_vehicle_logs(db, vehicle.id, since, until, cursor, limit)
@@ -1,9 +1,17 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List
+from typing import Generic, Optional, List, TypeVar
 from models import RoutePointStatusEnum, StatusEnum
 from uuid import UUID
 
+T = TypeVar("T")
+
+
+# ===================== Страница списка (keyset-пагинация) =====================
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
 class UserCreate(BaseModel):
     username: str
     first_name: str
@@ -67,6 +75,18 @@ class LogCreate(BaseModel):
     longitude: Optional[float]
 
 
+# Отметка из пачки: устройство копит их без связи, поэтому время фиксации передаётся с отметкой
+class LogFix(LogCreate):
+    timestamp: Optional[datetime] = None
+
+
+class LogBatchOut(BaseModel):
+    received: int
+    inserted: int
+    queued: int = 0  # поставлено в буфер отложенной записи
+    dropped: int = 0  # повторы предыдущих отметок, не записанные (ingest_filter.py)
+
+
 class LogOut(BaseModel):
     id: UUID
     status: StatusEnum
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Awaitable, Callable, Iterable
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from metrics import STATS_CACHE
+
+# Кэш результатов статистики в памяти процесса.
+# Ключ — имя отчёта и нормализованные параметры; значение живёт до истечения TTL
+# или до коммита, который изменил маршруты одного из дней диапазона.
+# Одинаковые запросы, пришедшие во время расчёта, ждут тот же расчёт (single-flight).
+
+# Диапазон целиком в прошлом меняется только поздними правками — их ловит инвалидация
+PAST_TTL_SECONDS = 6 * 60 * 60
+# Диапазон с сегодняшним днём: TTL страхует от изменений в обход хуков (фоновая сверка, ручные правки)
+LIVE_TTL_SECONDS = 60
+MAX_ENTRIES = 512
+
+# Ключ в Session.info, куда пишущий код складывает изменённые дни до коммита
+CHANGED_DAYS_KEY = "stats_changed_days"
+
+
+@dataclass
+class _Entry:
+    start: date
+    end: date
+    value: Any
+    expires_at: float
+
+
+@dataclass
+class _Pending:
+    start: date
+    end: date
+    task: asyncio.Task
+
+
+class StatsCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._pending: dict[tuple, _Pending] = {}
+
+    @staticmethod
+    def make_key(name: str, start: date, end: date, **params) -> tuple:
+        return (name, start, end, tuple(sorted((k, v) for k, v in params.items() if v is not None)))
+
+    async def get_or_compute(self, name: str, start: date, end: date, compute: Callable[[], Awaitable[Any]], **params):
+        """
+        Результат из кэша или из compute(). compute должен открывать свою сессию:
+        расчёт переживает отмену запроса, который его запустил, и отдаётся всем ожидающим.
+        """
+        key = self.make_key(name, start, end, **params)
+
+        entry = self._entries.get(key)
+        if entry and entry.expires_at > time.monotonic():
+            self._entries.move_to_end(key)
+            STATS_CACHE.inc(report=name, result="hit")
+            return entry.value
+
+        pending = self._pending.get(key)
+        if pending:
+            STATS_CACHE.inc(report=name, result="coalesced")
+        else:
+            STATS_CACHE.inc(report=name, result="miss")
+            pending = _Pending(start, end, None)
+            pending.task = asyncio.create_task(self._compute(key, pending, compute))
+            self._pending[key] = pending
+
+        return await asyncio.shield(pending.task)
+
+    async def _compute(self, key: tuple, pending: _Pending, compute):
+        try:
+            value = await compute()
+        finally:
+            # Если за время расчёта диапазон инвалидировали, запись уже убрана — результат не сохраняем
+            stored = self._pending.get(key) is pending
+            if stored:
+                del self._pending[key]
+        if stored:
+            ttl = PAST_TTL_SECONDS if pending.end < date.today() else LIVE_TTL_SECONDS
+            self._entries[key] = _Entry(pending.start, pending.end, value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, days: Iterable[date]):
+        """Сбрасывает записи и идущие расчёты, чей диапазон содержит хотя бы один из дней."""
+        days = set(days)
+        if not days:
+            return
+
+        def touched(item) -> bool:
+            return any(item.start <= day <= item.end for day in days)
+
+        for key in [k for k, e in self._entries.items() if touched(e)]:
+            del self._entries[key]
+        for key in [k for k, p in self._pending.items() if touched(p)]:
+            del self._pending[key]
+
+    def clear(self):
+        self._entries.clear()
+        self._pending.clear()
+
+
+stats_cache = StatsCache()
+
+
+def mark_days_changed(db, days: Iterable[date]):
+    """Запоминает дни, маршруты которых изменены в транзакции; кэш сбросится после коммита."""
+    db.info.setdefault(CHANGED_DAYS_KEY, set()).update(days)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    days = session.info.pop(CHANGED_DAYS_KEY, None)
+    if days:
+        stats_cache.invalidate(days)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop(CHANGED_DAYS_KEY, None)
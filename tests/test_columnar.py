@@ -0,0 +1,73 @@
+import io
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+import numpy as np
+from columnar import COORD_SCALE, LogColumnsWriter, logs_frame
+
+# Колоночная выгрузка: запись порциями и чтение logs_frame возвращают исходные строки,
+# строки без координат — с NaN, разности продолжаются через границу порций
+
+STATUSES = ["idle", "in_transit", "delivered"]
+START = datetime(2026, 10, 1, 9, 0, tzinfo=timezone.utc)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def micros(moment: datetime) -> int:
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def group(vehicle_id, rows: list[tuple]) -> tuple:
+    """Группа «машина за день» в виде, в котором её отдаёт запрос выгрузки; rows — (секунды, широта, долгота, статус)."""
+    located = [lat is not None and lon is not None for _, lat, lon, _ in rows]
+    return (
+        vehicle_id,
+        [micros(START + timedelta(seconds=seconds)) for seconds, _, _, _ in rows],
+        [round(lat * COORD_SCALE) if lat is not None else 0 for _, lat, _, _ in rows],
+        [round(lon * COORD_SCALE) if lon is not None else 0 for _, _, lon, _ in rows],
+        located,
+        [status for *_, status in rows],
+    )
+
+
+def test_round_trip_with_missing_positions():
+    first, second = uuid4(), uuid4()
+    # Без координат — первая строка выгрузки, строка в середине и первая строка второй порции
+    chunks = [
+        [
+            group(first, [(0, None, None, "idle"), (10, 53.3481234, 83.7761234, "in_transit"),
+                          (20, None, None, "in_transit"), (30, 53.3491234, 83.7771234, "delivered")]),
+            group(first, [(86400, 53.35, 83.78, "unknown")]),
+        ],
+        [
+            group(second, [(5, None, None, None), (15, 53.2, 83.6, "idle"), (25, 53.2000001, 83.6000001, "idle")]),
+            group(first, [(90000, 53.36, 83.79, "idle")]),
+        ],
+    ]
+    writer = LogColumnsWriter(STATUSES)
+    for chunk in chunks:
+        writer.add(chunk)
+    writer.add([])
+    file = io.BytesIO()
+    writer.write(file)
+    file.seek(0)
+
+    frame = logs_frame(np.load(file))
+
+    expected = [
+        (str(vehicle_id), EPOCH + timedelta(microseconds=t), lat / COORD_SCALE, lon / COORD_SCALE, ok, status)
+        for chunk in chunks
+        for vehicle_id, *columns in chunk
+        for t, lat, lon, ok, status in zip(*columns)
+    ]
+    assert len(frame) == len(expected)
+    assert frame["vehicle_id"].astype(str).tolist() == [row[0] for row in expected]
+    assert frame["timestamp"].tolist() == [row[1] for row in expected]
+    located = np.array([row[4] for row in expected])
+    assert frame["latitude"].isna().to_numpy().tolist() == (~located).tolist()
+    assert frame["longitude"].isna().to_numpy().tolist() == (~located).tolist()
+    assert np.allclose(frame["latitude"][located], [row[2] for row in expected if row[4]], rtol=0, atol=1e-9)
+    assert np.allclose(frame["longitude"][located], [row[3] for row in expected if row[4]], rtol=0, atol=1e-9)
+    # Статус вне списка и отсутствующий статус — пропуск
+    assert [None if isinstance(s, float) else s for s in frame["status"].tolist()] == [
+        row[5] if row[5] in STATUSES else None for row in expected
+    ]
@@ -0,0 +1,186 @@
+from datetime import date, datetime, time, timedelta, timezone
+from uuid import uuid4
+import pytest
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models import RoutePlan, RoutePoint, RoutePointStatusEnum, RoutePointStatusLog, User, Vehicle
+
+# /statistics/full против прежней реализации: запросы по журналу статусов с окном row_number(),
+# без дневных агрегатов. Ответ обязан совпадать с ней во всех режимах выполнения.
+
+TODAY = date.today()
+START = TODAY - timedelta(days=5)
+
+
+def at(day: date, hour: int = 12) -> datetime:
+    return datetime.combine(day, time(hour), tzinfo=timezone.utc)
+
+
+async def baseline_statistics(start_date: date, end_date: date) -> dict:
+    """Разделы ответа, смысл которых не менялся, — запросами прежней реализации."""
+    from database.database_app import async_engine
+
+    latest_status_subq = (
+        select(
+            RoutePointStatusLog.point_id,
+            RoutePointStatusLog.status,
+            func.row_number().over(
+                partition_by=RoutePointStatusLog.point_id,
+                order_by=RoutePointStatusLog.timestamp.desc()
+            ).label("rn")
+        )
+        .join(RoutePoint)
+        .join(RoutePlan)
+        .where(RoutePlan.date >= start_date, RoutePlan.date <= end_date)
+    ).subquery()
+    in_period = ((RoutePlan.date >= start_date) & (RoutePlan.date <= end_date)) | (RoutePlan.id == None)
+    latest_only = (latest_status_subq.c.rn == 1) | (latest_status_subq.c.rn == None)
+    completed = func.sum(case((latest_status_subq.c.status == RoutePointStatusEnum.completed, 1), else_=0))
+
+    async with AsyncSession(async_engine) as db:
+        points_stats = dict((await db.execute(
+            select(latest_status_subq.c.status, func.count(latest_status_subq.c.point_id))
+            .where(latest_status_subq.c.rn == 1)
+            .group_by(latest_status_subq.c.status)
+        )).all())
+        avg_duration = (await db.execute(
+            select(func.avg(RoutePoint.duration_minutes))
+            .join(RoutePoint.route_plan)
+            .where(RoutePlan.date >= start_date, RoutePlan.date <= end_date)
+            .where(RoutePoint.duration_minutes.isnot(None))
+        )).scalar() or 0
+        longest_service = (await db.execute(
+            select(func.max(RoutePoint.duration_minutes))
+            .join(RoutePoint.route_plan)
+            .where(RoutePlan.date >= start_date, RoutePlan.date <= end_date)
+        )).scalar()
+        drivers = (await db.execute(
+            select(User.id, func.count(RoutePoint.id), completed, func.avg(RoutePoint.duration_minutes))
+            .outerjoin(Vehicle, Vehicle.owner_id == User.id)
+            .outerjoin(RoutePlan, RoutePlan.vehicle_id == Vehicle.id)
+            .outerjoin(RoutePoint, RoutePoint.route_plan_id == RoutePlan.id)
+            .outerjoin(latest_status_subq, latest_status_subq.c.point_id == RoutePoint.id)
+            .where(in_period)
+            .where(latest_only)
+            .group_by(User.id)
+        )).all()
+        vehicles = (await db.execute(
+            select(Vehicle.id, func.count(RoutePoint.id), completed, func.avg(RoutePoint.duration_minutes))
+            .outerjoin(RoutePlan, RoutePlan.vehicle_id == Vehicle.id)
+            .outerjoin(RoutePoint, RoutePoint.route_plan_id == RoutePlan.id)
+            .outerjoin(latest_status_subq, latest_status_subq.c.point_id == RoutePoint.id)
+            .where(in_period)
+            .where(latest_only)
+            .group_by(Vehicle.id)
+        )).all()
+        summary = (await db.execute(
+            select(func.count(RoutePoint.id), completed, func.sum(RoutePoint.payment))
+            .join(RoutePoint.route_plan)
+            .join(latest_status_subq, latest_status_subq.c.point_id == RoutePoint.id)
+            .where(RoutePlan.date >= start_date, RoutePlan.date <= end_date)
+            .where(latest_status_subq.c.rn == 1)
+        )).one()
+
+    def stats_rows(rows):
+        return {str(key): (total, completed or 0, float(avg or 0)) for key, total, completed, avg in rows}
+
+    return {
+        "points_summary": (sum(points_stats.values()), {status.value: count for status, count in points_stats.items()}),
+        "avg_duration_minutes": float(avg_duration),
+        "longest_service_minutes": longest_service,
+        "drivers": stats_rows(drivers),
+        "vehicles": stats_rows(vehicles),
+        "total_summary": (summary[0], summary[1] or 0, float(summary[2] or 0)),
+    }
+
+
+def sections(response: dict) -> dict:
+    # id сравниваются строками: в режиме single разделы приходят из json
+    def stats_rows(rows, key):
+        return {str(r[key]): (r["total_points"], r["completed_points"], float(r["avg_duration_minutes"])) for r in rows}
+
+    points = response["points_summary"]
+    summary = response["total_summary"]
+    return {
+        "points_summary": (points["total_points"], {status.value: count for status, count in points["status_counts"].items()}),
+        "avg_duration_minutes": float(response["avg_duration_minutes"]),
+        "longest_service_minutes": response["longest_service"]["duration_minutes"] if response["longest_service"] else None,
+        "drivers": stats_rows(response["drivers_stats"], "driver_id"),
+        "vehicles": stats_rows(response["vehicles_stats"], "vehicle_id"),
+        "total_summary": (summary["total_points"], summary["completed_points"], float(summary["total_payment"])),
+    }
+
+
+def add_user(session, name: str, vehicles: int = 0) -> list:
+    user = User(id=uuid4(), username=name, hashed_password="x", first_name=name, last_name="Тестов")
+    session.add(user)
+    owned = [Vehicle(id=uuid4(), plate_number=f"{name}{i}", owner=user) for i in range(vehicles)]
+    session.add_all(owned)
+    return [user, *owned]
+
+
+def add_route(session, vehicle, day: date, points: list[tuple]) -> RoutePlan:
+    """points — (оплата, минуты на точке, [статусы по порядку])."""
+    route = RoutePlan(id=uuid4(), vehicle=vehicle, date=at(day))
+    session.add(route)
+    for order, (payment, duration, statuses) in enumerate(points):
+        point = RoutePoint(id=uuid4(), route_plan=route, order=order, payment=payment, duration_minutes=duration)
+        session.add(point)
+        for minute, status in enumerate(statuses):
+            session.add(RoutePointStatusLog(id=uuid4(), point=point, status=status, timestamp=at(day) + timedelta(minutes=minute)))
+    return route
+
+
+@pytest.fixture
+def routes(db):
+    S = RoutePointStatusEnum
+    with Session(db) as session:
+        _, active = add_user(session, "active", vehicles=1)
+        add_route(session, active, TODAY - timedelta(days=3), [
+            (100, 30, [S.en_route, S.arrived, S.completed]),
+            (50, None, [S.en_route]),
+            (70, 10, []),
+        ])
+        add_route(session, active, TODAY - timedelta(days=1), [])
+        add_route(session, active, TODAY, [(20, 45, [S.en_route, S.arrived])])
+        add_user(session, "no_vehicle")
+        _, outside = add_user(session, "outside", vehicles=1)
+        add_route(session, outside, TODAY - timedelta(days=30), [(500, 20, [S.completed])])
+        add_user(session, "idle", vehicles=1)
+        _, mixed_routed, _ = add_user(session, "mixed", vehicles=2)
+        add_route(session, mixed_routed, TODAY - timedelta(days=40), [(5, 5, [S.skipped])])
+        # Маршрут без машины: в агрегаты по машинам не попадает, но в сводку входит
+        add_route(session, None, TODAY - timedelta(days=2), [
+            (10, 60, [S.planned, S.skipped]),
+            (15, None, [S.planned]),
+        ])
+        session.commit()
+
+    from database.daily_stats import backfill_daily_stats
+    from database.status_tracking import repair_status_fields
+
+    repair_status_fields(full=True)
+    backfill_daily_stats(TODAY - timedelta(days=60), TODAY)
+
+
+@pytest.mark.parametrize("mode", ["sequential", "concurrent", "single"])
+def test_full_statistics_matches_baseline(routes, run_async, monkeypatch, mode):
+    from database import daily_stats
+    from database.database_app import async_engine
+    from routers.stats import StatsMode, collect_full_statistics
+
+    # Прошедшие дни — из агрегатов, сегодняшний — из сырых строк
+    monkeypatch.setattr(daily_stats, "_aggregates_ready", True)
+
+    async def collect():
+        async with AsyncSession(async_engine) as db:
+            return await collect_full_statistics(db, START, TODAY, StatsMode(mode))
+
+    response = run_async(collect)
+    # Прежние запросы сравнивали дату маршрута (timestamptz) с полуночью end_date — маршрут в сам день
+    # end_date они не видели; конец периода для них сдвинут на день, маршрутов в нём нет
+    expected = run_async(baseline_statistics, START, TODAY + timedelta(days=1))
+
+    assert sections(response) == expected
+    assert {r["name"] for r in response["drivers_stats"]} == {"active Тестов", "no_vehicle Тестов", "idle Тестов", "mixed Тестов"}
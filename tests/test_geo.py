@@ -0,0 +1,120 @@
+import numpy as np
+from geo import EARTH_RADIUS_M, MAX_GAP_SECONDS, METERS_PER_DEGREE, simplify_track, to_meters, track_mileage
+
+# Упрощение трека: выброшенные точки не дальше допуска от оставленной ломаной,
+# концы трека и смены статуса остаются всегда.
+# Пробег: прыжки GPS отбрасываются, разрыв связи не идёт ни в движение, ни в стоянку
+
+LAT, LON = 53.348, 83.776
+
+
+def random_track(n: int, seed: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    """Блуждание по городу шагами до ~30 м."""
+    steps = np.random.default_rng(seed).normal(scale=20 / METERS_PER_DEGREE, size=(2, n))
+    return LAT + np.cumsum(steps[0]), LON + np.cumsum(steps[1])
+
+
+def max_deviation(lat: np.ndarray, lon: np.ndarray, kept: np.ndarray) -> float:
+    """Наибольшее расстояние выброшенной точки до прямой через оставленные соседние вершины, м."""
+    x, y = to_meters(lat, lon)
+    worst = 0.0
+    for i, j in zip(kept[:-1], kept[1:]):
+        dx, dy = x[j] - x[i], y[j] - y[i]
+        px, py = x[i + 1:j] - x[i], y[i + 1:j] - y[i]
+        norm = np.hypot(dx, dy)
+        distance = np.abs(dy * px - dx * py) / norm if norm > 0 else np.hypot(px, py)
+        worst = max(worst, float(distance.max(initial=0)))
+    return worst
+
+
+def test_dropped_points_stay_within_tolerance():
+    lat, lon = random_track(2000)
+    status = np.zeros(len(lat), dtype=int)
+    for tolerance in (5, 25, 100):
+        kept = simplify_track(lat, lon, status, tolerance_m=tolerance)
+        assert kept[0] == 0 and kept[-1] == len(lat) - 1
+        assert np.all(np.diff(kept) > 0)
+        assert max_deviation(lat, lon, kept) <= tolerance
+    # Больший допуск — меньше точек
+    counts = [len(simplify_track(lat, lon, status, tolerance_m=t)) for t in (5, 25, 100)]
+    assert counts[0] > counts[1] > counts[2]
+
+
+def test_straight_line_keeps_only_ends():
+    lat = LAT + np.linspace(0, 0.01, 50)
+    lon = np.full(50, LON)
+    assert simplify_track(lat, lon, np.zeros(50, dtype=int), tolerance_m=1).tolist() == [0, 49]
+
+
+def test_status_changes_and_ends_survive_point_limit():
+    lat, lon = random_track(1000, seed=2)
+    status = np.repeat(np.arange(5), 200)
+    changes = [0, 200, 400, 600, 800, 999]
+
+    for kept in (simplify_track(lat, lon, status, tolerance_m=50),
+                 simplify_track(lat, lon, status, max_points=20),
+                 simplify_track(lat, lon, status, tolerance_m=5, max_points=3)):
+        assert set(changes) <= set(kept.tolist())
+    assert len(simplify_track(lat, lon, status, max_points=20)) == 20
+    # Обязательных вершин больше лимита — остаются только они
+    assert simplify_track(lat, lon, status, tolerance_m=5, max_points=3).tolist() == changes
+
+
+def test_short_tracks_are_returned_whole():
+    for n in (0, 1, 2):
+        lat, lon = random_track(n) if n else (np.array([]), np.array([]))
+        assert simplify_track(lat, lon, np.zeros(n, dtype=int), tolerance_m=10).tolist() == list(range(n))
+
+
+# Метров в градусе широты по сфере гаверсинуса
+METERS_PER_LAT = EARTH_RADIUS_M * np.pi / 180
+
+
+def drive(seconds: list[float], north_m: list[float]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Отметки на меридиане: время в секундах и смещение на север в метрах."""
+    return np.array(seconds, dtype=float), LAT + np.array(north_m) / METERS_PER_LAT, np.full(len(seconds), LON)
+
+
+def test_mileage_of_steady_drive():
+    # 36 км/ч: 100 м за 10 с, затем минута стоянки с дрожанием в 1 м
+    seconds, lat, lon = drive([*range(0, 100, 10), 150, 210], [*range(0, 1000, 100), 901, 900])
+    mileage = track_mileage(seconds, lat, lon)
+
+    assert abs(mileage["distance_km"] - 0.9) < 1e-6
+    assert mileage["moving_seconds"] == 90 and mileage["idle_seconds"] == 120
+    assert abs(mileage["max_speed_kmh"] - 36) < 1e-6
+    assert mileage["rejected_count"] == 0 and mileage["fixes_count"] == 12
+
+
+def test_gps_jumps_are_rejected():
+    seconds, lat, lon = drive(range(0, 100, 10), range(0, 1000, 100))
+    clean = track_mileage(seconds, lat, lon)
+    # Прыжок на 5 км в середине трека, два прыжка в разные стороны подряд и прыжок последней отметки
+    lat[2] += 5000 / METERS_PER_LAT
+    lat[5] += 4000 / METERS_PER_LAT
+    lat[6] -= 4000 / METERS_PER_LAT
+    lat[-1] += 3000 / METERS_PER_LAT
+    jumped = track_mileage(seconds, lat, lon)
+
+    assert jumped["rejected_count"] == 4 and jumped["fixes_count"] == 6
+    assert abs(jumped["distance_km"] - 0.8) < 1e-6 and jumped["distance_km"] < clean["distance_km"]
+    assert abs(jumped["max_speed_kmh"] - 36) < 1e-6
+
+
+def test_gap_counts_distance_but_not_time():
+    # Связь пропала на полчаса, машина появилась в 5 км — 10 км/ч, не выброс
+    gap = 30 * 60
+    seconds, lat, lon = drive([0, 10, 20, 20 + gap, 30 + gap], [0, 100, 200, 5200, 5300])
+    mileage = track_mileage(seconds, lat, lon)
+
+    assert gap > MAX_GAP_SECONDS
+    assert mileage["rejected_count"] == 0
+    assert abs(mileage["distance_km"] - 5.3) < 1e-6
+    assert mileage["moving_seconds"] == 30 and mileage["idle_seconds"] == 0
+    assert abs(mileage["max_speed_kmh"] - 36) < 1e-6
+
+
+def test_mileage_of_too_few_fixes():
+    for n in (0, 1):
+        mileage = track_mileage(*drive(range(n), range(n)))
+        assert mileage["distance_km"] == 0.0 and mileage["max_speed_kmh"] is None and mileage["fixes_count"] == n
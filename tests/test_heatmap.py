@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models import LogEntry, User, Vehicle
+
+# Время стоянки на тепловой карте: до следующей отметки машины, где бы она ни была
+
+START = datetime(2026, 10, 1, 8, 0, tzinfo=timezone.utc)
+BBOX = (53.30, 83.70, 53.40, 83.80)
+INSIDE, OUTSIDE = (53.35, 83.75), (53.50, 83.75)
+
+
+def test_dwell_ends_at_next_fix_outside_the_area(db, run_async):
+    from database.database_app import async_engine
+    from routers.stats import HeatmapSource, collect_heatmap
+
+    with Session(db) as session:
+        user = User(id=uuid4(), username="heat", hashed_password="x", first_name="heat", last_name="Тестов")
+        vehicle = Vehicle(id=uuid4(), plate_number="heat", owner=user)
+        session.add_all([user, vehicle])
+        # В области, через минуту вне её, через 5 минут снова в области, через 2 минуты — без координат
+        for minute, (lat, lon) in ((0, INSIDE), (1, OUTSIDE), (5, INSIDE), (7, (None, None))):
+            session.add(LogEntry(id=uuid4(), vehicle=vehicle, status="in_transit", latitude=lat, longitude=lon,
+                                 timestamp=START + timedelta(minutes=minute)))
+        session.commit()
+
+    async def collect():
+        async with AsyncSession(async_engine) as db:
+            return await collect_heatmap(db, START, START + timedelta(hours=1), BBOX, 500, HeatmapSource.gps)
+
+    cells = run_async(collect)["cells"]
+
+    assert sum(cells["samples"]) == 2
+    assert sum(cells["dwell_minutes"]) == 3.0
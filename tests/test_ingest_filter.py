@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from fleet import fleet_positions
+from ingest_filter import thin_fixes
+
+# Входной фильтр на пачках одной машины: последняя записанная отметка — в памяти fleet_positions
+
+NOW = datetime(2026, 10, 1, 9, 0, tzinfo=timezone.utc)
+LAT, LON = 53.348, 83.776
+
+
+def fix(vehicle_id, seconds: int, status: str = "on_route", latitude: float | None = LAT, longitude: float | None = LON):
+    return {
+        "id": uuid4(), "vehicle_id": vehicle_id, "status": status, "latitude": latitude, "longitude": longitude,
+        "timestamp": NOW + timedelta(seconds=seconds), "createDateTime": NOW, "changeDateTime": NOW,
+    }
+
+
+def test_repeats_of_stored_fix_are_dropped():
+    vehicle_id = uuid4()
+    fleet_positions.remember_log(fix(vehicle_id, 0))
+    rows = [fix(vehicle_id, 5), fix(vehicle_id, 10, status="arrived"), fix(vehicle_id, 15, status="arrived")]
+    assert thin_fixes(rows) == [rows[1]]
+
+
+def test_backlog_and_live_fixes_are_thinned_separately():
+    vehicle_id = uuid4()
+    stored = fix(vehicle_id, 0)
+    fleet_positions.remember_log(stored)
+    backlog = [fix(vehicle_id, -300), fix(vehicle_id, -290), fix(vehicle_id, -280, latitude=LAT + 0.01),
+               fix(vehicle_id, -30, latitude=LAT + 0.01)]
+    live = [fix(vehicle_id, 5), fix(vehicle_id, 20, latitude=LAT + 0.01), fix(vehicle_id, 25, latitude=LAT + 0.01)]
+    kept = thin_fixes([live[1], backlog[1], live[0], backlog[0], backlog[3], live[2], backlog[2]])
+
+    # Пачка сравнивается сама с собой: повтор первой отметки пачки отброшен, сдвиг и отметка через 4 минуты — нет.
+    # Живые отметки сравниваются с записанной, а не с последней из пачки: повтор записанной отброшен,
+    # сдвиг оставлен, его повтор отброшен.
+    assert kept == [live[1], backlog[0], backlog[3], backlog[2]]
+    assert fleet_positions.last_log(vehicle_id)["id"] == stored["id"]
+
+
+def test_backlog_without_stored_fix_is_compared_in_order():
+    vehicle_id = uuid4()
+    rows = [fix(vehicle_id, 0), fix(vehicle_id, 10), fix(vehicle_id, 20, latitude=None, longitude=None)]
+    assert thin_fixes(rows) == [rows[0], rows[2]]
+
+
+def test_repeats_of_queued_fix_are_dropped(monkeypatch):
+    import crud
+    from database.write_buffer import WriteBuffer
+    from models import LogEntry
+    from schemas.schemas import LogFix
+
+    # До сброса пачки fleet_positions не знает о поставленных в очередь отметках — повтор сравнивается с ними
+    buffer = WriteBuffer(LogEntry, flush_interval=3600, tail_key="vehicle_id", tail_order="timestamp")
+    monkeypatch.setattr(crud, "log_buffer", buffer)
+    vehicle_id = uuid4()
+
+    async def queue():
+        first = await crud.queue_logs(vehicle_id, [LogFix(status="in_transit", latitude=LAT, longitude=LON, timestamp=NOW)])
+        repeats = await crud.queue_logs(vehicle_id, [
+            LogFix(status="in_transit", latitude=LAT, longitude=LON, timestamp=NOW + timedelta(seconds=1)),
+        ])
+        merged = await crud.queue_log(vehicle_id, LogFix(status="in_transit", latitude=LAT, longitude=LON,
+                                                          timestamp=NOW + timedelta(seconds=2)))
+        pending = buffer._queue.qsize()
+        buffer._task.cancel()
+        return first, repeats, merged, pending
+
+    first, repeats, merged, pending = asyncio.run(queue())
+
+    assert repeats == [] and merged["id"] == first[0]["id"]
+    assert pending == 1
+    assert fleet_positions.last_log(vehicle_id) is None
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models import Address
+
+# Keyset-пагинация по (createDateTime, id): правка записи во время листания не переносит её
+# между страницами, записи с одинаковым createDateTime различает id
+
+CREATED = datetime(2026, 10, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def test_pages_are_stable_under_edits_and_equal_timestamps(db, run_async):
+    from database.database_app import async_engine
+    from pagination import paginate
+
+    # Семь адресов, три из них созданы в одно и то же время
+    created = [CREATED, CREATED, CREATED, CREATED - timedelta(minutes=1), CREATED - timedelta(minutes=2),
+               CREATED - timedelta(minutes=2), CREATED - timedelta(minutes=3)]
+    with Session(db) as session:
+        addresses = [Address(id=uuid4(), address_1c=f"адрес {i}", createDateTime=at) for i, at in enumerate(created)]
+        session.add_all(addresses)
+        session.commit()
+        expected = [a.id for a in sorted(addresses, key=lambda a: (a.createDateTime, a.id), reverse=True)]
+
+    async def walk():
+        seen, cursor = [], None
+        async with AsyncSession(async_engine) as session:
+            while True:
+                page = await paginate(session, select(Address), (Address.createDateTime, Address.id), cursor, 2)
+                seen += [a.id for a in page["items"]]
+                if not page["next_cursor"]:
+                    return seen
+                cursor = page["next_cursor"]
+                # Между страницами: правка уже выданной и ещё не выданной записи, новая запись
+                await session.execute(
+                    update(Address).where(Address.id.in_([seen[0], expected[-1]])).values(city="Барнаул")
+                )
+                session.add(Address(id=uuid4(), address_1c="новый", createDateTime=CREATED + timedelta(hours=1)))
+                await session.commit()
+
+    assert run_async(walk) == expected
@@ -0,0 +1,55 @@
+from itertools import permutations
+import numpy as np
+import pytest
+from route_optimizer import EXACT_MAX_POINTS, distance_matrix, optimize_route
+
+# Порядок объезда сверяется с полным перебором на небольших маршрутах вокруг города
+
+CITY_CENTER = (53.348, 83.776)
+
+
+def random_points(rng, count: int):
+    lat = CITY_CENTER[0] + rng.uniform(-0.1, 0.1, count)
+    lon = CITY_CENTER[1] + rng.uniform(-0.15, 0.15, count)
+    return lat, lon
+
+
+def brute_force(lat, lon, start, end) -> float:
+    """Длина кратчайшего пути через все точки; свободный конец ничего не стоит."""
+    anchors_lat = [a[0] for a in (start, end) if a]
+    anchors_lon = [a[1] for a in (start, end) if a]
+    dist = distance_matrix(np.r_[lat, anchors_lat], np.r_[lon, anchors_lon])
+    count = len(lat)
+    start_node = count if start else None
+    end_node = count + (1 if start else 0) if end else None
+    best = np.inf
+    for order in permutations(range(count)):
+        path = [node for node in (start_node, *order, end_node) if node is not None]
+        best = min(best, dist[path[:-1], path[1:]].sum())
+    return best
+
+
+@pytest.mark.parametrize("fixed", ["none", "start", "both"])
+def test_small_routes_are_optimal(fixed):
+    rng = np.random.default_rng(50)
+    for _ in range(25):
+        count = int(rng.integers(1, EXACT_MAX_POINTS + 1))
+        lat, lon = random_points(rng, count)
+        start = (CITY_CENTER[0] + rng.uniform(-0.1, 0.1), CITY_CENTER[1]) if fixed != "none" else None
+        end = (CITY_CENTER[0], CITY_CENTER[1] + rng.uniform(-0.15, 0.15)) if fixed == "both" else None
+
+        order, before, after = optimize_route(lat, lon, start, end)
+
+        assert sorted(order) == list(range(count))
+        assert after <= before
+        assert after == pytest.approx(brute_force(lat, lon, start, end), abs=0.01)
+
+
+def test_large_route_keeps_every_point_and_does_not_get_longer():
+    rng = np.random.default_rng(60)
+    lat, lon = random_points(rng, 60)
+
+    order, before, after = optimize_route(lat, lon, start=CITY_CENTER)
+
+    assert sorted(order) == list(range(60))
+    assert after <= before
@@ -0,0 +1,95 @@
+import asyncio
+from datetime import date, timedelta
+from sqlalchemy.orm import Session
+from stats_cache import StatsCache, mark_days_changed, stats_cache
+
+# Кэш статистики: одинаковые запросы ждут один расчёт, изменение дня сбрасывает его диапазоны
+
+START = date.today() - timedelta(days=10)
+END = date.today() - timedelta(days=3)
+
+
+def counting_compute(calls: list, release: asyncio.Event | None = None):
+    async def compute():
+        calls.append(len(calls))
+        if release is not None:
+            await release.wait()
+        return len(calls)
+    return compute
+
+
+def test_concurrent_requests_share_one_computation():
+    cache = StatsCache()
+    calls = []
+
+    async def run():
+        release = asyncio.Event()
+        compute = counting_compute(calls, release)
+        waiting = [asyncio.create_task(cache.get_or_compute("report", START, END, compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiting)
+        # Готовый результат отдаётся из кэша без расчёта; другие параметры — свой расчёт
+        cached = await cache.get_or_compute("report", START, END, compute)
+        other = await cache.get_or_compute("report", START, END, compute, group_by="store")
+        return results, cached, other
+
+    results, cached, other = asyncio.run(run())
+
+    assert results == [1] * 5 and cached == 1
+    assert other == 2 and len(calls) == 2
+
+
+def test_changed_day_invalidates_only_ranges_containing_it():
+    cache = StatsCache()
+    calls = []
+
+    async def run():
+        compute = counting_compute(calls)
+        await cache.get_or_compute("report", START, END, compute)
+        await cache.get_or_compute("report", END + timedelta(days=1), END + timedelta(days=2), compute)
+        cache.invalidate([END])
+        again = await cache.get_or_compute("report", START, END, compute)
+        untouched = await cache.get_or_compute("report", END + timedelta(days=1), END + timedelta(days=2), compute)
+        return again, untouched
+
+    assert asyncio.run(run()) == (3, 2)
+
+
+def test_invalidation_during_computation_is_not_overwritten():
+    cache = StatsCache()
+    calls = []
+
+    async def run():
+        release = asyncio.Event()
+        running = asyncio.create_task(cache.get_or_compute("report", START, END, counting_compute(calls, release)))
+        await asyncio.sleep(0)
+        # Расчёт начался до изменения — его результат отдаётся ждущим, но в кэш не попадает
+        cache.invalidate([START])
+        release.set()
+        stale = await running
+        fresh = await cache.get_or_compute("report", START, END, counting_compute(calls))
+        return stale, fresh
+
+    assert asyncio.run(run()) == (1, 2)
+
+
+def test_commit_invalidates_marked_days_and_rollback_forgets_them():
+    calls = []
+    stats_cache.clear()
+
+    async def cached():
+        return await stats_cache.get_or_compute("report", START, END, counting_compute(calls))
+
+    asyncio.run(cached())
+    with Session() as session:
+        mark_days_changed(session, [START])
+        session.rollback()
+    asyncio.run(cached())
+    with Session() as session:
+        mark_days_changed(session, [START])
+        session.commit()
+    asyncio.run(cached())
+    stats_cache.clear()
+
+    assert len(calls) == 2